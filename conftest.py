@@ -0,0 +1,113 @@
+"""
+    System diagnostics: test fixtures
+    Copyright (C) 2019 Francesco Melchiori
+    <https://www.francescomelchiori.com/>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see
+    <http://www.gnu.org/licenses/>.
+"""
+
+
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_manager
+import data_server
+
+
+host_measurements = [
+    {'measurement_name': 'cpu',
+     'units': ['usage_user', 'usage_system'],
+     'filters': [{'filter_name': 'cpu',
+                  'filter_values': ['cpu0', 'cpu1']}]},
+    {'measurement_name': 'mem',
+     'units': ['used', 'free']}]
+
+
+def get_diagnostics_map(data_source_ip_port, measurements=None):
+    host_map = {'host_name': 'host01',
+                'measurements': measurements if measurements
+                else host_measurements}
+    database_map = {'database_name': 'telegraf',
+                    'hosts': [host_map]}
+    data_source_map = {'data_source_name': 'influx',
+                       'data_source_ip_port': data_source_ip_port,
+                       'databases': [database_map]}
+    network_map = {'network_name': 'lan',
+                   'data_sources': [data_source_map]}
+    return {'customers': [{'customer_name': 'acme',
+                           'networks': [network_map]}]}
+
+
+@pytest.fixture(scope='session')
+def influx_server():
+    with data_server.InfluxServer('127.0.0.1:0', sampling_period='30s',
+                                  missing_ratio=0.1) as influx_server:
+        yield influx_server
+
+
+@pytest.fixture
+def get_json_path(tmp_path, influx_server):
+    def get_json_path(measurements=None, json_name='diagnostics_map.json'):
+        json_path = tmp_path / json_name
+        json_path.write_text(json.dumps(get_diagnostics_map(
+            influx_server.server_ip_port, measurements)))
+        return str(json_path)
+    return get_json_path
+
+
+@pytest.fixture
+def get_host_diagnostics(tmp_path, get_json_path):
+    def get_host_diagnostics(time_from='2019-01-29 08:00:00',
+                             time_to='2019-01-29 10:00:00',
+                             cache_name='measurement_cache',
+                             measurements=None,
+                             **diagnostics_options):
+        json_path = get_json_path(measurements,
+                                  '{0}.json'.format(cache_name))
+        return data_manager.CustomerHostDiagnostics(
+            'acme', 'lan', 'influx', 'telegraf', 'host01', time_from,
+            time_to, json_path=json_path,
+            cache_path=str(tmp_path / cache_name), **diagnostics_options)
+    return get_host_diagnostics
+
+
+@pytest.fixture
+def get_test_dataframe():
+    def get_test_dataframe(sampling_period='10s', point_amount=2000,
+                           series_amount=3, timestamp_jitter=False,
+                           missing_ratio=0., random_seed=0):
+        random_state = np.random.RandomState(random_seed)
+        pd_sampling_period = pd.to_timedelta(sampling_period)
+        pd_utc_index = pd.date_range('2019-01-29 08:00:00',
+                                     periods=point_amount,
+                                     freq=pd_sampling_period, tz='UTC')
+        if timestamp_jitter:
+            pd_utc_index += pd_sampling_period * random_state.uniform(
+                0.1, 0.9, point_amount)
+        pd_dataframe = pd.DataFrame(
+            np.cumsum(random_state.normal(0, 1,
+                                          (point_amount, series_amount)),
+                      axis=0),
+            index=pd_utc_index,
+            columns=['series_{0}'.format(series_number)
+                     for series_number in range(series_amount)])
+        if missing_ratio:
+            pd_dataframe = pd_dataframe.mask(random_state.uniform(
+                size=pd_dataframe.shape) < missing_ratio)
+        return pd_dataframe
+    return get_test_dataframe
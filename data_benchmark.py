@@ -0,0 +1,429 @@
+#!/usr/bin/python3
+
+"""
+    System diagnostics: data benchmark
+    Copyright (C) 2019 Francesco Melchiori
+    <https://www.francescomelchiori.com/>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see
+    <http://www.gnu.org/licenses/>.
+"""
+
+
+import sys
+import os
+import argparse
+import itertools
+import json
+import platform
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import data_manager
+import data_sampler
+import data_labeler
+import signal_processor
+
+
+preprocessing_stage_names = ['pad_pd_dataframes',
+                             'resample_pd_dataframes',
+                             'fill_pd_dataframes',
+                             'standardize_pd_dataframes',
+                             'join_pd_dataframes',
+                             'sample_dataevents',
+                             'filter_low_pass_dataevents',
+                             'transpose_dataevents',
+                             'cluster_pd_series']
+fused_preprocessing_stage_names = ['align_pd_dataframes',
+                                   'sample_dataevent_tensor',
+                                   'filter_low_pass_dataevent_tensor',
+                                   'transpose_dataevent_tensor',
+                                   'cluster_pd_series']
+
+
+def get_influx_test_data(row_amount, timestamp_start='2019-01-29 08:00:00',
+                         sampling_period='1s', epoch=None, random_seed=0):
+    pd_utc_index = pd.date_range(timestamp_start, periods=row_amount,
+                                 freq=sampling_period, tz='UTC')
+    np_values = np.random.RandomState(random_seed).normal(0, 1, row_amount)
+    if epoch == 'ms':
+        influx_timestamps = (pd_utc_index.asi8 // 1000000).tolist()
+    else:
+        influx_timestamps = pd_utc_index.strftime(
+            '%Y-%m-%dT%H:%M:%SZ').tolist()
+    influx_data = [[influx_timestamp, influx_value]
+                   for influx_timestamp, influx_value
+                   in zip(influx_timestamps, np_values.tolist())]
+    return influx_data
+
+
+def convert_influx_rows(influx_data):
+    source_np_data = np.array(influx_data)
+    source_pd_date = pd.to_datetime(source_np_data[:, 0], utc=True)
+    source_np_values = source_np_data[:, 1:]
+    source_pd_data = pd.DataFrame(source_np_values, dtype='float64',
+                                  columns=['influx_test'],
+                                  index=source_pd_date)
+    return source_pd_data
+
+
+def convert_influx_columns(influx_data):
+    np_timestamps, np_values = data_manager.get_influx_columns(influx_data)
+    source_pd_data = data_manager.get_measurement_pd_dataframe(
+        np_timestamps, np_values, 'influx', 'test', [])
+    return source_pd_data
+
+
+def time_function(function, *args, repeat_amount=3):
+    function_seconds = []
+    for _ in range(repeat_amount):
+        time_start = time.perf_counter()
+        function(*args)
+        function_seconds.append(time.perf_counter() - time_start)
+    return min(function_seconds)
+
+
+def benchmark_influx_conversion(row_amount=1000000, repeat_amount=3):
+    """
+    benchmark_influx_conversion times the conversion of a decoded Influx
+    response into a dataframe, parsing ISO timestamps row by row versus
+    converting epoch millisecond columns with numpy.
+    """
+    influx_rows = get_influx_test_data(row_amount)
+    influx_columns = get_influx_test_data(row_amount, epoch='ms')
+    pd_rows = convert_influx_rows(influx_rows)
+    pd_columns = convert_influx_columns(influx_columns)
+    if not (pd_rows.index.equals(pd_columns.index) and
+            np.allclose(pd_rows.values, pd_columns.values)):
+        raise ValueError('The converted dataframes do not match.')
+    rows_seconds = time_function(convert_influx_rows, influx_rows,
+                                 repeat_amount=repeat_amount)
+    columns_seconds = time_function(convert_influx_columns, influx_columns,
+                                    repeat_amount=repeat_amount)
+    benchmark_results = {'row_amount': row_amount,
+                         'rows_seconds': rows_seconds,
+                         'columns_seconds': columns_seconds,
+                         'speedup': rows_seconds / columns_seconds}
+    return benchmark_results
+
+
+def measure_function(function, *args, repeat_amount=3, **kwargs):
+    """
+    measure_function returns the result of a function with its best
+    time over repeat_amount runs and the peak memory it allocated in a
+    further run traced by tracemalloc, kept apart from the timed runs
+    since tracing slows the allocations down.
+    """
+    function_seconds = []
+    for _ in range(repeat_amount):
+        time_start = time.perf_counter()
+        function_result = function(*args, **kwargs)
+        function_seconds.append(time.perf_counter() - time_start)
+    tracemalloc.start()
+    try:
+        function(*args, **kwargs)
+        _, function_peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return function_result, min(function_seconds), function_peak_bytes
+
+
+def get_host_test_dataframes(series_amount=10, duration='1h',
+                             sampling_period='10s',
+                             timestamp_start='2019-01-29 08:00:00',
+                             time_zone='Europe/Rome', random_seed=0):
+    """
+    get_host_test_dataframes generates the measurements of a host as
+    they come from data_manager: a dataframe per series, latest first,
+    each series sampled at sampling_period from its own random offset.
+    """
+    random_state = np.random.RandomState(random_seed)
+    pd_sampling_period = pd.to_timedelta(sampling_period)
+    pd_timestamp_start = pd.Timestamp(timestamp_start,
+                                      tz=time_zone).tz_convert('UTC')
+    sample_amount = int(pd.to_timedelta(duration) // pd_sampling_period)
+    pd_dataframes = []
+    for series_number in range(series_amount):
+        series_offset = pd_sampling_period * random_state.uniform(0.1, 0.9)
+        pd_utc_index = pd.date_range(pd_timestamp_start + series_offset,
+                                     periods=sample_amount - 1,
+                                     freq=pd_sampling_period, tz='UTC')
+        np_values = np.cumsum(random_state.normal(0, 1, pd_utc_index.size))
+        pd_dataframe = pd.DataFrame(
+            np_values[::-1], index=pd_utc_index[::-1],
+            columns=['benchmark_series_{0}'.format(series_number)])
+        pd_dataframes.append(pd_dataframe)
+    return pd_dataframes
+
+
+def benchmark_preprocessing_stages(host_amount=1, series_amount=10,
+                                   duration='1h', sampling_period='10s',
+                                   event_minimum_period='10m',
+                                   repeat_amount=3, lpf_harmonic_amount=10,
+                                   cluster_amount=3, fused_stages=False):
+    """
+    benchmark_preprocessing_stages runs the preprocessing of
+    host_amount synthetic hosts stage by stage, summing the best time of
+    each stage over the hosts and keeping its largest peak memory.
+    Setting fused_stages runs the fused path instead: the single pass
+    alignment, the strided event tensor and its batched low pass FFT.
+    """
+    timestamp_start = '2019-01-29 08:00:00'
+    time_zone = 'Europe/Rome'
+    timestamp_end = str(pd.Timestamp(timestamp_start) +
+                        pd.to_timedelta(duration))
+    stage_names = preprocessing_stage_names
+    if fused_stages:
+        stage_names = fused_preprocessing_stage_names
+    stage_results = {stage_name: {'stage_name': stage_name,
+                                  'seconds': 0.,
+                                  'peak_bytes': 0}
+                     for stage_name in stage_names}
+
+    def measure_stage(stage_name, function, *args, **kwargs):
+        stage_result, stage_seconds, stage_peak_bytes = measure_function(
+            function, *args, repeat_amount=repeat_amount, **kwargs)
+        stage_results[stage_name]['seconds'] += stage_seconds
+        stage_results[stage_name]['peak_bytes'] = max(
+            stage_results[stage_name]['peak_bytes'], stage_peak_bytes)
+        return stage_result
+
+    for host_number in range(host_amount):
+        pd_dataframes = get_host_test_dataframes(
+            series_amount, duration, sampling_period, timestamp_start,
+            time_zone, random_seed=host_number)
+        if fused_stages:
+            pd_joined_dataframe = measure_stage(
+                'align_pd_dataframes', data_sampler.align_pd_dataframes,
+                pd_dataframes, timestamp_start, timestamp_end, time_zone)
+            np_dataevent_tensor, _, _ = measure_stage(
+                'sample_dataevent_tensor',
+                data_sampler.sample_dataevent_tensor, pd_joined_dataframe,
+                event_minimum_period)
+            _, np_dataevent_lpf_tensor = measure_stage(
+                'filter_low_pass_dataevent_tensor',
+                data_sampler.filter_low_pass_dataevent_tensor,
+                np_dataevent_tensor,
+                signal_processor.get_sampling_period_s(
+                    pd_joined_dataframe.index),
+                lpf_harmonic_amount)
+            np_transposed_dataevents = measure_stage(
+                'transpose_dataevent_tensor',
+                data_sampler.transpose_dataevent_tensor,
+                np_dataevent_lpf_tensor)
+            measure_stage(
+                'cluster_pd_series', data_labeler.cluster_pd_series,
+                np_transposed_dataevents,
+                min(cluster_amount, len(np_transposed_dataevents)))
+            continue
+        pd_dataframes = measure_stage(
+            'pad_pd_dataframes', data_sampler.pad_pd_dataframes,
+            pd_dataframes, timestamp_start, timestamp_end, time_zone)
+        pd_dataframes = measure_stage(
+            'resample_pd_dataframes', data_sampler.resample_pd_dataframes,
+            pd_dataframes)
+        pd_dataframes = measure_stage(
+            'fill_pd_dataframes', data_sampler.fill_pd_dataframes,
+            pd_dataframes)
+        pd_dataframes = measure_stage(
+            'standardize_pd_dataframes',
+            data_sampler.standardize_pd_dataframes, pd_dataframes)
+        pd_joined_dataframe = measure_stage(
+            'join_pd_dataframes', data_sampler.join_pd_dataframes,
+            pd_dataframes)
+        pd_dataevents, _ = measure_stage(
+            'sample_dataevents', data_sampler.sample_dataevents,
+            pd_joined_dataframe, event_minimum_period)
+        pd_dataevents_lpf = measure_stage(
+            'filter_low_pass_dataevents',
+            data_sampler.filter_low_pass_dataevents, pd_dataevents,
+            lpf_harmonic_amount)
+        pd_transposed_dataevents, _ = measure_stage(
+            'transpose_dataevents', data_sampler.transpose_dataevents,
+            pd_dataevents_lpf)
+        measure_stage(
+            'cluster_pd_series', data_labeler.cluster_pd_series,
+            pd_transposed_dataevents,
+            min(cluster_amount, len(pd_transposed_dataevents)))
+    benchmark_results = {'benchmark_name': 'preprocessing_stages',
+                         'host_amount': host_amount,
+                         'series_amount': series_amount,
+                         'duration': duration,
+                         'sampling_period': sampling_period,
+                         'event_minimum_period': event_minimum_period,
+                         'repeat_amount': repeat_amount,
+                         'fused_stages': fused_stages,
+                         'stages': [stage_results[stage_name]
+                                    for stage_name in stage_names]}
+    benchmark_results['seconds'] = sum(
+        stage_result['seconds']
+        for stage_result in benchmark_results['stages'])
+    return benchmark_results
+
+
+def get_benchmark_parameters(benchmark_results):
+    return {parameter_name: parameter_value
+            for parameter_name, parameter_value in benchmark_results.items()
+            if parameter_name not in ['stages', 'seconds', 'environment',
+                                      'timestamp']}
+
+
+def load_benchmark_results(results_path):
+    benchmark_results_list = []
+    if os.path.exists(results_path):
+        with open(results_path) as results_file:
+            for results_line in results_file:
+                if results_line.strip():
+                    benchmark_results_list.append(json.loads(results_line))
+    return benchmark_results_list
+
+
+def save_benchmark_results(benchmark_results, results_path):
+    """
+    save_benchmark_results appends the results, stamped with the time
+    and the library versions, as a line of the JSON lines results_path,
+    so that the runs of a benchmark can be compared over time.
+    """
+    benchmark_results = dict(benchmark_results)
+    benchmark_results['timestamp'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+    benchmark_results['environment'] = {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__}
+    with open(results_path, 'a') as results_file:
+        results_file.write('{0}\n'.format(json.dumps(benchmark_results)))
+    return True
+
+
+def get_previous_benchmark_results(benchmark_results, results_path):
+    benchmark_parameters = get_benchmark_parameters(benchmark_results)
+    previous_benchmark_results = None
+    for saved_benchmark_results in load_benchmark_results(results_path):
+        if get_benchmark_parameters(saved_benchmark_results) == \
+                benchmark_parameters:
+            previous_benchmark_results = saved_benchmark_results
+    return previous_benchmark_results
+
+
+def get_benchmark_message(benchmark_results, previous_benchmark_results=None):
+    benchmark_message = 'Data benchmark | {0}preprocessing of {1} hosts x ' \
+                        '{2} series, {3} at {4}\n'.format(
+                            'fused ' if benchmark_results.get('fused_stages')
+                            else '',
+                            benchmark_results['host_amount'],
+                            benchmark_results['series_amount'],
+                            benchmark_results['duration'],
+                            benchmark_results['sampling_period'])
+    previous_stage_results = {}
+    if previous_benchmark_results:
+        previous_stage_results = {
+            stage_result['stage_name']: stage_result
+            for stage_result in previous_benchmark_results['stages']}
+    for stage_result in benchmark_results['stages']:
+        benchmark_message += '  {0}: {1:.4f}s {2:.1f}MB'.format(
+            stage_result['stage_name'], stage_result['seconds'],
+            stage_result['peak_bytes'] / 2 ** 20)
+        previous_stage_result = previous_stage_results.get(
+            stage_result['stage_name'])
+        if previous_stage_result and previous_stage_result['seconds']:
+            benchmark_message += ' ({0:.2f}x previous)'.format(
+                stage_result['seconds'] / previous_stage_result['seconds'])
+        benchmark_message += '\n'
+    benchmark_message += '  total: {0:.4f}s'.format(
+        benchmark_results['seconds'])
+    return benchmark_message
+
+
+def main():
+    cli_args = sys.argv[1:]
+    benchmark_name = 'conversion'
+    row_amount = 1000000
+    host_amounts = [1]
+    series_amounts = [10]
+    durations = ['1h']
+    sampling_periods = ['10s']
+    event_minimum_period = '10m'
+    repeat_amount = 3
+    results_path = 'benchmark_results.jsonl'
+    if cli_args:
+        parser = argparse.ArgumentParser()
+        parser.add_argument('benchmark_name', nargs='?',
+                            choices=['conversion', 'preprocessing'],
+                            help='select the benchmark to run')
+        parser.add_argument('-r', '--row_amount',
+                            help='set the rows of the conversion benchmark')
+        parser.add_argument('-n', '--host_amounts',
+                            help='set the comma separated host amounts')
+        parser.add_argument('-s', '--series_amounts',
+                            help='set the comma separated series amounts')
+        parser.add_argument('-d', '--durations',
+                            help='set the comma separated durations')
+        parser.add_argument('-p', '--sampling_periods',
+                            help='set the comma separated sampling periods')
+        parser.add_argument('-e', '--event_minimum_period',
+                            help='set the minimum period of the events')
+        parser.add_argument('-k', '--repeat_amount',
+                            help='set the timed runs of each stage')
+        parser.add_argument('-o', '--results_path',
+                            help='set the JSON lines file of the results')
+        args = parser.parse_args()
+        if args.benchmark_name:
+            benchmark_name = args.benchmark_name
+        row_amount = int(args.row_amount) if args.row_amount else row_amount
+        if args.host_amounts:
+            host_amounts = [int(host_amount) for host_amount
+                            in args.host_amounts.split(',')]
+        if args.series_amounts:
+            series_amounts = [int(series_amount) for series_amount
+                              in args.series_amounts.split(',')]
+        if args.durations:
+            durations = args.durations.split(',')
+        if args.sampling_periods:
+            sampling_periods = args.sampling_periods.split(',')
+        if args.event_minimum_period:
+            event_minimum_period = args.event_minimum_period
+        if args.repeat_amount:
+            repeat_amount = int(args.repeat_amount)
+        if args.results_path:
+            results_path = args.results_path
+    if benchmark_name == 'preprocessing':
+        for host_amount, series_amount, duration, sampling_period, \
+                fused_stages in itertools.product(host_amounts,
+                                                  series_amounts, durations,
+                                                  sampling_periods,
+                                                  [False, True]):
+            benchmark_results = benchmark_preprocessing_stages(
+                host_amount, series_amount, duration, sampling_period,
+                event_minimum_period, repeat_amount,
+                fused_stages=fused_stages)
+            previous_benchmark_results = get_previous_benchmark_results(
+                benchmark_results, results_path)
+            print(get_benchmark_message(benchmark_results,
+                                        previous_benchmark_results))
+            save_benchmark_results(benchmark_results, results_path)
+    else:
+        benchmark_results = benchmark_influx_conversion(row_amount)
+        print('Data benchmark | influx conversion of {} rows'.format(
+            benchmark_results['row_amount']))
+        print('  iso rows: {:.3f}s'.format(benchmark_results['rows_seconds']))
+        print('  epoch columns: {:.3f}s'.format(
+            benchmark_results['columns_seconds']))
+        print('  speedup: {:.1f}x'.format(benchmark_results['speedup']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,443 @@
+#!/usr/bin/python3
+
+"""
+    System diagnostics: data cache
+    Copyright (C) 2019 Francesco Melchiori
+    <https://www.francescomelchiori.com/>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see
+    <http://www.gnu.org/licenses/>.
+"""
+
+
+import os
+import json
+import time
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+
+class MeasurementCache:
+    """
+    MeasurementCache stores the measurement dataframes of a host on disk
+    in a columnar layout: every series is a pair of contiguous numpy
+    files, UTC nanosecond timestamps and float64 values, described by a
+    small JSON index. Series are loaded by memory mapping, so a single
+    one can be read without touching the others.
+
+    The cache can be bounded to byte_budget bytes, evicting the least
+    recently used entries after each save, and entries older than
+    entry_ttl seconds are dropped when looked up. Hits, misses and
+    evictions are counted in statistics.
+    """
+    def __init__(self, cache_path='measurement_cache', byte_budget=None,
+                 entry_ttl=None):
+        self.cache_path = cache_path
+        self.byte_budget = byte_budget
+        self.entry_ttl = entry_ttl
+        self.statistics = {'hits': 0,
+                           'partial_hits': 0,
+                           'misses': 0,
+                           'expirations': 0,
+                           'evictions': 0,
+                           'evicted_bytes': 0}
+
+    def __repr__(self):
+        print_message = 'Cache path: {0}\n'.format(self.cache_path)
+        print_message += 'Byte budget: {0}\n'.format(self.byte_budget)
+        print_message += 'Entry TTL: {0}\n'.format(self.entry_ttl)
+        print_message += 'Entries: {0}\n'.format(self.get_entry_names())
+        print_message += 'Statistics: {0}\n'.format(self.statistics)
+        return print_message
+
+    def get_entry_path(self, entry_name):
+        return os.path.join(self.cache_path, entry_name)
+
+    def get_entry_names(self):
+        if not os.path.isdir(self.cache_path):
+            return []
+        return sorted(entry_name
+                      for entry_name in os.listdir(self.cache_path)
+                      if self.has_entry(entry_name))
+
+    def has_entry(self, entry_name):
+        return os.path.isfile(os.path.join(self.get_entry_path(entry_name),
+                                           'index.json'))
+
+    def get_entry_size(self, entry_name):
+        entry_size = 0
+        for entry_file in os.scandir(self.get_entry_path(entry_name)):
+            try:
+                if entry_file.is_file():
+                    entry_size += entry_file.stat().st_size
+            except FileNotFoundError:
+                continue
+        return entry_size
+
+    def get_entry_saved_time(self, entry_name):
+        return os.stat(os.path.join(self.get_entry_path(entry_name),
+                                    'index.json')).st_mtime
+
+    def get_entry_access_time(self, entry_name):
+        entry_access_path = os.path.join(self.get_entry_path(entry_name),
+                                         'access')
+        try:
+            return os.stat(entry_access_path).st_mtime
+        except FileNotFoundError:
+            return self.get_entry_saved_time(entry_name)
+
+    def touch_entry(self, entry_name):
+        entry_access_path = os.path.join(self.get_entry_path(entry_name),
+                                         'access')
+        with open(entry_access_path, 'a'):
+            os.utime(entry_access_path)
+        return True
+
+    def is_expired(self, entry_name):
+        if not self.entry_ttl:
+            return False
+        entry_age = time.time() - self.get_entry_saved_time(entry_name)
+        return entry_age > self.entry_ttl
+
+    def lookup_entry(self, entry_name):
+        """
+        lookup_entry tells whether an entry can be served, dropping it
+        when expired, and counts the lookup as a hit or a miss.
+        """
+        if self.has_entry(entry_name) and self.is_expired(entry_name):
+            self.remove_entry(entry_name)
+            self.statistics['expirations'] += 1
+        if self.has_entry(entry_name):
+            self.touch_entry(entry_name)
+            self.statistics['hits'] += 1
+            return True
+        self.statistics['misses'] += 1
+        return False
+
+    def remove_entry(self, entry_name):
+        shutil.rmtree(self.get_entry_path(entry_name), ignore_errors=True)
+        return True
+
+    def evict_entries(self, kept_entry_name=None):
+        """
+        evict_entries drops the expired entries, then the least recently
+        used ones until the cache fits in byte_budget, sparing
+        kept_entry_name, which has just been saved, as long as possible.
+        The entries removed meanwhile by another process sharing the
+        cache are skipped.
+        """
+        entry_records = []
+        for entry_name in self.get_entry_names():
+            try:
+                if entry_name != kept_entry_name and \
+                        self.is_expired(entry_name):
+                    self.remove_entry(entry_name)
+                    self.statistics['expirations'] += 1
+                    continue
+                entry_records.append((entry_name == kept_entry_name,
+                                      self.get_entry_access_time(entry_name),
+                                      self.get_entry_size(entry_name),
+                                      entry_name))
+            except FileNotFoundError:
+                continue
+        if not self.byte_budget:
+            return True
+        cache_size = sum(entry_record[2] for entry_record in entry_records)
+        for _, _, entry_size, entry_name in sorted(entry_records):
+            if cache_size <= self.byte_budget:
+                break
+            self.remove_entry(entry_name)
+            cache_size -= entry_size
+            self.statistics['evictions'] += 1
+            self.statistics['evicted_bytes'] += entry_size
+        return True
+
+    def load_entry_index(self, entry_name):
+        entry_index_path = os.path.join(self.get_entry_path(entry_name),
+                                        'index.json')
+        with open(entry_index_path) as entry_index_file:
+            return json.load(entry_index_file)
+
+    def save_entry_index(self, entry_name, entry_index):
+        entry_path = self.get_entry_path(entry_name)
+        entry_index_path = os.path.join(entry_path, 'index.json')
+        with get_temporary_file(entry_index_path, 'w') as entry_index_file:
+            json.dump(entry_index, entry_index_file)
+        os.replace(entry_index_file.name, entry_index_path)
+        return True
+
+    def save_entry(self, entry_name, pd_dataframes,
+                   pd_joined_dataframe=None, entry_metadata=None):
+        """
+        save_entry writes each column of pd_dataframes, and the joined
+        dataframe if not empty, as separate series files, then the index
+        describing them, which is replaced atomically as the last step.
+        """
+        entry_path = self.get_entry_path(entry_name)
+        os.makedirs(entry_path, exist_ok=True)
+        entry_index = {'metadata': entry_metadata if entry_metadata else {},
+                       'series': {},
+                       'dataframes': [],
+                       'joined_dataframe': None}
+        for pd_dataframe in pd_dataframes:
+            pd_dataframe_series_names = []
+            for pd_series_name in pd_dataframe.columns:
+                series_file_name = 'series_{0:06d}'.format(
+                    len(entry_index['series']))
+                self.save_series_files(entry_path, series_file_name,
+                                       pd_dataframe.index,
+                                       pd_dataframe[pd_series_name].values)
+                entry_index['series'][str(pd_series_name)] = {
+                    'file_name': series_file_name,
+                    'size': int(pd_dataframe.shape[0]),
+                    'freq': pd_dataframe.index.freqstr}
+                pd_dataframe_series_names.append(str(pd_series_name))
+            entry_index['dataframes'].append(pd_dataframe_series_names)
+        if pd_joined_dataframe is not None and \
+                not pd_joined_dataframe.empty:
+            self.save_series_files(entry_path, 'joined',
+                                   pd_joined_dataframe.index,
+                                   np.asfortranarray(
+                                       pd_joined_dataframe.values,
+                                       dtype='float64'))
+            entry_index['joined_dataframe'] = {
+                'columns': [str(pd_series_name) for pd_series_name
+                            in pd_joined_dataframe.columns],
+                'size': int(pd_joined_dataframe.shape[0]),
+                'freq': pd_joined_dataframe.index.freqstr}
+        self.save_entry_index(entry_name, entry_index)
+        self.touch_entry(entry_name)
+        self.evict_entries(entry_name)
+        return True
+
+    def save_series_files(self, entry_path, series_file_name, pd_index,
+                          np_values):
+        if isinstance(pd_index, pd.DatetimeIndex):
+            np_timestamps = pd_index.asi8
+        else:
+            np_timestamps = np.asarray(pd_index, dtype='int64')
+        save_npy_file(os.path.join(entry_path, series_file_name + '.time.npy'),
+                      np_timestamps)
+        save_npy_file(os.path.join(entry_path,
+                                   series_file_name + '.values.npy'),
+                      np_values.astype('float64', copy=False))
+        return True
+
+    def load_series_files(self, entry_path, series_file_name, freq=None):
+        np_timestamps = np.load(
+            os.path.join(entry_path, series_file_name + '.time.npy'),
+            mmap_mode='r')
+        np_values = np.load(
+            os.path.join(entry_path, series_file_name + '.values.npy'),
+            mmap_mode='r')
+        pd_index = pd.DatetimeIndex(
+            np_timestamps.view('datetime64[ns]')).tz_localize('UTC')
+        if freq:
+            pd_index = pd.DatetimeIndex(pd_index, freq=freq)
+        return pd_index, np_values
+
+    def load_series(self, entry_name, series_name, entry_index=None):
+        if not entry_index:
+            entry_index = self.load_entry_index(entry_name)
+        series_index = entry_index['series'][series_name]
+        pd_index, np_values = self.load_series_files(
+            self.get_entry_path(entry_name), series_index['file_name'],
+            series_index['freq'])
+        pd_dataframe = pd.DataFrame({series_name: np_values},
+                                    index=pd_index, copy=False)
+        return pd_dataframe
+
+    def get_missing_intervals(self, entry_name, series_names, time_interval):
+        """
+        get_missing_intervals returns the sub intervals of time_interval,
+        as nanosecond epoch pairs, which are not held in the cache by
+        every one of series_names.
+        """
+        if not self.lookup_entry(entry_name):
+            return [list(time_interval)]
+        entry_index = self.load_entry_index(entry_name)
+        missing_intervals = []
+        for series_name in series_names:
+            series_intervals = []
+            if series_name in entry_index['series']:
+                series_intervals = entry_index['series'][series_name].get(
+                    'intervals', [])
+            missing_intervals += subtract_intervals(time_interval,
+                                                    series_intervals)
+        missing_intervals = merge_intervals(missing_intervals)
+        if missing_intervals:
+            self.statistics['hits'] -= 1
+            self.statistics['partial_hits'] += 1
+        return missing_intervals
+
+    def merge_series(self, entry_name, pd_dataframes, time_interval):
+        """
+        merge_series merges the series of pd_dataframes, fetched over
+        time_interval, into the series of the entry, keeping them sorted
+        by time without duplicates and recording the interval as held.
+        """
+        entry_path = self.get_entry_path(entry_name)
+        os.makedirs(entry_path, exist_ok=True)
+        if self.has_entry(entry_name):
+            entry_index = self.load_entry_index(entry_name)
+        else:
+            entry_index = {'metadata': {},
+                           'series': {},
+                           'dataframes': [],
+                           'joined_dataframe': None}
+        for pd_dataframe in pd_dataframes:
+            for pd_series_name in pd_dataframe.columns:
+                series_name = str(pd_series_name)
+                np_timestamps = pd_dataframe.index.asi8
+                np_values = pd_dataframe[pd_series_name].values.astype(
+                    'float64')
+                series_index = entry_index['series'].get(series_name)
+                if series_index:
+                    cached_pd_index, cached_np_values = \
+                        self.load_series_files(entry_path,
+                                               series_index['file_name'])
+                    np_timestamps = np.concatenate([cached_pd_index.asi8,
+                                                    np_timestamps])
+                    np_values = np.concatenate([cached_np_values, np_values])
+                else:
+                    series_index = {
+                        'file_name': 'series_{0:06d}'.format(
+                            len(entry_index['series'])),
+                        'freq': None,
+                        'intervals': []}
+                    entry_index['series'][series_name] = series_index
+                    entry_index['dataframes'].append([series_name])
+                np_time_order = np.argsort(np_timestamps, kind='stable')
+                np_timestamps = np_timestamps[np_time_order]
+                np_values = np_values[np_time_order]
+                np_time_last = np.append(
+                    np_timestamps[1:] != np_timestamps[:-1], True)
+                np_timestamps = np_timestamps[np_time_last]
+                np_values = np_values[np_time_last]
+                self.save_series_files(entry_path, series_index['file_name'],
+                                       np_timestamps, np_values)
+                series_index['size'] = int(np_timestamps.size)
+                series_index['intervals'] = merge_intervals(
+                    series_index['intervals'] + [list(time_interval)])
+        self.save_entry_index(entry_name, entry_index)
+        self.touch_entry(entry_name)
+        self.evict_entries(entry_name)
+        return True
+
+    def load_series_range(self, entry_name, series_name, time_interval,
+                          entry_index=None):
+        """
+        load_series_range reads from a merged entry the values of a
+        series strictly within time_interval, latest first as queried,
+        touching only the mapped pages of that range.
+        """
+        if not entry_index:
+            entry_index = self.load_entry_index(entry_name)
+        series_index = entry_index['series'][series_name]
+        entry_path = self.get_entry_path(entry_name)
+        np_timestamps = np.load(
+            os.path.join(entry_path,
+                         series_index['file_name'] + '.time.npy'),
+            mmap_mode='r')
+        np_values = np.load(
+            os.path.join(entry_path,
+                         series_index['file_name'] + '.values.npy'),
+            mmap_mode='r')
+        range_start = np.searchsorted(np_timestamps, time_interval[0],
+                                      side='right')
+        range_end = np.searchsorted(np_timestamps, time_interval[1],
+                                    side='left')
+        np_range_timestamps = np_timestamps[range_start:range_end][::-1]
+        np_range_values = np_values[range_start:range_end][::-1]
+        pd_index = pd.DatetimeIndex(
+            np_range_timestamps.view('datetime64[ns]')).tz_localize('UTC')
+        pd_dataframe = pd.DataFrame({series_name: np_range_values},
+                                    index=pd_index)
+        return pd_dataframe
+
+    def load_entry(self, entry_name):
+        entry_index = self.load_entry_index(entry_name)
+        pd_dataframes = []
+        for pd_dataframe_series_names in entry_index['dataframes']:
+            pd_series_dataframes = [
+                self.load_series(entry_name, pd_series_name, entry_index)
+                for pd_series_name in pd_dataframe_series_names]
+            if len(pd_series_dataframes) == 1:
+                pd_dataframes.append(pd_series_dataframes[0])
+            else:
+                pd_dataframes.append(pd.concat(pd_series_dataframes,
+                                               axis=1))
+        pd_joined_dataframe = pd.DataFrame()
+        if entry_index['joined_dataframe']:
+            joined_index = entry_index['joined_dataframe']
+            pd_index, np_values = self.load_series_files(
+                self.get_entry_path(entry_name), 'joined',
+                joined_index['freq'])
+            pd_joined_dataframe = pd.DataFrame(
+                np_values, index=pd_index, columns=joined_index['columns'],
+                copy=False)
+        return pd_dataframes, pd_joined_dataframe, entry_index['metadata']
+
+
+def save_npy_file(npy_path, np_array):
+    """
+    save_npy_file writes a new file and swaps it in place of the old
+    one, so that arrays still memory mapped from it stay valid.
+    """
+    with get_temporary_file(npy_path, 'wb') as npy_file:
+        np.save(npy_file, np_array)
+    os.replace(npy_file.name, npy_path)
+    return True
+
+
+def get_temporary_file(file_path, file_mode):
+    """
+    get_temporary_file opens a file of unique name beside file_path, to
+    be swapped in its place, so that the processes sharing a cache never
+    write the same temporary file.
+    """
+    return tempfile.NamedTemporaryFile(
+        file_mode, dir=os.path.dirname(file_path),
+        prefix=os.path.basename(file_path) + '.', suffix='.tmp',
+        delete=False)
+
+
+def merge_intervals(intervals):
+    merged_intervals = []
+    for interval_start, interval_end in sorted(intervals):
+        if merged_intervals and interval_start <= merged_intervals[-1][1]:
+            merged_intervals[-1][1] = max(merged_intervals[-1][1],
+                                          interval_end)
+        else:
+            merged_intervals.append([interval_start, interval_end])
+    return merged_intervals
+
+
+def subtract_intervals(interval, held_intervals):
+    missing_intervals = []
+    missing_start, missing_end = interval
+    for held_start, held_end in merge_intervals(held_intervals):
+        if held_end <= missing_start:
+            continue
+        if held_start >= missing_end:
+            break
+        if held_start > missing_start:
+            missing_intervals.append([missing_start, held_start])
+        missing_start = max(missing_start, held_end)
+    if missing_start < missing_end:
+        missing_intervals.append([missing_start, missing_end])
+    return missing_intervals
@@ -0,0 +1,388 @@
+#!/usr/bin/python3
+
+"""
+    System diagnostics: data client
+    Copyright (C) 2019 Francesco Melchiori
+    <https://www.francescomelchiori.com/>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see
+    <http://www.gnu.org/licenses/>.
+"""
+
+
+import gzip
+import time
+import queue
+import random
+import bisect
+import threading
+import http.client as httpclient
+import urllib.error as urlerror
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed
+
+
+class InfluxClient:
+    """
+    InfluxClient keeps a pool of persistent HTTP connections for each
+    data source ip port and negotiates gzip compressed responses, so
+    that the queries of a diagnostics run share the connections instead
+    of opening a new one per request.
+
+    Each socket operation of a query is bounded by timeout seconds, a
+    failed query is retried up to retry_amount times after a jittered
+    exponential backoff, and setting hedge_percentile sends a duplicate
+    of any query still pending after that percentile of the latencies
+    seen so far, keeping the first answer. The query latencies are
+    collected in latency_histogram.
+    """
+    def __init__(self, pool_size=4, timeout=None, compress=True,
+                 retry_amount=0, retry_backoff=0.5, hedge_percentile=None,
+                 hedge_minimum_samples=20):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.compress = compress
+        self.retry_amount = retry_amount
+        self.retry_backoff = retry_backoff
+        self.hedge_percentile = hedge_percentile
+        self.hedge_minimum_samples = hedge_minimum_samples
+        self.connection_pools = {}
+        self.connection_pools_lock = threading.Lock()
+        self.hedge_executor = None
+        self.hedge_executor_lock = threading.Lock()
+        self.latency_histogram = LatencyHistogram()
+        self.statistics = {'queries': 0,
+                           'retries': 0,
+                           'hedges': 0,
+                           'failures': 0}
+        self.statistics_lock = threading.Lock()
+
+    def __repr__(self):
+        print_message = 'Pool size: {0}\n'.format(self.pool_size)
+        print_message += 'Timeout: {0}\n'.format(self.timeout)
+        print_message += 'Compress: {0}\n'.format(self.compress)
+        print_message += 'Retry amount: {0}\n'.format(self.retry_amount)
+        print_message += 'Hedge percentile: {0}\n'.format(
+            self.hedge_percentile)
+        print_message += 'Connection pools: {0}\n'.format(
+            list(self.connection_pools))
+        print_message += 'Statistics: {0}\n'.format(self.statistics)
+        print_message += 'Latency histogram:\n{0}'.format(
+            self.latency_histogram)
+        return print_message
+
+    def count(self, statistic_name):
+        with self.statistics_lock:
+            self.statistics[statistic_name] += 1
+        return True
+
+    def get_connection_pool(self, influx_ip_port):
+        with self.connection_pools_lock:
+            if influx_ip_port not in self.connection_pools:
+                self.connection_pools[influx_ip_port] = queue.LifoQueue(
+                    maxsize=self.pool_size)
+            return self.connection_pools[influx_ip_port]
+
+    def get_connection(self, influx_ip_port):
+        connection_pool = self.get_connection_pool(influx_ip_port)
+        try:
+            return connection_pool.get_nowait(), True
+        except queue.Empty:
+            return httpclient.HTTPConnection(influx_ip_port,
+                                             timeout=self.timeout), False
+
+    def release_connection(self, influx_ip_port, connection):
+        connection_pool = self.get_connection_pool(influx_ip_port)
+        try:
+            connection_pool.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+        return True
+
+    def open(self, influx_ip_port, influx_request_path):
+        influx_request_headers = {'Connection': 'keep-alive'}
+        if self.compress:
+            influx_request_headers['Accept-Encoding'] = 'gzip'
+        connection, connection_reused = self.get_connection(influx_ip_port)
+        try:
+            connection.request('GET', influx_request_path,
+                               headers=influx_request_headers)
+            http_response = connection.getresponse()
+        except (httpclient.RemoteDisconnected, ConnectionResetError,
+                BrokenPipeError):
+            connection.close()
+            if not connection_reused:
+                raise
+            connection = httpclient.HTTPConnection(influx_ip_port,
+                                                   timeout=self.timeout)
+            try:
+                connection.request('GET', influx_request_path,
+                                   headers=influx_request_headers)
+                http_response = connection.getresponse()
+            except Exception:
+                connection.close()
+                raise
+        except Exception:
+            connection.close()
+            raise
+        influx_response = InfluxResponse(self, influx_ip_port, connection,
+                                         http_response)
+        if http_response.status != 200:
+            http_error_message = http_response.reason
+            influx_response.close()
+            raise urlerror.HTTPError(
+                'http://{0}{1}'.format(influx_ip_port, influx_request_path),
+                http_response.status, http_error_message,
+                http_response.headers, None)
+        return influx_response
+
+    def query(self, influx_ip_port, influx_request_path):
+        """
+        query reads the whole response of a request, retrying it after
+        a jittered backoff when the connection fails or the server
+        answers with an error, and hedging it when hedge_percentile is
+        set.
+        """
+        return self.retry(self.fetch_hedged, influx_ip_port,
+                          influx_request_path)
+
+    def query_stream(self, influx_ip_port, influx_request_path):
+        """
+        query_stream opens a response to be read in chunks, retrying and
+        hedging its request as query does until the response headers
+        arrive. Past them a failure is left to the reader, as the chunks
+        already read cannot be fetched again. The latency of the
+        response is recorded once it is read and closed.
+        """
+        return self.retry(self.open_hedged, influx_ip_port,
+                          influx_request_path)
+
+    def retry(self, fetch_function, influx_ip_port, influx_request_path):
+        self.count('queries')
+        retry_number = 0
+        while True:
+            try:
+                return fetch_function(influx_ip_port, influx_request_path)
+            except (OSError, httpclient.HTTPException) as query_exception:
+                if isinstance(query_exception, urlerror.HTTPError) and \
+                        query_exception.code < 500:
+                    self.count('failures')
+                    raise
+                if retry_number >= self.retry_amount:
+                    self.count('failures')
+                    raise
+            retry_number += 1
+            self.count('retries')
+            time.sleep(random.uniform(
+                0, self.retry_backoff * 2 ** (retry_number - 1)))
+
+    def fetch(self, influx_ip_port, influx_request_path):
+        time_start = time.perf_counter()
+        with self.open(influx_ip_port, influx_request_path) as \
+                influx_response:
+            influx_response_body = influx_response.read()
+        self.latency_histogram.record(time.perf_counter() - time_start)
+        return influx_response_body
+
+    def get_hedge_delay(self):
+        if not self.hedge_percentile:
+            return None
+        if self.latency_histogram.sample_amount < \
+                self.hedge_minimum_samples:
+            return None
+        return self.latency_histogram.get_percentile(self.hedge_percentile)
+
+    def get_hedge_executor(self):
+        with self.hedge_executor_lock:
+            if not self.hedge_executor:
+                self.hedge_executor = ThreadPoolExecutor(
+                    max_workers=2 * self.pool_size)
+            return self.hedge_executor
+
+    def open_stream(self, influx_ip_port, influx_request_path):
+        time_start = time.perf_counter()
+        influx_response = self.open(influx_ip_port, influx_request_path)
+        influx_response.time_start = time_start
+        return influx_response
+
+    def fetch_hedged(self, influx_ip_port, influx_request_path):
+        return self.hedge(self.fetch, influx_ip_port, influx_request_path)
+
+    def open_hedged(self, influx_ip_port, influx_request_path):
+        return self.hedge(self.open_stream, influx_ip_port,
+                          influx_request_path, discard_response)
+
+    def hedge(self, fetch_function, influx_ip_port, influx_request_path,
+              discard_function=None):
+        hedge_delay = self.get_hedge_delay()
+        if hedge_delay is None:
+            return fetch_function(influx_ip_port, influx_request_path)
+        hedge_executor = self.get_hedge_executor()
+        fetch_futures = [hedge_executor.submit(
+            fetch_function, influx_ip_port, influx_request_path)]
+        fetch_done, _ = wait(fetch_futures, timeout=hedge_delay)
+        if not fetch_done:
+            self.count('hedges')
+            fetch_futures.append(hedge_executor.submit(
+                fetch_function, influx_ip_port, influx_request_path))
+        fetch_exception = None
+        for fetch_future in as_completed(fetch_futures):
+            try:
+                fetch_result = fetch_future.result()
+            except (OSError, httpclient.HTTPException) as fetch_error:
+                fetch_exception = fetch_error
+                continue
+            if discard_function:
+                for other_future in fetch_futures:
+                    if other_future is not fetch_future:
+                        other_future.add_done_callback(discard_function)
+            return fetch_result
+        raise fetch_exception
+
+    def close(self):
+        with self.hedge_executor_lock:
+            if self.hedge_executor:
+                self.hedge_executor.shutdown(wait=False)
+                self.hedge_executor = None
+        with self.connection_pools_lock:
+            for connection_pool in self.connection_pools.values():
+                while True:
+                    try:
+                        connection_pool.get_nowait().close()
+                    except queue.Empty:
+                        break
+            self.connection_pools = {}
+        return True
+
+
+class InfluxResponse:
+    """
+    InfluxResponse reads a response of InfluxClient as a file object,
+    decompressing it when gzip encoded, and gives its connection back to
+    the client pool once closed.
+    """
+    def __init__(self, influx_client, influx_ip_port, connection,
+                 http_response):
+        self.influx_client = influx_client
+        self.influx_ip_port = influx_ip_port
+        self.connection = connection
+        self.http_response = http_response
+        self.response_file = http_response
+        if http_response.getheader('Content-Encoding', '') == 'gzip':
+            self.response_file = gzip.GzipFile(fileobj=http_response)
+        self.time_start = None
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(reuse_connection=exc_type is None)
+
+    def __iter__(self):
+        return iter(self.response_file)
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            return self.response_file.read()
+        return self.response_file.read(size)
+
+    def readline(self, size=-1):
+        return self.response_file.readline(size)
+
+    def close(self, reuse_connection=True):
+        if self.closed:
+            return True
+        self.closed = True
+        try:
+            if reuse_connection and not self.http_response.will_close:
+                self.http_response.read()
+            else:
+                reuse_connection = False
+        except (httpclient.HTTPException, OSError):
+            reuse_connection = False
+        self.http_response.close()
+        if self.time_start is not None and reuse_connection:
+            self.influx_client.latency_histogram.record(
+                time.perf_counter() - self.time_start)
+        if reuse_connection:
+            self.influx_client.release_connection(self.influx_ip_port,
+                                                  self.connection)
+        else:
+            self.connection.close()
+        return True
+
+
+def discard_response(fetch_future):
+    if not fetch_future.cancelled() and fetch_future.exception() is None:
+        fetch_future.result().close(reuse_connection=False)
+    return True
+
+
+class LatencyHistogram:
+    """
+    LatencyHistogram counts latencies in logarithmic buckets, from a
+    millisecond to about two minutes, and estimates their percentiles
+    as the upper bound of the bucket reaching the percentile.
+    """
+    def __init__(self, bucket_bounds=None):
+        if not bucket_bounds:
+            bucket_bounds = [0.001 * 2 ** (bucket_number / 2)
+                             for bucket_number in range(35)]
+        self.bucket_bounds = bucket_bounds
+        self.bucket_counts = [0] * (len(bucket_bounds) + 1)
+        self.sample_amount = 0
+        self.sample_sum = 0.
+        self.sample_maximum = 0.
+        self.histogram_lock = threading.Lock()
+
+    def __repr__(self):
+        print_message = 'Samples: {0}\n'.format(self.sample_amount)
+        if self.sample_amount:
+            print_message += 'Mean: {0:.3f}s\n'.format(
+                self.sample_sum / self.sample_amount)
+            for percentile in [50, 90, 99]:
+                print_message += 'p{0}: {1:.3f}s\n'.format(
+                    percentile, self.get_percentile(percentile))
+            print_message += 'Maximum: {0:.3f}s\n'.format(
+                self.sample_maximum)
+        return print_message
+
+    def record(self, latency):
+        bucket_index = bisect.bisect_left(self.bucket_bounds, latency)
+        with self.histogram_lock:
+            self.bucket_counts[bucket_index] += 1
+            self.sample_amount += 1
+            self.sample_sum += latency
+            self.sample_maximum = max(self.sample_maximum, latency)
+        return True
+
+    def get_percentile(self, percentile):
+        with self.histogram_lock:
+            if not self.sample_amount:
+                return None
+            percentile_rank = percentile / 100 * self.sample_amount
+            bucket_cumulative_count = 0
+            for bucket_index, bucket_count in enumerate(self.bucket_counts):
+                bucket_cumulative_count += bucket_count
+                if bucket_cumulative_count >= percentile_rank:
+                    if bucket_index < len(self.bucket_bounds):
+                        return min(self.bucket_bounds[bucket_index],
+                                   self.sample_maximum)
+                    break
+            return self.sample_maximum
+
+    def get_buckets(self):
+        with self.histogram_lock:
+            return list(zip(self.bucket_bounds + [float('inf')],
+                            self.bucket_counts))
@@ -23,7 +23,6 @@
 
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 from sklearn.cluster import KMeans
 from sklearn.metrics import pairwise_distances_argmin_min
 
@@ -77,15 +76,15 @@ def main():
     pd_dataframe_test = pd.DataFrame(pd_series_dictionary_test)
     # data_viewer.view_pd_dataframe(pd_dataframe_test)
 
-    pd_dataevent_samples, pd_dataevent_sample_length = \
-        data_sampler.sample_dataevents(pd_dataframe_test,
-                                       event_minimum_period)
-    # pd_dataevent_anomaly_sample_start = int(pd_dataevent_samples.__len__()/2)
-    # data_viewer.view_pd_dataframe(
-    #     pd_dataevent_samples[pd_dataevent_anomaly_sample_start])
+    np_dataevent_tensor, pd_dataevent_sample_timestamps, \
+        pd_dataevent_sample_length = data_sampler.sample_dataevent_tensor(
+            pd_dataframe_test, event_minimum_period)
+    # pd_dataevent_anomaly_sample_start = int(np_dataevent_tensor.shape[0]/2)
+    # plt.plot(np_dataevent_tensor[pd_dataevent_anomaly_sample_start])
+    # plt.show()
 
-    pd_dataevent_transposed_samples, pd_dataevent_sample_timestamps = \
-        data_sampler.transpose_dataevents(pd_dataevent_samples)
+    pd_dataevent_transposed_samples = \
+        data_sampler.transpose_dataevent_tensor(np_dataevent_tensor)
     # plt.plot(
     #     pd_dataevent_transposed_samples[pd_dataevent_anomaly_sample_start])
     # plt.show()
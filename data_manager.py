@@ -24,19 +24,112 @@
 import sys
 import os
 import argparse
+import functools
 import json
-import shelve
+import threading
+import time
 import urllib.parse as urlparse
 import urllib.request as urlrequest
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, \
+    as_completed
 
 import numpy as np
 import pandas as pd
-import dateutil.parser as dateparse
 
+import data_cache
+import data_client
+import data_metrics
 import data_sampler
+import data_streamer
 import data_exceptions
 
 
+diagnostics_map_levels = [('customers', 'customer_name'),
+                          ('networks', 'network_name'),
+                          ('data_sources', 'data_source_name'),
+                          ('databases', 'database_name'),
+                          ('hosts', 'host_name'),
+                          ('measurements', 'measurement_name')]
+diagnostics_maps = {}
+diagnostics_maps_lock = threading.Lock()
+
+
+class DiagnosticsMap:
+    """
+    DiagnosticsMap loads the JSON diagnostics map once and indexes each
+    level of it by name, from the customers down to the measurements,
+    so that finding any item of the map costs a dictionary lookup per
+    level instead of a scan of each list.
+    """
+    def __init__(self, json_path):
+        self.json_path = json_path
+        self.json_mtime = None
+        self.map_index = {}
+        self.load_diagnostics_map()
+
+    def __repr__(self):
+        print_message = 'JSON path: {0}\n'.format(self.json_path)
+        print_message += 'JSON modification time: {0}\n'.format(
+            self.json_mtime)
+        print_message += 'Customers: {0}\n'.format(list(self.map_index))
+        return print_message
+
+    def load_diagnostics_map(self):
+        self.json_mtime = get_file_mtime(self.json_path)
+        diagnostics_map = load_json(self.json_path)
+        self.map_index = {}
+        if diagnostics_map:
+            self.map_index = self.index_map_items(
+                diagnostics_map.get('customers', []))
+        return True
+
+    def index_map_items(self, map_items, map_level=0):
+        map_item_key = diagnostics_map_levels[map_level][1]
+        map_index = {}
+        for map_item in map_items:
+            map_children_index = {}
+            if map_level + 1 < len(diagnostics_map_levels):
+                map_children_key = diagnostics_map_levels[map_level + 1][0]
+                if map_children_key in map_item:
+                    map_children_index = self.index_map_items(
+                        map_item[map_children_key], map_level + 1)
+            map_index[map_item[map_item_key]] = (map_item,
+                                                 map_children_index)
+        return map_index
+
+    def get_map_item(self, *map_item_names):
+        map_item = {}
+        map_index = self.map_index
+        for map_item_name in map_item_names:
+            if map_item_name not in map_index:
+                return {}
+            map_item, map_index = map_index[map_item_name]
+        return map_item
+
+    def is_outdated(self):
+        return get_file_mtime(self.json_path) != self.json_mtime
+
+    def get_host_paths(self, customer_name=None):
+        host_paths = []
+        for customer_item_name, (_, network_index) in \
+                self.map_index.items():
+            if customer_name and customer_item_name != customer_name:
+                continue
+            for network_name, (_, data_source_index) in \
+                    network_index.items():
+                for data_source_name, (_, database_index) in \
+                        data_source_index.items():
+                    for database_name, (_, host_index) in \
+                            database_index.items():
+                        for host_name in host_index:
+                            host_paths.append((customer_item_name,
+                                               network_name,
+                                               data_source_name,
+                                               database_name,
+                                               host_name))
+        return host_paths
+
+
 class CustomerNetworkData:
 
     def __init__(self, customer_name, json_path=''):
@@ -57,10 +150,9 @@ class CustomerNetworkData:
     def load_networks_map(self):
         if not self.json_path:
             self.json_path = 'diagnostics_map.json'
-        diagnostics_map = load_json(self.json_path)
-        for customer_data in diagnostics_map['customers']:
-            if customer_data['customer_name'] == self.customer_name:
-                self.networks = customer_data['networks']
+        self.diagnostics_map = get_diagnostics_map(self.json_path)
+        self.networks = self.diagnostics_map.get_map_item(
+            self.customer_name).get('networks', [])
         if not self.networks:
             raise data_exceptions.DataNotFound(data_name=self.customer_name,
                                                source_name='customers')
@@ -83,9 +175,8 @@ class CustomerSourceData(CustomerNetworkData):
         return print_message
 
     def load_data_sources(self):
-        for network in self.networks:
-            if network['network_name'] == self.network_name:
-                self.data_sources = network['data_sources']
+        self.data_sources = self.diagnostics_map.get_map_item(
+            self.customer_name, self.network_name).get('data_sources', [])
         if not self.data_sources:
             raise data_exceptions.DataNotFound(data_name=self.network_name,
                                                source_name='networks')
@@ -115,10 +206,11 @@ class CustomerDBData(CustomerSourceData):
         return print_message
 
     def load_databases(self):
-        for data_source in self.data_sources:
-            if data_source['data_source_name'] == self.data_source_name:
-                self.data_source_ip_port = data_source['data_source_ip_port']
-                self.databases = data_source['databases']
+        data_source = self.diagnostics_map.get_map_item(
+            self.customer_name, self.network_name, self.data_source_name)
+        if data_source:
+            self.data_source_ip_port = data_source['data_source_ip_port']
+            self.databases = data_source.get('databases', [])
         if not self.databases:
             raise data_exceptions.DataNotFound(data_name=self.data_source_name,
                                                source_name='data_sources')
@@ -149,9 +241,9 @@ class CustomerHostData(CustomerDBData):
         return print_message
 
     def load_hosts(self):
-        for database in self.databases:
-            if database['database_name'] == self.database_name:
-                self.hosts = database['hosts']
+        self.hosts = self.diagnostics_map.get_map_item(
+            self.customer_name, self.network_name, self.data_source_name,
+            self.database_name).get('hosts', [])
         if not self.hosts:
             raise data_exceptions.DataNotFound(data_name=self.database_name,
                                                source_name='databases')
@@ -184,9 +276,9 @@ class CustomerMeasureData(CustomerHostData):
         return print_message
 
     def load_measurements(self):
-        for host in self.hosts:
-            if host['host_name'] == self.host_name:
-                self.measurements = host['measurements']
+        self.measurements = self.diagnostics_map.get_map_item(
+            self.customer_name, self.network_name, self.data_source_name,
+            self.database_name, self.host_name).get('measurements', [])
         if not self.measurements:
             raise data_exceptions.DataNotFound(data_name=self.host_name,
                                                source_name='hosts')
@@ -222,9 +314,10 @@ class CustomerUnitData(CustomerMeasureData):
         return print_message
 
     def load_units(self):
-        for measurement in self.measurements:
-            if measurement['measurement_name'] == self.measurement_name:
-                self.units = measurement['units']
+        self.units = self.diagnostics_map.get_map_item(
+            self.customer_name, self.network_name, self.data_source_name,
+            self.database_name, self.host_name,
+            self.measurement_name).get('units', [])
         if not self.units:
             raise data_exceptions.DataNotFound(data_name=self.measurement_name,
                                                source_name='measurements')
@@ -239,12 +332,60 @@ class CustomerHostDiagnostics(CustomerHostData):
 
     Details about the database connection, measurements, units and
     filters to query are properly structured in the input JSON file.
+
+    Setting fetch_workers above one fetches the unit filter queries
+    concurrently, with at most fetch_workers requests in flight, while
+    keeping the measure_pd_dataframes in the query order. Setting
+    batch_queries sends a single query per measurement for all its
+    units, grouped by the filter tags. Setting stream_queries reads the
+    responses in chunks of stream_chunk_size points straight into numpy
+    buffers, instead of loading whole responses as python lists.
+
+    All the queries go through influx_client, a pool of keep-alive gzip
+    connections which can be shared among many hosts, bounded by
+    query_timeout seconds, retried query_retry_amount times and hedged
+    past the query_hedge_percentile latency percentile. A given
+    influx_client keeps its own bounds, so the query arguments cannot be
+    set along with it. The measurements are cached in the columnar
+    MeasurementCache found at cache_path, bounded by cache_byte_budget
+    bytes and cache_entry_ttl seconds, or in a shared measurement_cache.
+
+    Setting sampling_period, e.g. '1m', has the database downsample the
+    series onto that grid with sampling_aggregate (mean, max, last...)
+    and sampling_fill, instead of returning the raw points.
+    Setting incremental_data keeps the raw series of the host in the
+    cache across periods and fetches only the intervals it misses.
+
+    Given a metrics_registry, every fetch and preprocessing stage is
+    measured into it, labelled by customer, host and measurement.
+    Setting fused_alignment pads, resamples, fills, standardizes and
+    joins the measurements in a single pass over one preallocated
+    array, the measure_pd_dataframes becoming column views of the
+    joined dataframe. Setting dataevent_tensor samples the events as a
+    strided view of the joined dataframe, measure_np_dataevent_tensor,
+    with their start timestamps in measure_pd_dataevent_timestamps,
+    instead of the measure_pd_dataevent_samples list of dataframes.
+
+    Calling stream_measurements periodically monitors the host through
+    a StreamingPreprocessor, fetching only the points since the
+    previous call and standardizing them with running statistics, then
+    close once done.
     """
     def __init__(self, customer_name, network_name, data_source_name,
                  database_name, host_name, time_from, time_to,
                  time_zone='Europe/Rome', json_path='',
                  event_minimum_period='15m', local_data=False,
-                 database_queries=False, preprocess_data=False):
+                 database_queries=False, preprocess_data=False,
+                 fetch_workers=1, batch_queries=False,
+                 stream_queries=False, stream_chunk_size=10000,
+                 influx_client=None, cache_path='measurement_cache',
+                 incremental_data=False, cache_byte_budget=None,
+                 cache_entry_ttl=None, measurement_cache=None,
+                 sampling_period=None, sampling_aggregate='mean',
+                 sampling_fill='previous', query_timeout=None,
+                 query_retry_amount=0, query_hedge_percentile=None,
+                 metrics_registry=None, fused_alignment=False,
+                 dataevent_tensor=False):
         CustomerHostData.__init__(self, customer_name, network_name,
                                   data_source_name, database_name, json_path)
         self.host_name = host_name
@@ -263,20 +404,67 @@ class CustomerHostDiagnostics(CustomerHostData):
         self.event_minimum_period = event_minimum_period
         self.lpf_harmonic_amount = 10
         self.database_queries = database_queries
+        self.fetch_workers = fetch_workers
+        self.batch_queries = batch_queries
+        self.stream_queries = stream_queries
+        self.stream_chunk_size = stream_chunk_size
+        self.influx_client = influx_client
+        self.sampling_period = sampling_period
+        self.sampling_aggregate = sampling_aggregate
+        self.sampling_fill = sampling_fill
+        self.metrics_registry = metrics_registry
+        self.fused_alignment = fused_alignment
+        self.dataevent_tensor = dataevent_tensor
+        if self.influx_client and (query_timeout is not None or
+                                   query_retry_amount or
+                                   query_hedge_percentile is not None):
+            raise ValueError('The query arguments cannot be set along with '
+                             'a given influx_client.')
+        self.own_influx_client = not self.influx_client
+        if not self.influx_client:
+            self.influx_client = data_client.InfluxClient(
+                pool_size=max(self.fetch_workers, 1),
+                timeout=query_timeout, retry_amount=query_retry_amount,
+                hedge_percentile=query_hedge_percentile)
         self.measure_pd_dataframes = []
         self.measure_pd_joined_dataframe = pd.DataFrame()
         self.measure_pd_dataevent_samples = []
         self.measure_pd_dataevent_sample_length = 0
+        self.measure_np_dataevent_tensor = None
+        self.measure_pd_dataevent_timestamps = None
+        self.streaming_preprocessor = None
+        self.stream_time_to = None
         # self.measure_pd_dataevent_frequency_samples = []
         # self.measure_pd_dataevent_transposed_samples = []
         # self.measure_pd_dataevent_sample_timestamps = []
+        self.measurement_cache = measurement_cache
+        if not self.measurement_cache:
+            self.measurement_cache = data_cache.MeasurementCache(
+                cache_path, cache_byte_budget, cache_entry_ttl)
         if local_data:
-            self.shelve_measurements(load_shelve=True)
+            self.cache_measurements(load_cache=True)
         else:
-            self.get_measurements()
+            try:
+                if incremental_data:
+                    self.get_incremental_measurements()
+                else:
+                    self.get_measurements()
+            finally:
+                self.close()
             if preprocess_data:
                 self.preprocess_measurements(self.event_minimum_period)
-            self.shelve_measurements()
+            self.cache_measurements()
+
+    def close(self):
+        """
+        close closes the connections and the hedging threads of the
+        influx_client the host created, which are opened again when
+        stream_measurements queries it later. A given influx_client is
+        left to its owner.
+        """
+        if self.own_influx_client:
+            self.influx_client.close()
+        return True
 
     def __repr__(self):
         print_message = 'Customer name: {0}\n'.format(self.customer_name)
@@ -298,15 +486,178 @@ class CustomerHostDiagnostics(CustomerHostData):
         return print_message
 
     def load_measurements(self):
-        for host in self.hosts:
-            if host['host_name'] == self.host_name:
-                self.measurements = host['measurements']
+        self.measurements = self.diagnostics_map.get_map_item(
+            self.customer_name, self.network_name, self.data_source_name,
+            self.database_name, self.host_name).get('measurements', [])
         if not self.measurements:
             raise data_exceptions.DataNotFound(data_name=self.host_name,
                                                source_name='hosts')
         return True
 
-    def get_measurements(self):
+    def get_measurements(self, time_range=None, missing_series=False):
+        if self.batch_queries:
+            measurement_queries = self.get_measurement_batch_queries()
+            get_measurement = functools.partial(
+                self.measure_measurement, 'get_measurement_batch',
+                self.get_measurement_batch, time_range=time_range,
+                missing_series=missing_series)
+        else:
+            measurement_queries = self.get_measurement_queries()
+            get_measurement = functools.partial(
+                self.measure_measurement, 'get_measurement',
+                self.get_measurement, time_range=time_range,
+                missing_series=missing_series)
+        if self.fetch_workers > 1:
+            with ThreadPoolExecutor(
+                    max_workers=self.fetch_workers) as fetch_executor:
+                measure_pd_dataframes = list(fetch_executor.map(
+                    get_measurement, measurement_queries))
+        else:
+            measure_pd_dataframes = [
+                get_measurement(measurement_query)
+                for measurement_query in measurement_queries]
+        if self.batch_queries:
+            measure_pd_dataframes = [
+                measure_pd_dataframe
+                for measure_batch_pd_dataframes in measure_pd_dataframes
+                for measure_pd_dataframe in measure_batch_pd_dataframes]
+        if time_range:
+            return measure_pd_dataframes
+        self.measure_pd_dataframes.extend(measure_pd_dataframes)
+        return True
+
+    def measure_stage(self, stage_name, stage_function, *args,
+                      stage_labels=None, **kwargs):
+        if not self.metrics_registry:
+            return stage_function(*args, **kwargs)
+        host_stage_labels = {'customer_name': self.customer_name,
+                             'host_name': self.host_name}
+        if stage_labels:
+            host_stage_labels.update(stage_labels)
+        return self.metrics_registry.measure(
+            stage_name, stage_function, *args,
+            stage_labels=host_stage_labels, **kwargs)
+
+    def measure_measurement(self, stage_name, get_measurement,
+                            measurement_query, **kwargs):
+        return self.measure_stage(
+            stage_name, get_measurement, measurement_query,
+            stage_labels={'measurement_name': measurement_query[0]},
+            **kwargs)
+
+    def get_incremental_measurements(self):
+        """
+        get_incremental_measurements fetches only the time intervals of
+        the period which are not yet held by the series cache of the
+        host, merges them into it and loads the whole period back from
+        the cache. The missing intervals are queried a microsecond wider
+        on both sides, since the query bounds are exclusive. Given a
+        sampling_period, they are widened instead to the bounds of the
+        buckets they overlap, from a nanosecond before the first bound,
+        which would otherwise open the bucket before it, to the last
+        bound excluded, so that no bucket aggregated over part of its
+        points is merged at a cache seam.
+        """
+        cache_entry_name = self.get_series_cache_entry_name()
+        series_names = [get_measurement_unit_filter_name(*measurement_query)
+                        for measurement_query
+                        in self.get_measurement_queries()]
+        time_interval = get_time_interval(self.time_from, self.time_to,
+                                          self.time_zone)
+        missing_time_intervals = \
+            self.measurement_cache.get_missing_intervals(
+                cache_entry_name, series_names, time_interval)
+        for missing_time_interval in missing_time_intervals:
+            if self.sampling_period:
+                missing_time_interval = [
+                    floor_timestamp(missing_time_interval[0],
+                                    self.sampling_period),
+                    ceil_timestamp(missing_time_interval[1],
+                                   self.sampling_period)]
+                missing_time_range = get_time_range(
+                    [missing_time_interval[0] - 1,
+                     missing_time_interval[1]])
+            else:
+                missing_time_range = get_time_range(
+                    [missing_time_interval[0] - 1000,
+                     missing_time_interval[1] + 1000])
+            measure_pd_dataframes = self.get_measurements(
+                time_range=missing_time_range, missing_series=True)
+            self.measurement_cache.merge_series(
+                cache_entry_name, measure_pd_dataframes,
+                missing_time_interval)
+        for measurement_query, series_name in zip(
+                self.get_measurement_queries(), series_names):
+            measure_pd_dataframe = self.measurement_cache.load_series_range(
+                cache_entry_name, series_name, time_interval)
+            if measure_pd_dataframe.empty:
+                measurement_name, unit_name, measurement_filter = \
+                    measurement_query
+                raise data_exceptions.TimeSeriesMissing(
+                    measurement_name,
+                    unit_name,
+                    "' '".join(get_filter_names(measurement_filter)))
+            self.measure_pd_dataframes.append(measure_pd_dataframe)
+        return True
+
+    def stream_measurements(self, time_to=None, watermark_delay='0s'):
+        """
+        stream_measurements fetches the points of the host from the end
+        of the previous call, or time_from, to time_to, or the time_to
+        of the host, pushes them into the streaming_preprocessor and
+        returns the standardized samples it emits. The first call
+        creates the preprocessor on the sampling_period of the host,
+        or the one of the points fetched, and its watermark_delay. Each
+        following call queries again the last watermark_delay before
+        the end of the previous one, so that the points reaching the
+        database late are still fetched, the preprocessor dropping
+        those fetched twice. Given the sampling_period of the host, each
+        call fetches only the buckets complete by time_to, leaving the
+        last one to the next call, so that no partial aggregate is
+        pushed.
+        """
+        stream_time_from = self.time_from
+        if self.stream_time_to:
+            stream_time_from = str(
+                pd.Timestamp(self.stream_time_to) -
+                pd.to_timedelta(self.streaming_preprocessor.watermark_delay))
+        stream_time_to = time_to if time_to else self.time_to
+        stream_time_interval = get_time_interval(
+            stream_time_from, stream_time_to, self.time_zone)
+        if self.sampling_period:
+            stream_time_range = get_time_range(
+                [floor_timestamp(stream_time_interval[0],
+                                 self.sampling_period) - 1,
+                 floor_timestamp(stream_time_interval[1],
+                                 self.sampling_period)])
+        else:
+            stream_time_range = get_time_range(
+                [stream_time_interval[0] - 1000,
+                 stream_time_interval[1] + 1000])
+        measure_pd_dataframes = self.get_measurements(
+            time_range=stream_time_range, missing_series=True)
+        if not self.streaming_preprocessor:
+            sampling_period = self.sampling_period
+            if not sampling_period:
+                get_sampling_period = \
+                    data_sampler.get_pd_dataframes_down_rounded_sampling_period
+                sampling_period = get_sampling_period(measure_pd_dataframes)
+                if not sampling_period:
+                    return pd.DataFrame()
+                sampling_period = data_sampler.get_sampling_period_string(
+                    sampling_period)
+            self.streaming_preprocessor = \
+                data_streamer.StreamingPreprocessor(sampling_period,
+                                                    watermark_delay)
+        for measure_pd_dataframe in measure_pd_dataframes:
+            self.streaming_preprocessor.push_pd_dataframe(
+                measure_pd_dataframe)
+        self.stream_time_to = stream_time_to
+        return self.measure_stage('stream_measurements',
+                                  self.streaming_preprocessor.emit)
+
+    def get_measurement_queries(self):
+        measurement_queries = []
         for measurement in self.measurements:
             measurement_name = measurement['measurement_name']
             unit_names = measurement['units']
@@ -317,150 +668,311 @@ class CustomerHostDiagnostics(CustomerHostData):
                 unit_filters = UnitFilters(unit_filter_maps)
                 measurement_filters = unit_filters.lists
 
-            measurement_unit_filter_names = []
             for unit_name in unit_names:
                 for measurement_filter in measurement_filters:
-                    if self.data_source_name == 'influx':
-                        source_data = get_influx_data(
-                            self.data_source_ip_port,
-                            self.database_name,
-                            self.host_name,
-                            measurement_name,
-                            unit_name,
-                            self.time_from, self.time_to,
-                            measurement_filter,
-                            self.time_zone,
-                            self.database_queries)
-                    else:
-                        raise data_exceptions.DataSourceUnknown(
-                            self.data_source_name)
-
-                    filter_names = []
-                    for filter_rule in measurement_filter:
-                        filter_name = filter_rule.rsplit(' = ', maxsplit=1)[1]
-                        filter_name = filter_name.strip("'")
-                        filter_names.append(filter_name)
-                    measurement_unit_filter_name = '_'.join(
-                        [measurement_name, unit_name] +
-                        filter_names)
-                    measurement_unit_filter_names.append(
-                        measurement_unit_filter_name)
-
-                    source_np_data = np.array(source_data)
-                    source_np_feature_samples = source_np_data.shape[0]
-                    if source_np_feature_samples != 0:
-                        source_pd_date = pd.to_datetime(source_np_data[:, 0],
-                                                        utc=True)
-                        source_np_values = source_np_data[:, 1:]
-                        source_pd_data = pd.DataFrame(
-                            source_np_values, dtype='float64',
-                            columns=[measurement_unit_filter_name],
-                            index=source_pd_date)
-                    else:
-                        raise data_exceptions.TimeSeriesMissing(
-                            measurement_name,
-                            unit_name,
-                            "' '".join(filter_names))
-                        # influx_pd_data = pd.DataFrame(
-                        #     [], dtype='float64',
-                        #     columns=[measurement_unit_filter_name],
-                        #     index=[])
-                    self.measure_pd_dataframes.append(source_pd_data)
-        return True
+                    measurement_queries.append((measurement_name,
+                                                unit_name,
+                                                measurement_filter))
+        return measurement_queries
 
-    def shelve_measurements(self, load_shelve=False):
-        shelve_filename = ''
-        shelve_filename += '{0}_'.format(self.customer_name)
-        shelve_filename += '{0}_'.format(self.host_name)
-        shelve_filename += '{0}_'.format(self.time_from_code)
-        shelve_filename += '{0}_'.format(self.time_to_code)
-        shelve_filename += '{0}'.format(self.time_zone_code)
-        shelve_message = ''
-        shelve_message += '{0} '.format(shelve_filename)
-        if load_shelve:
-            if os.path.isfile('./{0}.dat'.format(shelve_filename)):
-                shelve_file = shelve.open(shelve_filename)
-                self.measure_pd_dataframes = shelve_file[
-                    'measure_pd_dataframes']
-                self.measure_pd_joined_dataframe = \
-                    shelve_file['measure_pd_joined_dataframe']
-                self.measure_pd_dataevent_samples = \
-                    shelve_file['measure_pd_dataevent_samples']
+    def get_measurement_batch_queries(self):
+        measurement_batch_queries = []
+        for measurement in self.measurements:
+            measurement_name = measurement['measurement_name']
+            unit_names = measurement['units']
+            measurement_filters = [[]]
+
+            if 'filters' in measurement:
+                unit_filter_maps = measurement['filters']
+                unit_filters = UnitFilters(unit_filter_maps)
+                measurement_filters = unit_filters.lists
+
+            measurement_batch_queries.append((measurement_name,
+                                              unit_names,
+                                              measurement_filters))
+        return measurement_batch_queries
+
+    def get_measurement(self, measurement_query, time_range=None,
+                        missing_series=False):
+        measurement_name, unit_name, measurement_filter = measurement_query
+        time_from, time_to = time_range if time_range else \
+            (self.time_from, self.time_to)
+        if self.data_source_name == 'influx' and self.stream_queries:
+            source_series = get_influx_stream_series(
+                self.data_source_ip_port,
+                self.database_name,
+                self.host_name,
+                measurement_name,
+                unit_name,
+                time_from, time_to,
+                measurement_filter,
+                self.time_zone,
+                self.database_queries,
+                chunk_size=self.stream_chunk_size,
+                influx_client=self.influx_client,
+                sampling_period=self.sampling_period,
+                sampling_aggregate=self.sampling_aggregate,
+                sampling_fill=self.sampling_fill)
+            source_np_timestamps, source_np_values = \
+                get_influx_stream_series_data(source_series, unit_name, {})
+        elif self.data_source_name == 'influx':
+            source_data = get_influx_data(
+                self.data_source_ip_port,
+                self.database_name,
+                self.host_name,
+                measurement_name,
+                unit_name,
+                time_from, time_to,
+                measurement_filter,
+                self.time_zone,
+                self.database_queries,
+                epoch='ms',
+                influx_client=self.influx_client,
+                sampling_period=self.sampling_period,
+                sampling_aggregate=self.sampling_aggregate,
+                sampling_fill=self.sampling_fill)
+            source_np_timestamps, source_np_values = get_influx_columns(
+                source_data)
+        else:
+            raise data_exceptions.DataSourceUnknown(
+                self.data_source_name)
+        return get_measurement_pd_dataframe(source_np_timestamps,
+                                            source_np_values,
+                                            measurement_name, unit_name,
+                                            measurement_filter,
+                                            missing_series)
+
+    def get_measurement_batch(self, measurement_batch_query, time_range=None,
+                              missing_series=False):
+        """
+        get_measurement_batch fetches all the units and unit filters of
+        a measurement grouping the series by the filter tags instead of
+        querying each filter combination, a single query for each set
+        of filter tags, and splits the responses back into one
+        dataframe per unit filter in the same order of
+        get_measurement_queries.
+        """
+        measurement_name, unit_names, measurement_filters = \
+            measurement_batch_query
+        time_from, time_to = time_range if time_range else \
+            (self.time_from, self.time_to)
+        filter_source_series = [None] * len(measurement_filters)
+        for filter_tag_group in get_filter_tag_groups(measurement_filters):
+            filter_tag_names, filter_tag_rules = get_filter_tag_rules(
+                [measurement_filters[filter_number]
+                 for filter_number in filter_tag_group])
+            source_series = self.get_measurement_batch_series(
+                measurement_name, unit_names, time_from, time_to,
+                filter_tag_names, filter_tag_rules)
+            for filter_number in filter_tag_group:
+                filter_source_series[filter_number] = source_series
+
+        measure_pd_dataframes = []
+        for unit_name in unit_names:
+            for measurement_filter, source_series in zip(
+                    measurement_filters, filter_source_series):
+                filter_tags = get_filter_tags(measurement_filter)
+                if self.stream_queries:
+                    source_np_timestamps, source_np_values = \
+                        get_influx_stream_series_data(
+                            source_series, unit_name, filter_tags)
+                else:
+                    source_np_timestamps, source_np_values = \
+                        get_influx_series_data(
+                            source_series, unit_name, filter_tags)
+                measure_pd_dataframes.append(get_measurement_pd_dataframe(
+                    source_np_timestamps, source_np_values,
+                    measurement_name, unit_name, measurement_filter,
+                    missing_series))
+        return measure_pd_dataframes
+
+    def get_measurement_batch_series(self, measurement_name, unit_names,
+                                     time_from, time_to, filter_tag_names,
+                                     filter_tag_rules):
+        if self.data_source_name == 'influx' and self.stream_queries:
+            source_series = get_influx_stream_series(
+                self.data_source_ip_port,
+                self.database_name,
+                self.host_name,
+                measurement_name,
+                unit_names,
+                time_from, time_to,
+                filter_tag_rules,
+                self.time_zone,
+                self.database_queries,
+                group_by_tags=filter_tag_names,
+                chunk_size=self.stream_chunk_size,
+                influx_client=self.influx_client,
+                sampling_period=self.sampling_period,
+                sampling_aggregate=self.sampling_aggregate,
+                sampling_fill=self.sampling_fill)
+        elif self.data_source_name == 'influx':
+            source_series = get_influx_series(
+                self.data_source_ip_port,
+                self.database_name,
+                self.host_name,
+                measurement_name,
+                unit_names,
+                time_from, time_to,
+                filter_tag_rules,
+                self.time_zone,
+                self.database_queries,
+                group_by_tags=filter_tag_names,
+                epoch='ms',
+                influx_client=self.influx_client,
+                sampling_period=self.sampling_period,
+                sampling_aggregate=self.sampling_aggregate,
+                sampling_fill=self.sampling_fill)
+        else:
+            raise data_exceptions.DataSourceUnknown(
+                self.data_source_name)
+        return source_series
+
+    def get_cache_entry_name(self):
+        cache_entry_name = ''
+        cache_entry_name += '{0}_'.format(self.customer_name)
+        cache_entry_name += '{0}_'.format(self.host_name)
+        cache_entry_name += '{0}_'.format(self.time_from_code)
+        cache_entry_name += '{0}_'.format(self.time_to_code)
+        cache_entry_name += '{0}'.format(self.time_zone_code)
+        cache_entry_name += self.get_sampling_code()
+        return cache_entry_name
+
+    def get_series_cache_entry_name(self):
+        series_cache_entry_name = ''
+        series_cache_entry_name += '{0}_'.format(self.customer_name)
+        series_cache_entry_name += '{0}_'.format(self.host_name)
+        series_cache_entry_name += 'series'
+        series_cache_entry_name += self.get_sampling_code()
+        return series_cache_entry_name
+
+    def get_sampling_code(self):
+        sampling_code = ''
+        if self.sampling_period:
+            sampling_code += '_{0}{1}{2}'.format(self.sampling_period,
+                                                 self.sampling_aggregate,
+                                                 self.sampling_fill)
+        return sampling_code
+
+    def cache_measurements(self, load_cache=False):
+        cache_entry_name = self.get_cache_entry_name()
+        cache_message = ''
+        cache_message += '{0} '.format(cache_entry_name)
+        if load_cache:
+            if self.measurement_cache.lookup_entry(cache_entry_name):
+                self.measure_pd_dataframes, \
+                    self.measure_pd_joined_dataframe, \
+                    cache_metadata = self.measurement_cache.load_entry(
+                        cache_entry_name)
                 self.measure_pd_dataevent_sample_length = \
-                    shelve_file['measure_pd_dataevent_sample_length']
-                # self.measure_pd_dataevent_frequency_samples = \
-                #     shelve_file['measure_pd_dataevent_frequency_samples']
-                # self.measure_pd_dataevent_transposed_samples = \
-                #     shelve_file['measure_pd_dataevent_transposed_samples']
-                # self.measure_pd_dataevent_sample_timestamps = \
-                #     shelve_file['measure_pd_dataevent_sample_timestamps']
-                shelve_file.close()
-                shelve_message += 'has been LOADED from the shelve file.'
+                    cache_metadata['measure_pd_dataevent_sample_length']
+                if self.measure_pd_dataevent_sample_length:
+                    self.sample_measurements(
+                        cache_metadata['event_minimum_period'])
+                cache_message += 'has been LOADED from the cache.'
             else:
-                shelve_message += 'has NOT been found.'
+                cache_message += 'has NOT been found.'
         else:
-            shelve_file = shelve.open(shelve_filename)
-            shelve_file['customer_name'] = self.customer_name
-            shelve_file['network_name'] = self.network_name
-            shelve_file['data_source_name'] = self.data_source_name
-            shelve_file['data_source_ip_port'] = self.data_source_ip_port
-            shelve_file['database_name'] = self.database_name
-            shelve_file['host_name'] = self.host_name
-            shelve_file['time_from'] = self.time_from
-            shelve_file['time_to'] = self.time_to
-            shelve_file['time_zone_code'] = self.time_zone_code
-            shelve_file['measure_pd_dataframes'] = self.measure_pd_dataframes
-            shelve_file['measure_pd_joined_dataframe'] = \
-                self.measure_pd_joined_dataframe
-            shelve_file['measure_pd_dataevent_samples'] = \
-                self.measure_pd_dataevent_samples
-            shelve_file['measure_pd_dataevent_sample_length'] = \
-                self.measure_pd_dataevent_sample_length
-            # shelve_file['measure_pd_dataevent_frequency_samples'] = \
-            #     self.measure_pd_dataevent_frequency_samples
-            # shelve_file['measure_pd_dataevent_transposed_samples'] = \
-            #     self.measure_pd_dataevent_transposed_samples
-            # shelve_file['measure_pd_dataevent_sample_timestamps'] = \
-            #     self.measure_pd_dataevent_sample_timestamps
-            shelve_file.close()
-            shelve_message += 'has been SAVED in the shelve file.'
-        print(shelve_message)
+            cache_metadata = {
+                'customer_name': self.customer_name,
+                'network_name': self.network_name,
+                'data_source_name': self.data_source_name,
+                'data_source_ip_port': self.data_source_ip_port,
+                'database_name': self.database_name,
+                'host_name': self.host_name,
+                'time_from': self.time_from,
+                'time_to': self.time_to,
+                'time_zone_code': self.time_zone_code,
+                'event_minimum_period': self.event_minimum_period,
+                'measure_pd_dataevent_sample_length':
+                    self.measure_pd_dataevent_sample_length}
+            self.measurement_cache.save_entry(
+                cache_entry_name, self.measure_pd_dataframes,
+                self.measure_pd_joined_dataframe, cache_metadata)
+            cache_message += 'has been SAVED in the cache.'
+        print(cache_message)
+        return True
+
+    def load_cached_series(self, series_name):
+        return self.measurement_cache.load_series(
+            self.get_cache_entry_name(), series_name)
+
+    def align_measurements(self, verbose=False):
+        measure_pd_dataframes = [
+            measure_pd_dataframe
+            for measure_pd_dataframe in self.measure_pd_dataframes
+            if not measure_pd_dataframe.empty]
+        self.measure_pd_joined_dataframe = self.measure_stage(
+            'align_pd_dataframes', data_sampler.align_pd_dataframes,
+            measure_pd_dataframes, self.time_from, self.time_to,
+            self.time_zone)
+        column_ends = np.cumsum([measure_pd_dataframe.shape[1]
+                                 for measure_pd_dataframe
+                                 in measure_pd_dataframes])
+        self.measure_pd_dataframes = [
+            self.measure_pd_joined_dataframe.iloc[:, column_start:column_end]
+            for column_start, column_end
+            in zip(np.concatenate([[0], column_ends[:-1]]), column_ends)]
+        if verbose:
+            print('Data sampler | align_pd_dataframes DONE.')
+        return True
+
+    def sample_measurements(self, event_minimum_period):
+        if self.dataevent_tensor:
+            self.measure_np_dataevent_tensor, \
+                self.measure_pd_dataevent_timestamps, \
+                self.measure_pd_dataevent_sample_length = \
+                self.measure_stage(
+                    'sample_dataevent_tensor',
+                    data_sampler.sample_dataevent_tensor,
+                    self.measure_pd_joined_dataframe, event_minimum_period)
+        else:
+            self.measure_pd_dataevent_samples, \
+                self.measure_pd_dataevent_sample_length = \
+                self.measure_stage(
+                    'sample_dataevents', data_sampler.sample_dataevents,
+                    self.measure_pd_joined_dataframe, event_minimum_period)
         return True
 
     def preprocess_measurements(self, verbose=False):
         if self.measure_pd_dataframes:
-            self.measure_pd_dataframes = data_sampler.pad_pd_dataframes(
-                self.measure_pd_dataframes, self.time_from, self.time_to,
-                self.time_zone)
-            if verbose:
-                print('Data sampler | pad_pd_dataframes DONE.')
-
-            self.measure_pd_dataframes = data_sampler.resample_pd_dataframes(
-                self.measure_pd_dataframes)
-            if verbose:
-                print('Data sampler | resample_pd_dataframes DONE.')
+            if self.fused_alignment:
+                self.align_measurements(verbose)
+            else:
+                self.measure_pd_dataframes = self.measure_stage(
+                    'pad_pd_dataframes', data_sampler.pad_pd_dataframes,
+                    self.measure_pd_dataframes, self.time_from, self.time_to,
+                    self.time_zone)
+                if verbose:
+                    print('Data sampler | pad_pd_dataframes DONE.')
+
+                self.measure_pd_dataframes = self.measure_stage(
+                    'resample_pd_dataframes',
+                    data_sampler.resample_pd_dataframes,
+                    self.measure_pd_dataframes)
+                if verbose:
+                    print('Data sampler | resample_pd_dataframes DONE.')
 
-            self.measure_pd_dataframes = data_sampler.fill_pd_dataframes(
-                self.measure_pd_dataframes)
-            if verbose:
-                print('Data sampler | fill_pd_dataframes DONE.')
+                self.measure_pd_dataframes = self.measure_stage(
+                    'fill_pd_dataframes', data_sampler.fill_pd_dataframes,
+                    self.measure_pd_dataframes)
+                if verbose:
+                    print('Data sampler | fill_pd_dataframes DONE.')
 
-            self.measure_pd_dataframes = \
-                data_sampler.standardize_pd_dataframes(
+                self.measure_pd_dataframes = self.measure_stage(
+                    'standardize_pd_dataframes',
+                    data_sampler.standardize_pd_dataframes,
                     self.measure_pd_dataframes)
-            if verbose:
-                print('Data sampler | standardize_pd_dataframes DONE.')
+                if verbose:
+                    print('Data sampler | standardize_pd_dataframes DONE.')
 
-            self.measure_pd_joined_dataframe = data_sampler.join_pd_dataframes(
-                self.measure_pd_dataframes)
-            if verbose:
-                print('Data sampler | join_pd_dataframes DONE.')
+                self.measure_pd_joined_dataframe = self.measure_stage(
+                    'join_pd_dataframes', data_sampler.join_pd_dataframes,
+                    self.measure_pd_dataframes)
+                if verbose:
+                    print('Data sampler | join_pd_dataframes DONE.')
 
-            self.measure_pd_dataevent_samples, \
-                self.measure_pd_dataevent_sample_length = \
-                data_sampler.sample_dataevents(
-                    self.measure_pd_joined_dataframe,
-                    self.event_minimum_period)
+            self.sample_measurements(self.event_minimum_period)
             if verbose:
                 print('Data sampler | sample_dataevents DONE.')
 
@@ -519,6 +1031,81 @@ class UnitFilters:
         return filters
 
 
+class InfluxSeriesBuffer:
+    """
+    InfluxSeriesBuffer collects the chunks of a streamed series into
+    numpy buffers of epoch timestamps and float values, growing them by
+    doubling so that the memory stays proportional to the final arrays.
+    """
+    def __init__(self, columns, tags=None, buffer_size=10000):
+        self.columns = columns
+        self.tags = tags if tags else {}
+        self.size = 0
+        self.np_timestamps = np.empty(buffer_size, dtype='int64')
+        self.np_values = np.empty((buffer_size, len(columns) - 1),
+                                  dtype='float64')
+
+    def __repr__(self):
+        print_message = 'Columns: {0}\n'.format(self.columns)
+        print_message += 'Tags: {0}\n'.format(self.tags)
+        print_message += 'Size: {0}\n'.format(self.size)
+        return print_message
+
+    def append(self, influx_values):
+        influx_chunk_size = len(influx_values)
+        if not influx_chunk_size:
+            return False
+        buffer_size = self.size + influx_chunk_size
+        if buffer_size > self.np_timestamps.size:
+            self.grow(buffer_size)
+        np_chunk_timestamps, np_chunk_values = get_influx_columns(
+            influx_values)
+        self.np_timestamps[self.size:buffer_size] = np_chunk_timestamps
+        self.np_values[self.size:buffer_size] = np_chunk_values
+        self.size = buffer_size
+        return True
+
+    def grow(self, minimum_buffer_size):
+        buffer_size = max(minimum_buffer_size, 2 * self.np_timestamps.size)
+        np_timestamps = np.empty(buffer_size, dtype='int64')
+        np_timestamps[:self.size] = self.np_timestamps[:self.size]
+        np_values = np.empty((buffer_size, self.np_values.shape[1]),
+                             dtype='float64')
+        np_values[:self.size] = self.np_values[:self.size]
+        self.np_timestamps = np_timestamps
+        self.np_values = np_values
+        return True
+
+    def get_unit_data(self, unit_name):
+        unit_index = self.columns.index(unit_name) - 1
+        np_timestamps = self.np_timestamps[:self.size]
+        np_values = self.np_values[:self.size, unit_index]
+        np_valid_values = ~np.isnan(np_values)
+        return np_timestamps[np_valid_values], np_values[np_valid_values]
+
+
+def get_file_mtime(file_path):
+    try:
+        return os.stat(file_path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def get_diagnostics_map(json_path):
+    """
+    get_diagnostics_map shares a single DiagnosticsMap per JSON path
+    among all the customer data objects, loading it again only when the
+    modification time of the file changes.
+    """
+    json_abspath = os.path.abspath(json_path)
+    with diagnostics_maps_lock:
+        diagnostics_map = diagnostics_maps.get(json_abspath)
+        if diagnostics_map is None or diagnostics_map.is_outdated():
+            diagnostics_map = DiagnosticsMap(json_path)
+            diagnostics_maps[json_abspath] = diagnostics_map
+    return diagnostics_map
+
+
 def load_json(file_path):
     try:
         json_file = open(file_path)
@@ -533,16 +1120,151 @@ def load_json(file_path):
     return json_object
 
 
-def get_influx_data(influx_ip_port, database_name, host_name,
-                    measurement_name, unit_names, time_from, time_to,
-                    unit_filter, time_zone='Europe/Rome',
-                    print_influx_query_request=False):
-    influx_base_url = 'http://{}/query'.format(influx_ip_port)
+def get_filter_names(unit_filter):
+    filter_names = []
+    for filter_rule in unit_filter:
+        filter_name = filter_rule.rsplit(' = ', maxsplit=1)[1]
+        filter_name = filter_name.strip("'")
+        filter_names.append(filter_name)
+    return filter_names
+
+
+def get_filter_tags(unit_filter):
+    filter_tags = {}
+    for filter_rule in unit_filter:
+        filter_tag, filter_name = filter_rule.split(' = ', maxsplit=1)
+        filter_tags[filter_tag] = filter_name.strip("'")
+    return filter_tags
+
+
+def get_filter_tag_groups(unit_filters):
+    """
+    get_filter_tag_groups groups the numbers of the filter lists of a
+    measurement by their set of filter tags, since the series of filter
+    lists on different tags can not be matched by one grouped query.
+    """
+    filter_tag_groups = {}
+    for filter_number, unit_filter in enumerate(unit_filters):
+        filter_tag_set = tuple(sorted(get_filter_tags(unit_filter)))
+        filter_tag_groups.setdefault(filter_tag_set, []).append(
+            filter_number)
+    return list(filter_tag_groups.values())
+
+
+def get_filter_tag_rules(unit_filters):
+    """
+    get_filter_tag_rules turns the filter lists of a measurement into
+    the tag names to group by and the where rules matching any of their
+    values, in place of one query per filter combination.
+    """
+    filter_tag_values = {}
+    for unit_filter in unit_filters:
+        for filter_tag, filter_name in get_filter_tags(unit_filter).items():
+            filter_names = filter_tag_values.setdefault(filter_tag, [])
+            if filter_name not in filter_names:
+                filter_names.append(filter_name)
+    filter_tag_rules = []
+    for filter_tag, filter_names in filter_tag_values.items():
+        filter_tag_rule = ' OR '.join(["{} = '{}'".format(filter_tag,
+                                                          filter_name)
+                                       for filter_name in filter_names])
+        filter_tag_rules.append('({})'.format(filter_tag_rule))
+    return list(filter_tag_values), filter_tag_rules
+
+
+def get_influx_columns(influx_data):
+    """
+    get_influx_columns converts the rows of a response queried with
+    epoch timestamps into an int64 timestamp column and a float64 value
+    array in a single numpy pass, turning the missing values into NaN.
+    """
+    if not len(influx_data):
+        return np.empty(0, dtype='int64'), np.empty((0, 1), dtype='float64')
+    influx_np_data = np.array(influx_data, dtype='float64')
+    np_timestamps = influx_np_data[:, 0].astype('int64')
+    np_values = influx_np_data[:, 1:]
+    return np_timestamps, np_values
+
+
+def get_pd_datetime_index(np_timestamps, epoch='ms'):
+    np_datetimes = np_timestamps.astype('datetime64[{}]'.format(epoch))
+    pd_datetime_index = pd.DatetimeIndex(
+        np_datetimes.astype('datetime64[ns]')).tz_localize('UTC')
+    return pd_datetime_index
+
+
+def get_measurement_unit_filter_name(measurement_name, unit_name,
+                                     measurement_filter):
+    filter_names = get_filter_names(measurement_filter)
+    measurement_unit_filter_name = '_'.join(
+        [measurement_name, unit_name] +
+        filter_names)
+    return measurement_unit_filter_name
+
+
+def get_measurement_pd_dataframe(np_timestamps, np_values, measurement_name,
+                                 unit_name, measurement_filter,
+                                 missing_series=False):
+    measurement_unit_filter_name = get_measurement_unit_filter_name(
+        measurement_name, unit_name, measurement_filter)
+    if np_timestamps.size != 0 or missing_series:
+        source_pd_date = get_pd_datetime_index(np_timestamps)
+        source_pd_data = pd.DataFrame(
+            np_values.reshape(np_timestamps.size, 1), dtype='float64',
+            columns=[measurement_unit_filter_name],
+            index=source_pd_date)
+    else:
+        raise data_exceptions.TimeSeriesMissing(
+            measurement_name,
+            unit_name,
+            "' '".join(get_filter_names(measurement_filter)))
+    return source_pd_data
+
+
+def get_time_interval(time_from, time_to, time_zone='Europe/Rome'):
+    time_interval = [pd.Timestamp(time_from, tz=time_zone).value,
+                     pd.Timestamp(time_to, tz=time_zone).value]
+    return time_interval
+
+
+def floor_timestamp(timestamp, sampling_period):
+    sampling_period_ns = pd.to_timedelta(sampling_period).value
+    return timestamp // sampling_period_ns * sampling_period_ns
+
+
+def ceil_timestamp(timestamp, sampling_period):
+    sampling_period_ns = pd.to_timedelta(sampling_period).value
+    return -(-timestamp // sampling_period_ns) * sampling_period_ns
+
+
+def get_time_range(time_interval):
+    time_range = ['{0}.{1:09d}Z'.format(
+        pd.Timestamp(time_value, tz='UTC').strftime('%Y-%m-%dT%H:%M:%S'),
+        time_value % 1000000000) for time_value in time_interval]
+    return time_range
+
+
+def get_influx_query(database_name, host_name, measurement_name,
+                     unit_names, time_from, time_to, unit_filter,
+                     time_zone='Europe/Rome', group_by_tags=None,
+                     sampling_period=None, sampling_aggregate='mean',
+                     sampling_fill='previous'):
+    """
+    get_influx_query builds the query of the unit_names series. Given a
+    sampling_period, the series are downsampled by the database with
+    the sampling_aggregate function over GROUP BY time() buckets, the
+    empty ones being filled as sampling_fill.
+    """
     influx_query_list = []
     influx_query_units = 'SELECT '
     if isinstance(unit_names, str):
         unit_names = [unit_names]
-    influx_query_units += '"{}"'.format('", "'.join(unit_names))
+    if sampling_period:
+        influx_query_units += ', '.join(
+            ['{0}("{1}") AS "{1}"'.format(sampling_aggregate, unit_name)
+             for unit_name in unit_names])
+    else:
+        influx_query_units += '"{}"'.format('", "'.join(unit_names))
     influx_query_list.append(influx_query_units)
     influx_query_measurement = 'FROM {}'.format(measurement_name)
     influx_query_list.append(influx_query_measurement)
@@ -554,19 +1276,86 @@ def get_influx_data(influx_ip_port, database_name, host_name,
         influx_query_filters += ' AND '
         influx_query_filters += ' AND '.join(unit_filter)
     influx_query_list.append(influx_query_filters)
+    influx_query_group_by_list = []
+    if sampling_period:
+        influx_query_group_by_list.append('time({})'.format(sampling_period))
+    if group_by_tags:
+        influx_query_group_by_list.append('"{}"'.format(
+            '", "'.join(group_by_tags)))
+    if influx_query_group_by_list:
+        influx_query_group_by = 'GROUP BY {}'.format(
+            ', '.join(influx_query_group_by_list))
+        influx_query_list.append(influx_query_group_by)
+    if sampling_period:
+        influx_query_fill = 'fill({})'.format(sampling_fill)
+        influx_query_list.append(influx_query_fill)
     influx_query_time_order = 'ORDER BY time DESC'
     influx_query_list.append(influx_query_time_order)
     influx_query_time_zone = "tz('{}')".format(time_zone)
     influx_query_list.append(influx_query_time_zone)
     influx_query = ' '.join(influx_query_list)
+    return influx_query
+
+
+def open_influx_response(influx_ip_port, database_name, influx_query,
+                         print_influx_query_request=False,
+                         influx_query_options=None, influx_client=None):
+    influx_base_url = 'http://{}/query'.format(influx_ip_port)
     if print_influx_query_request:
         print(influx_query)
-    influx_query_url = urlparse.urlencode({'q': influx_query,
-                                           'db': database_name})
+    influx_query_parameters = {'q': influx_query, 'db': database_name}
+    if influx_query_options:
+        influx_query_parameters.update(influx_query_options)
+    influx_query_url = urlparse.urlencode(influx_query_parameters)
     influx_request = '{0}?{1}'.format(influx_base_url, influx_query_url)
     if print_influx_query_request:
         print(influx_request)
-    influx_response = json.load(urlrequest.urlopen(influx_request))
+    if influx_client:
+        return influx_client.query_stream(
+            influx_ip_port, '/query?{0}'.format(influx_query_url))
+    return urlrequest.urlopen(influx_request)
+
+
+def get_influx_response(influx_ip_port, database_name, influx_query,
+                        print_influx_query_request=False, epoch=None,
+                        influx_client=None):
+    influx_query_options = {}
+    if epoch:
+        influx_query_options['epoch'] = epoch
+    if influx_client:
+        influx_query_parameters = {'q': influx_query, 'db': database_name}
+        influx_query_parameters.update(influx_query_options)
+        influx_query_url = urlparse.urlencode(influx_query_parameters)
+        if print_influx_query_request:
+            print(influx_query)
+        influx_response = json.loads(influx_client.query(
+            influx_ip_port, '/query?{0}'.format(influx_query_url)))
+        return influx_response
+    influx_response_file = open_influx_response(
+        influx_ip_port, database_name, influx_query,
+        print_influx_query_request, influx_query_options)
+    try:
+        influx_response = json.load(influx_response_file)
+    finally:
+        influx_response_file.close()
+    return influx_response
+
+
+def get_influx_data(influx_ip_port, database_name, host_name,
+                    measurement_name, unit_names, time_from, time_to,
+                    unit_filter, time_zone='Europe/Rome',
+                    print_influx_query_request=False, epoch=None,
+                    influx_client=None, sampling_period=None,
+                    sampling_aggregate='mean', sampling_fill='previous'):
+    influx_query = get_influx_query(database_name, host_name,
+                                    measurement_name, unit_names,
+                                    time_from, time_to, unit_filter,
+                                    time_zone, None, sampling_period,
+                                    sampling_aggregate, sampling_fill)
+    influx_response = get_influx_response(influx_ip_port, database_name,
+                                          influx_query,
+                                          print_influx_query_request, epoch,
+                                          influx_client)
     influx_data = []
     if 'series' in influx_response['results'][0]:
         if 'values' in influx_response['results'][0]['series'][0]:
@@ -574,21 +1363,241 @@ def get_influx_data(influx_ip_port, database_name, host_name,
     return influx_data
 
 
-def set_to_numpy_datetimes(influx_data):
-    for influx_data_row in influx_data:
-        influx_datetime = dateparse.parse(influx_data_row[0], ignoretz=True)
-        influx_datetime_format = '{}'.format(influx_datetime.isoformat(
-            timespec='milliseconds'))
-        np_datetime = np.datetime64(influx_datetime_format, 'ms')
-        influx_data_row[0] = np_datetime
-    return influx_data
+def get_influx_series(influx_ip_port, database_name, host_name,
+                      measurement_name, unit_names, time_from, time_to,
+                      unit_filter, time_zone='Europe/Rome',
+                      print_influx_query_request=False, group_by_tags=None,
+                      epoch=None, influx_client=None, sampling_period=None,
+                      sampling_aggregate='mean', sampling_fill='previous'):
+    influx_query = get_influx_query(database_name, host_name,
+                                    measurement_name, unit_names,
+                                    time_from, time_to, unit_filter,
+                                    time_zone, group_by_tags,
+                                    sampling_period, sampling_aggregate,
+                                    sampling_fill)
+    influx_response = get_influx_response(influx_ip_port, database_name,
+                                          influx_query,
+                                          print_influx_query_request, epoch,
+                                          influx_client)
+    influx_series = []
+    if 'series' in influx_response['results'][0]:
+        influx_series = influx_response['results'][0]['series']
+    return influx_series
 
 
-def set_to_pandas_datetimes(influx_data):
-    for influx_data_row in influx_data:
-        pd_datetime = pd.to_datetime(influx_data_row[0])
-        influx_data_row[0] = pd_datetime
-    return influx_data
+def get_influx_series_data(influx_series, unit_name, filter_tags):
+    """
+    get_influx_series_data picks the epoch timestamps and unit values of
+    the series tagged as filter_tags out of a multi unit, multi series
+    response, skipping the rows where the unit has no value.
+    """
+    np_timestamps = np.empty(0, dtype='int64')
+    np_values = np.empty(0, dtype='float64')
+    for influx_series_item in influx_series:
+        influx_series_tags = influx_series_item.get('tags', {})
+        if all(influx_series_tags.get(filter_tag) == filter_name
+               for filter_tag, filter_name in filter_tags.items()):
+            if 'values' in influx_series_item:
+                unit_index = influx_series_item['columns'].index(unit_name)
+                np_timestamps, np_values = get_influx_columns(
+                    influx_series_item['values'])
+                np_values = np_values[:, unit_index - 1]
+                np_valid_values = ~np.isnan(np_values)
+                np_timestamps = np_timestamps[np_valid_values]
+                np_values = np_values[np_valid_values]
+            break
+    return np_timestamps, np_values
+
+
+def get_influx_stream_series(influx_ip_port, database_name, host_name,
+                             measurement_name, unit_names, time_from,
+                             time_to, unit_filter, time_zone='Europe/Rome',
+                             print_influx_query_request=False,
+                             group_by_tags=None, chunk_size=10000,
+                             influx_client=None, sampling_period=None,
+                             sampling_aggregate='mean',
+                             sampling_fill='previous'):
+    """
+    get_influx_stream_series requests a chunked response with epoch
+    millisecond timestamps and parses it chunk by chunk into one
+    InfluxSeriesBuffer per series, so that only a single chunk is ever
+    held as python lists.
+    """
+    influx_query = get_influx_query(database_name, host_name,
+                                    measurement_name, unit_names,
+                                    time_from, time_to, unit_filter,
+                                    time_zone, group_by_tags,
+                                    sampling_period, sampling_aggregate,
+                                    sampling_fill)
+    influx_query_options = {'chunked': 'true',
+                            'chunk_size': chunk_size,
+                            'epoch': 'ms'}
+    influx_response = open_influx_response(influx_ip_port, database_name,
+                                           influx_query,
+                                           print_influx_query_request,
+                                           influx_query_options,
+                                           influx_client)
+    influx_series_buffers = {}
+    try:
+        for influx_chunk in influx_response:
+            if not influx_chunk.strip():
+                continue
+            influx_chunk_result = json.loads(influx_chunk)['results'][0]
+            for influx_series_item in influx_chunk_result.get('series', []):
+                influx_series_tags = influx_series_item.get('tags', {})
+                influx_series_key = tuple(sorted(influx_series_tags.items()))
+                if influx_series_key not in influx_series_buffers:
+                    influx_series_buffers[influx_series_key] = \
+                        InfluxSeriesBuffer(influx_series_item['columns'],
+                                           influx_series_tags, chunk_size)
+                influx_series_buffers[influx_series_key].append(
+                    influx_series_item.get('values', []))
+    finally:
+        influx_response.close()
+    return list(influx_series_buffers.values())
+
+
+def get_influx_stream_series_data(influx_series_buffers, unit_name,
+                                  filter_tags):
+    np_timestamps = np.empty(0, dtype='int64')
+    np_values = np.empty(0, dtype='float64')
+    for influx_series_buffer in influx_series_buffers:
+        if all(influx_series_buffer.tags.get(filter_tag) == filter_name
+               for filter_tag, filter_name in filter_tags.items()):
+            np_timestamps, np_values = influx_series_buffer.get_unit_data(
+                unit_name)
+            break
+    return np_timestamps, np_values
+
+
+def set_to_numpy_datetimes(influx_data, time_zone):
+    """
+    set_to_numpy_datetimes returns the rows of influx_data with their
+    timestamps as naive millisecond numpy datetimes, on the wall clock
+    of time_zone, the one the results were queried in. The rows are
+    new lists, influx_data is left as it is.
+    """
+    influx_datetimes = pd.to_datetime([influx_data_row[0]
+                                       for influx_data_row in influx_data],
+                                      utc=True)
+    influx_datetimes = influx_datetimes.tz_convert(time_zone).tz_localize(
+        None)
+    np_datetimes = influx_datetimes.values.astype('datetime64[ms]')
+    return set_influx_data_datetimes(influx_data, list(np_datetimes))
+
+
+def set_to_pandas_datetimes(influx_data, time_zone):
+    """
+    set_to_pandas_datetimes returns the rows of influx_data with their
+    timestamps as pandas Timestamps in time_zone. The rows are new
+    lists, influx_data is left as it is.
+    """
+    pd_datetimes = pd.to_datetime([influx_data_row[0]
+                                   for influx_data_row in influx_data],
+                                  utc=True)
+    pd_datetimes = pd_datetimes.tz_convert(time_zone)
+    return set_influx_data_datetimes(influx_data, list(pd_datetimes))
+
+
+def set_influx_data_datetimes(influx_data, influx_datetimes):
+    if not influx_data:
+        return influx_data
+    np_influx_data = np.empty((len(influx_data), len(influx_data[0])),
+                              dtype=object)
+    np_influx_data[:] = influx_data
+    np_influx_data[:, 0] = influx_datetimes
+    return np_influx_data.tolist()
+
+
+def run_host_diagnostics(host_path, time_from, time_to,
+                         diagnostics_options=None):
+    if not diagnostics_options:
+        diagnostics_options = {}
+    host_status = dict(zip(['customer_name', 'network_name',
+                            'data_source_name', 'database_name',
+                            'host_name'], host_path))
+    diagnostics_options = dict(diagnostics_options)
+    metrics_trace_memory = diagnostics_options.pop('metrics_trace_memory',
+                                                   None)
+    if metrics_trace_memory is not None:
+        diagnostics_options['metrics_registry'] = \
+            data_metrics.MetricsRegistry(trace_memory=metrics_trace_memory)
+    time_start = time.perf_counter()
+    try:
+        CustomerHostDiagnostics(*host_path, time_from, time_to,
+                                **diagnostics_options)
+        host_status['status'] = 'DONE'
+        host_status['error'] = ''
+    except Exception as host_exception:
+        host_status['status'] = 'FAILED'
+        host_status['error'] = '{0}: {1}'.format(
+            type(host_exception).__name__, host_exception)
+    host_status['seconds'] = time.perf_counter() - time_start
+    if metrics_trace_memory is not None:
+        host_status['metrics_records'] = \
+            diagnostics_options['metrics_registry'].get_records()
+    return host_status
+
+
+def run_fleet_diagnostics(time_from, time_to, json_path='',
+                          customer_name=None, worker_amount=None,
+                          verbose=False, metrics_registry=None,
+                          **diagnostics_options):
+    """
+    run_fleet_diagnostics builds the CustomerHostDiagnostics of every
+    host in the diagnostics map, or of a single customer, over a pool
+    of worker_amount processes, returning the status, error and timing
+    of each host in the order of the map. Given a metrics_registry, the
+    stages measured in the worker processes are recorded into it.
+    """
+    if not json_path:
+        json_path = 'diagnostics_map.json'
+    diagnostics_options['json_path'] = json_path
+    if metrics_registry:
+        diagnostics_options['metrics_trace_memory'] = \
+            metrics_registry.trace_memory
+    host_paths = get_diagnostics_map(json_path).get_host_paths(customer_name)
+    if customer_name and not host_paths:
+        raise data_exceptions.DataNotFound(data_name=customer_name,
+                                           source_name='customers')
+    host_statuses = {}
+    with ProcessPoolExecutor(max_workers=worker_amount) as fleet_executor:
+        host_futures = {}
+        for host_path in host_paths:
+            host_future = fleet_executor.submit(
+                run_host_diagnostics, host_path, time_from, time_to,
+                diagnostics_options)
+            host_futures[host_future] = host_path
+        for host_future in as_completed(host_futures):
+            host_path = host_futures[host_future]
+            try:
+                host_status = host_future.result()
+            except Exception as host_exception:
+                host_status = dict(zip(['customer_name', 'network_name',
+                                        'data_source_name', 'database_name',
+                                        'host_name'], host_path))
+                host_status['status'] = 'FAILED'
+                host_status['error'] = '{0}: {1}'.format(
+                    type(host_exception).__name__, host_exception)
+                host_status['seconds'] = float('nan')
+            for stage_record in host_status.pop('metrics_records', []):
+                metrics_registry.record(stage_record)
+            if verbose:
+                print(get_host_status_message(host_status))
+            host_statuses[host_path] = host_status
+    return [host_statuses[host_path] for host_path in host_paths]
+
+
+def get_host_status_message(host_status):
+    host_status_message = '{0} | '.format(host_status['status'])
+    host_status_message += '{0}/{1}/{2}/{3}/{4} '.format(
+        host_status['customer_name'], host_status['network_name'],
+        host_status['data_source_name'], host_status['database_name'],
+        host_status['host_name'])
+    host_status_message += 'in {0:.2f}s'.format(host_status['seconds'])
+    if host_status['error']:
+        host_status_message += ' | {0}'.format(host_status['error'])
+    return host_status_message
 
 
 def main():
@@ -600,14 +1609,57 @@ def main():
         parser.add_argument('-c', '--customer_name',
                             help='select a customer from where getting '
                                  'influxdb data')
+        parser.add_argument('-f', '--time_from',
+                            help='set the start of the diagnostics period')
+        parser.add_argument('-t', '--time_to',
+                            help='set the end of the diagnostics period')
+        parser.add_argument('-z', '--time_zone',
+                            help='set the time zone of the period')
+        parser.add_argument('-w', '--worker_amount',
+                            help='set the processes diagnosing the hosts')
+        parser.add_argument('-q', '--fetch_workers',
+                            help='set the queries in flight for each host')
+        parser.add_argument('-b', '--batch_queries', action='store_true',
+                            help='batch the queries of each measurement')
+        parser.add_argument('-m', '--metrics_path',
+                            help='dump the stage metrics as JSON, or as '
+                                 'Prometheus text when ending with .prom')
+        parser.add_argument('-M', '--trace_memory', action='store_true',
+                            help='trace the peak memory of the stages')
         parser.add_argument('-v', '--verbose_level',
                             help='verbose the check output')
         args = parser.parse_args()
         customer_name = args.customer_name
         json_path = args.json_path if args.json_path else ''
+        time_zone = args.time_zone if args.time_zone else 'Europe/Rome'
+        worker_amount = int(args.worker_amount) if args.worker_amount \
+            else None
+        fetch_workers = int(args.fetch_workers) if args.fetch_workers else 1
         verbose_level = int(args.verbose_level) if args.verbose_level else 1
-        if customer_name:
-            pass
+        metrics_registry = None
+        if args.metrics_path:
+            metrics_registry = data_metrics.MetricsRegistry(
+                trace_memory=args.trace_memory)
+        if args.time_from and args.time_to:
+            host_statuses = run_fleet_diagnostics(
+                args.time_from, args.time_to, json_path, customer_name,
+                worker_amount, verbose=verbose_level >= 2,
+                metrics_registry=metrics_registry, time_zone=time_zone,
+                fetch_workers=fetch_workers,
+                batch_queries=args.batch_queries)
+            if metrics_registry:
+                if args.metrics_path.endswith('.prom'):
+                    metrics_registry.dump_prometheus(args.metrics_path)
+                else:
+                    metrics_registry.dump_json(args.metrics_path)
+            if verbose_level >= 1:
+                host_done_amount = sum(host_status['status'] == 'DONE'
+                                       for host_status in host_statuses)
+                print('Data manager | {0}/{1} hosts DONE.'.format(
+                    host_done_amount, len(host_statuses)))
+                for host_status in host_statuses:
+                    if host_status['status'] != 'DONE':
+                        print(get_host_status_message(host_status))
     else:
         pass
 
@@ -0,0 +1,241 @@
+#!/usr/bin/python3
+
+"""
+    System diagnostics: data metrics
+    Copyright (C) 2019 Francesco Melchiori
+    <https://www.francescomelchiori.com/>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see
+    <http://www.gnu.org/licenses/>.
+"""
+
+
+import collections
+import json
+import threading
+import time
+import tracemalloc
+
+
+class MetricsRegistry:
+    """
+    MetricsRegistry measures the stages of a pipeline, the fetches and
+    the preprocessing steps of the diagnostics, recording for each call
+    its wall time, the CPU time of the calling thread, the input and
+    output shapes and, when trace_memory is set, the peak memory traced
+    by tracemalloc while it ran. The records, at most record_amount,
+    are passed on to the registered hooks and can be dumped as JSON or
+    as Prometheus text.
+
+    The traced peak is shared by the whole process, so the peaks of
+    stages running concurrently in many threads overlap.
+    """
+    def __init__(self, trace_memory=False, record_amount=100000,
+                 metric_prefix='system_diagnostics'):
+        self.trace_memory = trace_memory
+        self.metric_prefix = metric_prefix
+        self.records = collections.deque(maxlen=record_amount)
+        self.records_lock = threading.Lock()
+        self.hooks = []
+        self.memory_trace_depth = 0
+        self.memory_trace_started = False
+        self.memory_trace_lock = threading.Lock()
+
+    def __repr__(self):
+        print_message = 'Trace memory: {0}\n'.format(self.trace_memory)
+        print_message += 'Records: {0}\n'.format(len(self.records))
+        for stage_summary in self.get_stage_summaries():
+            print_message += '{0} {1}: {2} calls, {3:.4f}s wall, ' \
+                             '{4:.4f}s cpu, {5} peak bytes\n'.format(
+                                 stage_summary['stage_name'],
+                                 stage_summary['labels'],
+                                 stage_summary['calls'],
+                                 stage_summary['wall_seconds'],
+                                 stage_summary['cpu_seconds'],
+                                 stage_summary['peak_bytes'])
+        return print_message
+
+    def add_hook(self, metrics_hook):
+        self.hooks.append(metrics_hook)
+        return True
+
+    def start_memory_trace(self):
+        with self.memory_trace_lock:
+            if not self.memory_trace_depth and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.memory_trace_started = True
+            self.memory_trace_depth += 1
+            tracemalloc.reset_peak()
+            return tracemalloc.get_traced_memory()[0]
+
+    def stop_memory_trace(self, memory_start):
+        with self.memory_trace_lock:
+            memory_peak = tracemalloc.get_traced_memory()[1]
+            self.memory_trace_depth -= 1
+            if not self.memory_trace_depth and self.memory_trace_started:
+                tracemalloc.stop()
+                self.memory_trace_started = False
+            return max(memory_peak - memory_start, 0)
+
+    def measure(self, stage_name, stage_function, *args, stage_labels=None,
+                **kwargs):
+        """
+        measure calls stage_function with the given arguments and
+        records the call as stage_name, labelled by stage_labels,
+        whether it returns or raises.
+        """
+        stage_record = {'stage_name': stage_name,
+                        'labels': dict(stage_labels) if stage_labels else {},
+                        'timestamp': time.time(),
+                        'input_shape': get_data_shape(args[0])
+                        if args else None,
+                        'output_shape': None,
+                        'error': ''}
+        memory_start = self.start_memory_trace() if self.trace_memory \
+            else None
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            stage_result = stage_function(*args, **kwargs)
+            stage_record['output_shape'] = get_data_shape(stage_result)
+            return stage_result
+        except Exception as stage_exception:
+            stage_record['error'] = type(stage_exception).__name__
+            raise
+        finally:
+            stage_record['wall_seconds'] = time.perf_counter() - wall_start
+            stage_record['cpu_seconds'] = time.thread_time() - cpu_start
+            stage_record['peak_bytes'] = self.stop_memory_trace(
+                memory_start) if self.trace_memory else None
+            self.record(stage_record)
+
+    def record(self, stage_record):
+        with self.records_lock:
+            self.records.append(stage_record)
+        for metrics_hook in self.hooks:
+            metrics_hook(stage_record)
+        return True
+
+    def get_records(self):
+        with self.records_lock:
+            return list(self.records)
+
+    def clear(self):
+        with self.records_lock:
+            self.records.clear()
+        return True
+
+    def get_stage_summaries(self):
+        """
+        get_stage_summaries aggregates the records by stage and labels
+        into calls, errors, total wall and CPU seconds and the largest
+        peak memory.
+        """
+        stage_summaries = {}
+        for stage_record in self.get_records():
+            stage_key = (stage_record['stage_name'],
+                         tuple(sorted(stage_record['labels'].items())))
+            if stage_key not in stage_summaries:
+                stage_summaries[stage_key] = {
+                    'stage_name': stage_record['stage_name'],
+                    'labels': stage_record['labels'],
+                    'calls': 0,
+                    'errors': 0,
+                    'wall_seconds': 0.,
+                    'cpu_seconds': 0.,
+                    'peak_bytes': 0}
+            stage_summary = stage_summaries[stage_key]
+            stage_summary['calls'] += 1
+            stage_summary['errors'] += bool(stage_record['error'])
+            stage_summary['wall_seconds'] += stage_record['wall_seconds']
+            stage_summary['cpu_seconds'] += stage_record['cpu_seconds']
+            if stage_record['peak_bytes']:
+                stage_summary['peak_bytes'] = max(
+                    stage_summary['peak_bytes'], stage_record['peak_bytes'])
+        return list(stage_summaries.values())
+
+    def dump_json(self, json_path=None):
+        metrics_json = json.dumps({'records': self.get_records(),
+                                   'summaries': self.get_stage_summaries()},
+                                  indent=1)
+        if json_path:
+            with open(json_path, 'w') as json_file:
+                json_file.write(metrics_json)
+        return metrics_json
+
+    def dump_prometheus(self, prometheus_path=None):
+        """
+        dump_prometheus writes the stage summaries in the Prometheus text
+        exposition format, as counters of calls, errors, wall and CPU
+        seconds and as a gauge of the peak bytes.
+        """
+        stage_summaries = self.get_stage_summaries()
+        metric_items = [
+            ('stage_calls_total', 'counter', 'calls',
+             'Calls of the stage.'),
+            ('stage_errors_total', 'counter', 'errors',
+             'Calls of the stage raising an exception.'),
+            ('stage_wall_seconds_total', 'counter', 'wall_seconds',
+             'Wall time spent in the stage.'),
+            ('stage_cpu_seconds_total', 'counter', 'cpu_seconds',
+             'CPU time of the calling thread spent in the stage.'),
+            ('stage_peak_bytes', 'gauge', 'peak_bytes',
+             'Largest memory peak traced during the stage.')]
+        metrics_lines = []
+        for metric_name, metric_type, summary_name, metric_help \
+                in metric_items:
+            metric_name = '{0}_{1}'.format(self.metric_prefix, metric_name)
+            metrics_lines.append('# HELP {0} {1}'.format(metric_name,
+                                                         metric_help))
+            metrics_lines.append('# TYPE {0} {1}'.format(metric_name,
+                                                         metric_type))
+            for stage_summary in stage_summaries:
+                metric_labels = {'stage': stage_summary['stage_name']}
+                metric_labels.update(stage_summary['labels'])
+                metrics_lines.append('{0}{{{1}}} {2}'.format(
+                    metric_name, get_prometheus_labels(metric_labels),
+                    stage_summary[summary_name]))
+        metrics_text = '{0}\n'.format('\n'.join(metrics_lines))
+        if prometheus_path:
+            with open(prometheus_path, 'w') as prometheus_file:
+                prometheus_file.write(metrics_text)
+        return metrics_text
+
+
+def get_data_shape(data):
+    """
+    get_data_shape returns the shape of a dataframe or an array, the
+    amount of items, total rows and most columns of a list of them, and
+    the shape of the first item of a returned tuple.
+    """
+    if hasattr(data, 'shape'):
+        return list(data.shape)
+    if isinstance(data, (list, tuple)) and data and \
+            all(hasattr(data_item, 'shape') for data_item in data):
+        return [len(data),
+                sum(data_item.shape[0] for data_item in data),
+                max(data_item.shape[1] if len(data_item.shape) > 1 else 1
+                    for data_item in data)]
+    if isinstance(data, tuple) and data:
+        return get_data_shape(data[0])
+    return None
+
+
+def get_prometheus_labels(metric_labels):
+    prometheus_labels = []
+    for label_name, label_value in sorted(metric_labels.items()):
+        label_value = str(label_value).replace('\\', '\\\\')
+        label_value = label_value.replace('"', '\\"').replace('\n', '\\n')
+        prometheus_labels.append('{0}="{1}"'.format(label_name, label_value))
+    return ','.join(prometheus_labels)
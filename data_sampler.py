@@ -21,86 +21,195 @@
 """
 
 
+import functools
+import re
+
 import numpy as np
 import pandas as pd
 
 import signal_processor
 
 
+sampling_unit_cycles = {'us': 3600000000,
+                        'ms': 3600000,
+                        's': 3600,
+                        'm': 60,
+                        'h': 24}
+sampling_unit_aliases = {'us': 'us',
+                         'ms': 'ms',
+                         's': 's',
+                         'm': 'min',
+                         'h': 'h'}
+
+
+def get_pd_dataframe_sampling_periods(pd_dataframe, sampling_precision='1s'):
+    """
+    get_pd_dataframe_sampling_periods returns the periods between the
+    consecutive timestamps of a dataframe, whatever their order, in
+    whole sampling_precision units.
+    """
+    pd_precision_delta = pd.to_timedelta(sampling_precision).value
+    np_timestamps = pd_dataframe.index.asi8
+    return np.abs(np.diff(np_timestamps)) // pd_precision_delta
+
+
+def get_sampling_period_statistic(np_sampling_periods,
+                                  sampling_statistic='minimum'):
+    """
+    get_sampling_period_statistic summarizes the sampling periods of a
+    series as their minimum, their mode, their median or a percentile
+    given as 'p' and its rank, e.g. 'p5', picking an actual period
+    rather than interpolating.
+    """
+    if not np_sampling_periods.size:
+        return False
+    if sampling_statistic == 'minimum':
+        return int(np_sampling_periods.min())
+    if sampling_statistic == 'mode':
+        np_periods, np_period_counts = np.unique(np_sampling_periods,
+                                                 return_counts=True)
+        return int(np_periods[np.argmax(np_period_counts)])
+    if sampling_statistic == 'median':
+        sampling_statistic = 'p50'
+    if sampling_statistic.startswith('p'):
+        return int(np.percentile(np_sampling_periods,
+                                 float(sampling_statistic[1:]),
+                                 method='lower'))
+    raise ValueError('sampling statistic {0} is not available'.format(
+        sampling_statistic))
+
+
 def get_pd_dataframe_minimum_sampling_period(pd_dataframe,
-                                             sampling_precision='1s'):
-    pd_dataframe_sampling_periods = []
-    pd_second_delta = pd.to_timedelta(sampling_precision)
+                                             sampling_precision='1s',
+                                             sampling_statistic='minimum'):
+    pd_dataframe_sampling_period = False
     if not pd_dataframe.empty:
-        pd_dataframe_range = range(pd_dataframe.shape[0] - 1)
-        for current_index in pd_dataframe_range:
-            next_index = current_index + 1
-            current_timestamp = pd_dataframe.index[current_index]
-            next_timestamp = pd_dataframe.index[next_index]
-            pd_dataframe_delta = abs(current_timestamp - next_timestamp)
-            pd_dataframe_sampling_periods.append(int(
-                pd_dataframe_delta/pd_second_delta))
-    if pd_dataframe_sampling_periods:
-        pd_dataframe_sampling_period = min(pd_dataframe_sampling_periods)
-    else:
-        pd_dataframe_sampling_period = False
+        np_sampling_periods = get_pd_dataframe_sampling_periods(
+            pd_dataframe, sampling_precision)
+        pd_dataframe_sampling_period = get_sampling_period_statistic(
+            np_sampling_periods, sampling_statistic)
     return pd_dataframe_sampling_period
 
 
 def get_pd_dataframes_minimum_sampling_period(pd_dataframes,
-                                              sampling_precision='1s'):
-    pd_dataframes_sampling_periods = []
-    for pd_dataframe in pd_dataframes:
-        if not pd_dataframe.empty:
-            pd_dataframe_sampling_period = \
-                get_pd_dataframe_minimum_sampling_period(
-                    pd_dataframe, sampling_precision)
-            if pd_dataframe_sampling_period:
-                pd_dataframes_sampling_periods.append(
-                    pd_dataframe_sampling_period)
-    if pd_dataframes_sampling_periods:
-        pd_dataframes_minimum_sampling_period = min(
-            pd_dataframes_sampling_periods)
+                                              sampling_precision='1s',
+                                              sampling_statistic='minimum'):
+    return get_timestamps_minimum_sampling_period(
+        [pd_dataframe.index.asi8 for pd_dataframe in pd_dataframes],
+        sampling_precision, sampling_statistic)
+
+
+def get_timestamps_minimum_sampling_period(np_timestamps_list,
+                                           sampling_precision='1s',
+                                           sampling_statistic='minimum'):
+    """
+    get_timestamps_minimum_sampling_period returns the smallest
+    sampling period statistic among many timestamp arrays, differencing
+    them all at once and reducing them array by array.
+    """
+    np_timestamps_list = [np_timestamps for np_timestamps
+                          in np_timestamps_list if np_timestamps.size > 1]
+    if not np_timestamps_list:
+        return False
+    pd_precision_delta = pd.to_timedelta(sampling_precision).value
+    np_timestamps = np.concatenate(np_timestamps_list)
+    np_sampling_periods = np.abs(np.diff(np_timestamps)) // \
+        pd_precision_delta
+    np_dataframe_ends = np.cumsum([np_timestamps.size for np_timestamps
+                                   in np_timestamps_list])
+    np_dataframe_starts = np.concatenate([[0], np_dataframe_ends[:-1]])
+    if sampling_statistic == 'minimum':
+        np_sampling_periods[np_dataframe_ends[:-1] - 1] = \
+            np.iinfo(np_sampling_periods.dtype).max
+        np_dataframe_sampling_periods = np.minimum.reduceat(
+            np_sampling_periods, np_dataframe_starts)
     else:
-        pd_dataframes_minimum_sampling_period = False
-    return pd_dataframes_minimum_sampling_period
+        np_dataframe_sampling_periods = np.array([
+            get_sampling_period_statistic(
+                np_sampling_periods[dataframe_start:dataframe_end - 1],
+                sampling_statistic)
+            for dataframe_start, dataframe_end
+            in zip(np_dataframe_starts, np_dataframe_ends)])
+    np_dataframe_sampling_periods = np_dataframe_sampling_periods[
+        np_dataframe_sampling_periods > 0]
+    if not np_dataframe_sampling_periods.size:
+        return False
+    return int(np_dataframe_sampling_periods.min())
+
+
+def get_divisors(number):
+    """
+    get_divisors returns the sorted divisors of a number out of its
+    prime factorization, instead of testing every smaller number.
+    """
+    prime_factors = {}
+    prime_factor = 2
+    while prime_factor * prime_factor <= number:
+        while number % prime_factor == 0:
+            prime_factors[prime_factor] = \
+                prime_factors.get(prime_factor, 0) + 1
+            number //= prime_factor
+        prime_factor += 1
+    if number > 1:
+        prime_factors[number] = prime_factors.get(number, 0) + 1
+    divisors = [1]
+    for prime_factor, prime_power in prime_factors.items():
+        divisors = [divisor * prime_factor ** power
+                    for divisor in divisors
+                    for power in range(prime_power + 1)]
+    return sorted(divisors)
+
+
+@functools.lru_cache(maxsize=None)
+def get_sampling_periods(sampling_unit='s'):
+    """
+    get_sampling_periods returns the periods, in sampling_unit, whose
+    grids tile an hour, or a day for hours, computed once per unit.
+    """
+    sampling_unit_cycle = sampling_unit_cycles.get(sampling_unit,
+                                                   sampling_unit_cycles['s'])
+    np_sampling_periods = np.array(get_divisors(sampling_unit_cycle),
+                                   dtype='int64')
+    np_sampling_periods.setflags(write=False)
+    return np_sampling_periods
+
+
+def get_down_rounded_sampling_periods(raw_sampling_periods,
+                                      sampling_unit='s'):
+    """
+    get_down_rounded_sampling_periods rounds many raw sampling periods
+    down to the closest valid periods with a binary search each, the
+    periods shorter than a unit getting the longest valid period.
+    """
+    np_sampling_periods = get_sampling_periods(sampling_unit)
+    np_raw_sampling_periods = np.asarray(raw_sampling_periods)
+    np_period_indexes = np.searchsorted(np_sampling_periods,
+                                        np_raw_sampling_periods,
+                                        side='right') - 1
+    np_period_indexes[np_period_indexes < 0] = np_sampling_periods.size - 1
+    return np_sampling_periods[np_period_indexes]
 
 
 def get_down_rounded_sampling_period(raw_sampling_period, sampling_unit='s'):
-    if sampling_unit == 's':
-        hour_max_sampling_period = 3600
-        down_rounded_sampling_period = 3600
-    elif sampling_unit == 'ms':
-        hour_max_sampling_period = 3600000
-        down_rounded_sampling_period = 3600000
-    else:
-        hour_max_sampling_period = 3600
-        down_rounded_sampling_period = 3600
-    hour_all_sampling_periods = np.arange(1, hour_max_sampling_period+1)
-    hour_label_valid_sampling_periods = np.mod(hour_max_sampling_period,
-                                               hour_all_sampling_periods) == 0
-    hour_valid_sampling_periods = hour_all_sampling_periods[
-        hour_label_valid_sampling_periods]
-    hour_label_down_rounded_sampling_periods = np.floor_divide(
-        hour_valid_sampling_periods, raw_sampling_period+1) == 0
-    for label_sampling_period, sampling_period in zip(
-            hour_label_down_rounded_sampling_periods,
-            hour_valid_sampling_periods):
-        if label_sampling_period:
-            down_rounded_sampling_period = int(sampling_period)
-        else:
-            break
-    return down_rounded_sampling_period
+    return int(get_down_rounded_sampling_periods([raw_sampling_period],
+                                                 sampling_unit)[0])
 
 
-def get_pd_dataframes_down_rounded_sampling_period(pd_dataframes,
-                                                   sampling_precision='1s'):
+def get_sampling_period_string(sampling_period, sampling_unit='s'):
+    return '{0}{1}'.format(sampling_period,
+                           sampling_unit_aliases[sampling_unit])
+
+
+def get_pd_dataframes_down_rounded_sampling_period(
+        pd_dataframes, sampling_precision='1s',
+        sampling_statistic='minimum'):
     sampling_unit = get_sampling_unit(sampling_precision)
     pd_dataframes_down_rounded_sampling_period = False
     if pd_dataframes:
         pd_dataframes_minimum_sampling_period =\
             get_pd_dataframes_minimum_sampling_period(pd_dataframes,
-                                                      sampling_precision)
+                                                      sampling_precision,
+                                                      sampling_statistic)
         if pd_dataframes_minimum_sampling_period:
             pd_dataframes_down_rounded_sampling_period = \
                 get_down_rounded_sampling_period(
@@ -119,56 +228,65 @@ def pad_pd_dataframes(pd_dataframes, timestamp_start, timestamp_end,
     pd_timezone_index_end = pd.DatetimeIndex([timestamp_end], tz=time_zone)
     pd_utc_index_start = pd.to_datetime(pd_timezone_index_start, utc=True)
     pd_utc_index_end = pd.to_datetime(pd_timezone_index_end, utc=True)
+    pd_utc_index_padding = pd_utc_index_start.append(pd_utc_index_end)
     pd_padded_dataframes = []
     if pd_dataframes:
         for pd_dataframe in pd_dataframes:
             if not pd_dataframe.empty:
-                padding_start_dict = {}
-                for pd_series in pd_dataframe.columns:
-                    pd_series_values = pd_dataframe[pd_series]
-                    for pd_series_value in pd_series_values:
-                        if not pd.isnull(pd_series_value):
-                            padding_start_dict['{0}'.format(pd_series)] = \
-                                pd.Series(pd_series_value,
-                                          index=pd_utc_index_start)
-                            break
-                padding_end_dict = {}
-                for pd_series in pd_dataframe.columns:
-                    pd_series_values = pd_dataframe[pd_series]
-                    pd_series_size = pd_dataframe[pd_series].size
-                    pd_series_back_index = [-pd_series_index
-                                            for pd_series_index
-                                            in range(1, pd_series_size+1)]
-                    pd_series_back_values = pd_series_values[
-                        pd_series_back_index]
-                    for pd_series_back_value in pd_series_back_values:
-                        if not pd.isnull(pd_series_back_value):
-                            padding_end_dict['{0}'.format(pd_series)] = \
-                                pd.Series(pd_series_back_value,
-                                          index=pd_utc_index_end)
-                            break
-                pd_dataframe_padding_start = pd.DataFrame(padding_start_dict)
-                pd_dataframe_padding_end = pd.DataFrame(padding_end_dict)
-                pd_padded_dataframe = pd.concat([pd_dataframe,
-                                                 pd_dataframe_padding_start,
-                                                 pd_dataframe_padding_end])
+                pd_padded_dataframe = pad_pd_dataframe(pd_dataframe,
+                                                       pd_utc_index_padding)
                 pd_padded_dataframes.append(pd_padded_dataframe)
     return pd_padded_dataframes
 
 
-def resample_pd_dataframes(pd_dataframes, sampling_precision='1s'):
+def pad_pd_dataframe(pd_dataframe, pd_utc_index_padding):
+    """
+    pad_pd_dataframe appends to a dataframe the rows of
+    pd_utc_index_padding, holding the first and the last valid values
+    of each column, found with argmax over the valid mask and written
+    in a single allocation. Columns without values are padded with NaN
+    and a dataframe without values is not padded at all.
+    """
+    np_values = pd_dataframe.to_numpy()
+    np_valid_values = pd.notna(np_values)
+    np_valid_columns = np_valid_values.any(axis=0)
+    if not np_valid_columns.any():
+        return pd_dataframe.copy()
+    row_amount, column_amount = np_values.shape
+    np_column_indexes = np.arange(column_amount)
+    np_first_rows = np.argmax(np_valid_values, axis=0)
+    np_last_rows = row_amount - 1 - np.argmax(np_valid_values[::-1], axis=0)
+    np_padded_values = np.empty(
+        (row_amount + 2, column_amount),
+        dtype=np.result_type(np_values.dtype, np.float64))
+    np_padded_values[:row_amount] = np_values
+    np_padded_values[row_amount] = np_values[np_first_rows,
+                                             np_column_indexes]
+    np_padded_values[row_amount + 1] = np_values[np_last_rows,
+                                                 np_column_indexes]
+    np_padded_values[row_amount:, ~np_valid_columns] = np.nan
+    pd_padded_dataframe = pd.DataFrame(
+        np_padded_values, columns=pd_dataframe.columns,
+        index=pd_dataframe.index.append(pd_utc_index_padding))
+    return pd_padded_dataframe
+
+
+def resample_pd_dataframes(pd_dataframes, sampling_precision='1s',
+                           sampling_statistic='minimum'):
     """
        For each series in each dataframe, resample_pd_dataframes
        resamples the time series at the maximum sampling frequency among
-       them, so upsampling the others.
+       them, so upsampling the others. A sampling_statistic other than
+       the minimum, e.g. 'mode' or 'p5', keeps a few close timestamps
+       from shrinking the grid of all the series.
     """
     sampling_unit = get_sampling_unit(sampling_precision)
     pd_resampled_dataframes = []
     if pd_dataframes:
         resampling_period = get_pd_dataframes_down_rounded_sampling_period(
-            pd_dataframes, sampling_precision)
-        resampling_period_string = '{0}{1}'.format(resampling_period,
-                                                   sampling_unit)
+            pd_dataframes, sampling_precision, sampling_statistic)
+        resampling_period_string = get_sampling_period_string(
+            resampling_period, sampling_unit)
         for pd_dataframe in pd_dataframes:
             if not pd_dataframe.empty:
                 pd_resampled_dataframe = pd_dataframe.resample(
@@ -191,12 +309,51 @@ def fill_pd_dataframes(pd_dataframes):
 
 
 def join_pd_dataframes(pd_dataframes):
+    """
+    join_pd_dataframes left joins all the dataframes on the index of the
+    first one at once: dataframes sharing that index are copied side by
+    side into a single array, the others are reindexed onto it and
+    concatenated, so that the cost grows linearly with the series.
+    """
     pd_joined_dataframe = pd.DataFrame()
     if pd_dataframes:
         pd_joined_dataframe = pd_dataframes[0]
-        for pd_dataframe in pd_dataframes[1:]:
-            if not pd_dataframe.empty:
+        pd_joining_dataframes = [pd_dataframe
+                                 for pd_dataframe in pd_dataframes[1:]
+                                 if not pd_dataframe.empty]
+        if not pd_joining_dataframes:
+            return pd_joined_dataframe
+        pd_dataframes = [pd_joined_dataframe] + pd_joining_dataframes
+        pd_columns = pd.Index([pd_column for pd_dataframe in pd_dataframes
+                               for pd_column in pd_dataframe.columns])
+        pd_index = pd_joined_dataframe.index
+        if not (pd_columns.is_unique and pd_index.is_unique and
+                all(pd_dataframe.index.is_unique
+                    for pd_dataframe in pd_joining_dataframes)):
+            for pd_dataframe in pd_joining_dataframes:
                 pd_joined_dataframe = pd_joined_dataframe.join(pd_dataframe)
+            return pd_joined_dataframe
+        if all(pd_dataframe.index.equals(pd_index) and
+               (pd_dataframe.dtypes == 'float64').all()
+               for pd_dataframe in pd_dataframes):
+            np_joined_values = np.empty((pd_index.size, pd_columns.size),
+                                        order='F')
+            column_start = 0
+            for pd_dataframe in pd_dataframes:
+                column_end = column_start + pd_dataframe.shape[1]
+                np_joined_values[:, column_start:column_end] = \
+                    pd_dataframe.to_numpy()
+                column_start = column_end
+            pd_joined_dataframe = pd.DataFrame(np_joined_values,
+                                               index=pd_index,
+                                               columns=pd_columns,
+                                               copy=False)
+        else:
+            pd_joined_dataframe = pd.concat(
+                [pd_joined_dataframe] +
+                [pd_dataframe.reindex(pd_index)
+                 for pd_dataframe in pd_joining_dataframes], axis=1)
+            pd_joined_dataframe.index = pd_index
     return pd_joined_dataframe
 
 
@@ -215,9 +372,154 @@ def standardize_pd_dataframes(pd_dataframes):
     return pd_standard_dataframes
 
 
-def sample_dataevents(pd_dataframe, event_minimum_period='10m'):
+def align_pd_dataframes(pd_dataframes, timestamp_start, timestamp_end,
+                        time_zone, sampling_precision='1s',
+                        sampling_statistic='minimum'):
+    """
+       align_pd_dataframes fuses pad_pd_dataframes,
+       resample_pd_dataframes, fill_pd_dataframes,
+       standardize_pd_dataframes and join_pd_dataframes into a single
+       pass: the time grid is planned once, every series is written
+       straight into one preallocated time x feature array, filled and
+       standardized in place, and the joined dataframe is returned as a
+       view of that array. The array is column major, so that every
+       series is contiguous and pandas keeps it as its block.
+    """
+    pd_dataframes = [pd_dataframe for pd_dataframe in pd_dataframes
+                     if not pd_dataframe.empty]
+    if not pd_dataframes:
+        return pd.DataFrame()
+    np_timestamp_padding = pd.to_datetime(
+        pd.DatetimeIndex([timestamp_start, timestamp_end], tz=time_zone),
+        utc=True).asi8
+    np_timestamps_list = []
+    np_values_list = []
+    for pd_dataframe in pd_dataframes:
+        np_timestamps, np_values = get_padded_np_series(pd_dataframe,
+                                                        np_timestamp_padding)
+        np_timestamps_list.append(np_timestamps)
+        np_values_list.append(np_values)
+    sampling_unit = get_sampling_unit(sampling_precision)
+    raw_sampling_period = get_timestamps_minimum_sampling_period(
+        np_timestamps_list, sampling_precision, sampling_statistic)
+    if not raw_sampling_period:
+        raise ValueError('the dataframes have no sampling period')
+    sampling_period_string = get_sampling_period_string(
+        get_down_rounded_sampling_period(raw_sampling_period, sampling_unit),
+        sampling_unit)
+    sampling_period_delta = pd.to_timedelta(sampling_period_string).value
+    np_grid_starts = np.array([np_timestamps.min() for np_timestamps
+                               in np_timestamps_list]) // \
+        sampling_period_delta * sampling_period_delta
+    np_grid_ends = np.array([np_timestamps.max() for np_timestamps
+                             in np_timestamps_list]) // \
+        sampling_period_delta * sampling_period_delta
+    grid_start = np_grid_starts.min()
+    grid_size = (np_grid_ends.max() - grid_start) // sampling_period_delta + 1
+    column_amount = sum(pd_dataframe.shape[1]
+                        for pd_dataframe in pd_dataframes)
+    np_aligned_values = np.full((grid_size, column_amount), np.nan,
+                                order='F')
+    column_start = 0
+    for np_timestamps, np_values, dataframe_grid_start, dataframe_grid_end \
+            in zip(np_timestamps_list, np_values_list, np_grid_starts,
+                   np_grid_ends):
+        row_start = (dataframe_grid_start - grid_start) // \
+            sampling_period_delta
+        row_end = (dataframe_grid_end - grid_start) // \
+            sampling_period_delta + 1
+        column_end = column_start + np_values.shape[1]
+        np_dataframe_values = np_aligned_values[row_start:row_end,
+                                                column_start:column_end]
+        np_order = np.argsort(np_timestamps, kind='stable')
+        np_grid_positions = np.searchsorted(
+            np_timestamps[np_order],
+            np.arange(dataframe_grid_start, dataframe_grid_end + 1,
+                      sampling_period_delta),
+            side='right') - 1
+        np_sampled_rows = np_grid_positions >= 0
+        np_dataframe_values[np_sampled_rows] = np_values[
+            np_order[np_grid_positions[np_sampled_rows]]]
+        fill_np_values(np_dataframe_values)
+        standardize_np_values(np_dataframe_values)
+        column_start = column_end
+    row_start = (np_grid_starts[0] - grid_start) // sampling_period_delta
+    row_end = (np_grid_ends[0] - grid_start) // sampling_period_delta + 1
+    pd_utc_index = pd.date_range(pd.Timestamp(np_grid_starts[0], tz='UTC'),
+                                 periods=row_end - row_start,
+                                 freq=sampling_period_string)
+    pd_columns = [pd_column for pd_dataframe in pd_dataframes
+                  for pd_column in pd_dataframe.columns]
+    pd_aligned_dataframe = pd.DataFrame(np_aligned_values[row_start:row_end],
+                                        index=pd_utc_index,
+                                        columns=pd_columns, copy=False)
+    return pd_aligned_dataframe
+
+
+def get_padded_np_series(pd_dataframe, np_timestamp_padding):
+    """
+    get_padded_np_series returns the timestamps and float values of a
+    dataframe with the padding rows of pad_pd_dataframe appended.
+    """
+    np_timestamps = pd_dataframe.index.asi8
+    np_values = pd_dataframe.to_numpy(dtype='float64')
+    np_valid_values = ~np.isnan(np_values)
+    np_valid_columns = np_valid_values.any(axis=0)
+    if not np_valid_columns.any():
+        return np_timestamps, np_values
+    row_amount, column_amount = np_values.shape
+    np_column_indexes = np.arange(column_amount)
+    np_padding_values = np.empty((2, column_amount))
+    np_padding_values[0] = np_values[np.argmax(np_valid_values, axis=0),
+                                     np_column_indexes]
+    np_padding_values[1] = np_values[
+        row_amount - 1 - np.argmax(np_valid_values[::-1], axis=0),
+        np_column_indexes]
+    np_padding_values[:, ~np_valid_columns] = np.nan
+    return np.concatenate([np_timestamps, np_timestamp_padding]), \
+        np.concatenate([np_values, np_padding_values])
+
+
+def fill_np_values(np_values):
+    """
+    fill_np_values fills the NaN of each column of a 2-D array in place,
+    forward first and then backward, as fill_pd_dataframes does.
+    """
+    row_amount, column_amount = np_values.shape
+    np_column_indexes = np.arange(column_amount)
+    np_valid_values = ~np.isnan(np_values)
+    np_fill_rows = np.where(np_valid_values,
+                            np.arange(row_amount)[:, np.newaxis], 0)
+    np.maximum.accumulate(np_fill_rows, axis=0, out=np_fill_rows)
+    np_values[:] = np_values[np_fill_rows, np_column_indexes]
+    np_first_rows = np.argmax(np_valid_values, axis=0)
+    np_leading_rows = np.arange(row_amount)[:, np.newaxis] < np_first_rows
+    np_values[np_leading_rows] = np.broadcast_to(
+        np_values[np_first_rows, np_column_indexes],
+        np_values.shape)[np_leading_rows]
+    return True
+
+
+def standardize_np_values(np_values):
+    """
+    standardize_np_values standardizes the columns of a filled 2-D
+    array in place, as standardize_pd_dataframes does with a dataframe.
+    """
+    np_values -= np_values.mean(axis=0)
+    np_standard_deviations = np_values.std(axis=0, ddof=1)
+    if np_standard_deviations[0] != 0:
+        np_values /= np_standard_deviations
+    return True
+
+
+def get_dataevent_sampling(pd_dataframe, event_minimum_period='10m'):
+    """
+    get_dataevent_sampling returns the samples of an event, even and
+    spanning at least event_minimum_period, the step between half
+    overlapping events and the amount of events fitting in pd_dataframe.
+    """
     pd_dataframe_sample_amount = pd_dataframe.index.size
-    pd_dataframe_sample_period = pd_dataframe.index.freq.delta
+    pd_dataframe_sample_period = pd.to_timedelta(pd_dataframe.index.freq)
     pd_event_minimum_period = pd.to_timedelta(event_minimum_period)
     event_minimum_samples = int(pd_event_minimum_period //
                                 pd_dataframe_sample_period)
@@ -227,6 +529,14 @@ def sample_dataevents(pd_dataframe, event_minimum_period='10m'):
     serial_event_amount = int(pd_dataframe_sample_amount //
                               event_minimum_samples)
     sampled_event_amount = (serial_event_amount * 2) - 1
+    return event_minimum_samples, event_maximum_sampling_period, \
+        max(sampled_event_amount, 0)
+
+
+def sample_dataevents(pd_dataframe, event_minimum_period='10m'):
+    event_minimum_samples, event_maximum_sampling_period, \
+        sampled_event_amount = get_dataevent_sampling(pd_dataframe,
+                                                      event_minimum_period)
 
     # print('event_maximum_sampling_period: {}'.format(
     #     event_maximum_sampling_period))
@@ -252,6 +562,36 @@ def sample_dataevents(pd_dataframe, event_minimum_period='10m'):
     return sampled_events, event_minimum_samples
 
 
+def sample_dataevent_tensor(pd_dataframe, event_minimum_period='10m'):
+    """
+    sample_dataevent_tensor samples the same half overlapping events of
+    sample_dataevents as a read only, strided view of the pd_dataframe
+    values shaped events x samples x features, along with the index of
+    the event start timestamps, so that no sample is copied however
+    many events there are.
+    """
+    event_minimum_samples, event_maximum_sampling_period, \
+        sampled_event_amount = get_dataevent_sampling(pd_dataframe,
+                                                      event_minimum_period)
+    np_values = pd_dataframe.to_numpy()
+    if not sampled_event_amount:
+        np_dataevent_tensor = np.empty(
+            (0, event_minimum_samples, np_values.shape[1]),
+            dtype=np_values.dtype)
+        return np_dataevent_tensor, pd_dataframe.index[:0], \
+            event_minimum_samples
+    np_dataevent_windows = np.lib.stride_tricks.sliding_window_view(
+        np_values, event_minimum_samples, axis=0)
+    np_dataevent_tensor = np_dataevent_windows[
+        :sampled_event_amount * event_maximum_sampling_period:
+        event_maximum_sampling_period].transpose(0, 2, 1)
+    pd_dataevent_timestamps = pd_dataframe.index[
+        :sampled_event_amount * event_maximum_sampling_period:
+        event_maximum_sampling_period]
+    return np_dataevent_tensor, pd_dataevent_timestamps, \
+        event_minimum_samples
+
+
 def filter_low_pass_dataevents(pd_dataevents,
                                lpf_harmonic_amount=10,
                                direct_signal=False):
@@ -265,34 +605,68 @@ def filter_low_pass_dataevents(pd_dataevents,
     return pd_dataevents_lpf
 
 
+def filter_low_pass_dataevent_tensor(np_dataevent_tensor,
+                                     sampling_period_s,
+                                     lpf_harmonic_amount=10,
+                                     direct_signal=False):
+    """
+    filter_low_pass_dataevent_tensor computes the harmonic powers of
+    filter_low_pass_dataevents for all the events and features at once,
+    returning their frequencies and an events x harmonics x features
+    tensor. The tensor has no index, so sampling_period_s is read by
+    signal_processor.get_sampling_period_s from the sampled dataframe.
+    """
+    return signal_processor.filter_low_pass_np_values(
+        np_dataevent_tensor,
+        sampling_period_s=sampling_period_s,
+        lpf_harmonic_amount=lpf_harmonic_amount,
+        direct_signal=direct_signal,
+        axis=1)
+
+
 def transpose_dataevents(pd_dataevents):
-    event_feature_amount = pd_dataevents[0].columns.size
-    event_feature_range = range(1, event_feature_amount)
-    transpose_events = []
-    event_timestamps = []
-    for pd_dataevent in pd_dataevents:
-        transpose_event = pd_dataevent.T.iloc[0]
-        event_timestamp = pd_dataevent.index[0]
-        for event_feature_serial_number in event_feature_range:
-            event_feature = pd_dataevent.T.iloc[event_feature_serial_number]
-            transpose_event = pd.concat([transpose_event, event_feature],
-                                        ignore_index=True)
-        transpose_events.append(transpose_event)
-        event_timestamps.append(event_timestamp)
+    """
+    transpose_dataevents turns each event into a series chaining the
+    samples of its features, one feature after the other, and returns
+    them along with the event start timestamps.
+    """
+    event_features = pd_dataevents[0].columns
+    np_dataevent_tensor = np.stack([pd_dataevent.to_numpy()
+                                    for pd_dataevent in pd_dataevents])
+    np_dataevent_matrix = transpose_dataevent_tensor(np_dataevent_tensor)
+    if event_features.size == 1:
+        transpose_events = [pd.Series(np_transpose_event,
+                                      index=pd_dataevent.index,
+                                      name=event_features[0])
+                            for np_transpose_event, pd_dataevent
+                            in zip(np_dataevent_matrix, pd_dataevents)]
+    else:
+        transpose_events = [pd.Series(np_transpose_event)
+                            for np_transpose_event in np_dataevent_matrix]
+    event_timestamps = [pd_dataevent.index[0]
+                        for pd_dataevent in pd_dataevents]
     return transpose_events, event_timestamps
 
 
+def transpose_dataevent_tensor(np_dataevent_tensor):
+    """
+    transpose_dataevent_tensor reshapes an events x samples x features
+    tensor into a contiguous events x features*samples matrix, each row
+    chaining the samples of the features as transpose_dataevents does,
+    to be clustered and plotted as it is.
+    """
+    event_amount = np_dataevent_tensor.shape[0]
+    return np.ascontiguousarray(
+        np_dataevent_tensor.transpose(0, 2, 1)).reshape(event_amount, -1)
+
+
 def get_sampling_unit(sampling_precision):
-    available_sampling_units = ['m', 's', 'ms']
-    available_sampling_units_string = ''.join(available_sampling_units)
-    sampling_precision_value = sampling_precision.strip(
-        available_sampling_units_string)
-    numbers_string = ''.join([str(n) for n in range(10)])
-    sampling_unit = sampling_precision.strip(numbers_string)
-    if not sampling_precision_value.isdecimal():
-        sampling_unit = False
-    if sampling_unit not in available_sampling_units:
-        sampling_unit = False
+    sampling_unit = False
+    sampling_precision_match = re.fullmatch(
+        r'([0-9]+)({0})'.format('|'.join(sampling_unit_cycles)),
+        sampling_precision)
+    if sampling_precision_match:
+        sampling_unit = sampling_precision_match.group(2)
     return sampling_unit
 
 
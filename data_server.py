@@ -0,0 +1,545 @@
+#!/usr/bin/python3
+
+"""
+    System diagnostics: data server
+    Copyright (C) 2019 Francesco Melchiori
+    <https://www.francescomelchiori.com/>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see
+    <http://www.gnu.org/licenses/>.
+"""
+
+
+import sys
+import os
+import argparse
+import hashlib
+import itertools
+import json
+import random
+import re
+import threading
+import time
+import zlib
+import urllib.parse as urlparse
+import urllib.request as urlrequest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+import pandas as pd
+
+
+influx_epoch_divisors = {'ns': 1,
+                         'u': 1000,
+                         'µ': 1000,
+                         'ms': 1000000,
+                         's': 1000000000,
+                         'm': 60000000000,
+                         'h': 3600000000000}
+
+
+class InfluxServer:
+    """
+    InfluxServer answers the /query endpoint of InfluxDB 1.x on a local
+    port, so that the ingest path can run offline. A response is replayed
+    from fixture_path when a fixture of the same request was recorded,
+    proxied to upstream_ip_port and recorded when one is given, and
+    otherwise generated from the query itself: one point every
+    sampling_period, or every GROUP BY time() bucket, for each unit and
+    tag combination.
+
+    Every response is delayed by response_latency seconds plus an
+    exponential tail of mean response_latency_jitter seconds, and is gzip
+    compressed when the client accepts it. Chunked queries are streamed
+    with chunked transfer encoding, chunk_size rows per chunk.
+    """
+    def __init__(self, server_ip_port='127.0.0.1:8086', response_latency=0.,
+                 response_latency_jitter=0., sampling_period='10s',
+                 tag_value_amount=2, missing_ratio=0., fixture_path='',
+                 upstream_ip_port='', compress=True, random_seed=0):
+        self.server_ip_port = server_ip_port
+        self.response_latency = response_latency
+        self.response_latency_jitter = response_latency_jitter
+        self.sampling_period = sampling_period
+        self.tag_value_amount = tag_value_amount
+        self.missing_ratio = missing_ratio
+        self.fixture_path = fixture_path
+        self.upstream_ip_port = upstream_ip_port
+        self.compress = compress
+        self.random_generator = random.Random(random_seed)
+        self.random_generator_lock = threading.Lock()
+        self.http_server = None
+        self.server_thread = None
+        self.statistics = {'queries': 0,
+                           'fixture_hits': 0,
+                           'recorded': 0,
+                           'synthetic': 0,
+                           'sent_bytes': 0}
+        self.statistics_lock = threading.Lock()
+        if self.fixture_path:
+            os.makedirs(self.fixture_path, exist_ok=True)
+
+    def __repr__(self):
+        print_message = 'Server ip port: {0}\n'.format(self.server_ip_port)
+        print_message += 'Response latency: {0}\n'.format(
+            self.response_latency)
+        print_message += 'Response latency jitter: {0}\n'.format(
+            self.response_latency_jitter)
+        print_message += 'Sampling period: {0}\n'.format(self.sampling_period)
+        print_message += 'Fixture path: {0}\n'.format(self.fixture_path)
+        print_message += 'Upstream ip port: {0}\n'.format(
+            self.upstream_ip_port)
+        print_message += 'Statistics: {0}\n'.format(self.statistics)
+        return print_message
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def count(self, statistic_name, statistic_amount=1):
+        with self.statistics_lock:
+            self.statistics[statistic_name] += statistic_amount
+        return True
+
+    def start(self):
+        server_ip, server_port = self.server_ip_port.rsplit(':', maxsplit=1)
+        self.http_server = ThreadingHTTPServer(
+            (server_ip, int(server_port)), InfluxRequestHandler)
+        self.http_server.daemon_threads = True
+        self.http_server.influx_server = self
+        self.server_ip_port = '{0}:{1}'.format(
+            server_ip, self.http_server.server_address[1])
+        self.server_thread = threading.Thread(
+            target=self.http_server.serve_forever, daemon=True)
+        self.server_thread.start()
+        return True
+
+    def stop(self):
+        if self.http_server:
+            self.http_server.shutdown()
+            self.http_server.server_close()
+            self.http_server = None
+            self.server_thread = None
+        return True
+
+    def wait_response_latency(self):
+        response_latency = self.response_latency
+        if self.response_latency_jitter:
+            with self.random_generator_lock:
+                response_latency += self.random_generator.expovariate(
+                    1 / self.response_latency_jitter)
+        if response_latency > 0:
+            time.sleep(response_latency)
+        return True
+
+    def get_fixture_file_path(self, influx_query_parameters):
+        return os.path.join(self.fixture_path, '{0}.json'.format(
+            get_fixture_name(influx_query_parameters)))
+
+    def get_response_chunks(self, influx_query_parameters):
+        """
+        get_response_chunks returns the response body of a query as a
+        list of byte strings, a single one unless the query is chunked.
+        """
+        if self.fixture_path:
+            fixture_file_path = self.get_fixture_file_path(
+                influx_query_parameters)
+            if os.path.exists(fixture_file_path):
+                self.count('fixture_hits')
+                return load_fixture(fixture_file_path)
+            if self.upstream_ip_port:
+                response_chunks = get_upstream_response_chunks(
+                    self.upstream_ip_port, influx_query_parameters)
+                save_fixture(fixture_file_path, response_chunks)
+                self.count('recorded')
+                return response_chunks
+        self.count('synthetic')
+        influx_query = parse_influx_query(influx_query_parameters['q'])
+        influx_series = get_synthetic_series(
+            influx_query, self.sampling_period, self.tag_value_amount,
+            self.missing_ratio, influx_query_parameters.get('epoch'))
+        if influx_query_parameters.get('chunked') == 'true':
+            chunk_size = int(influx_query_parameters.get('chunk_size', 10000))
+            return get_chunked_response(influx_series, chunk_size)
+        return [get_influx_response_line(influx_series)]
+
+
+class InfluxRequestHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        influx_server = self.server.influx_server
+        influx_url = urlparse.urlparse(self.path)
+        if influx_url.path == '/ping':
+            self.send_response(204)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if influx_url.path != '/query':
+            self.send_error(404)
+            return
+        influx_query_parameters = dict(urlparse.parse_qsl(influx_url.query))
+        influx_server.count('queries')
+        influx_server.wait_response_latency()
+        try:
+            response_chunks = influx_server.get_response_chunks(
+                influx_query_parameters)
+        except (KeyError, ValueError) as query_exception:
+            response_chunks = [get_influx_error_line(query_exception)]
+            self.send_chunks(response_chunks, 400)
+            return
+        self.send_chunks(response_chunks)
+
+    def send_chunks(self, response_chunks, response_status=200):
+        influx_server = self.server.influx_server
+        response_compressed = influx_server.compress and \
+            'gzip' in self.headers.get('Accept-Encoding', '')
+        response_streamed = len(response_chunks) > 1
+        if response_compressed:
+            gzip_compressor = zlib.compressobj(wbits=31)
+            response_chunks = [gzip_compressor.compress(response_chunk) +
+                               gzip_compressor.flush(zlib.Z_SYNC_FLUSH)
+                               for response_chunk in response_chunks]
+            response_chunks.append(gzip_compressor.flush())
+        self.send_response(response_status)
+        self.send_header('Content-Type', 'application/json')
+        if response_compressed:
+            self.send_header('Content-Encoding', 'gzip')
+        if response_streamed:
+            self.send_header('Transfer-Encoding', 'chunked')
+        else:
+            self.send_header('Content-Length', str(sum(
+                len(response_chunk) for response_chunk in response_chunks)))
+        self.end_headers()
+        for response_chunk in response_chunks:
+            if response_streamed:
+                if response_chunk:
+                    self.wfile.write('{0:x}\r\n'.format(
+                        len(response_chunk)).encode())
+                    self.wfile.write(response_chunk + b'\r\n')
+            else:
+                self.wfile.write(response_chunk)
+            influx_server.count('sent_bytes', len(response_chunk))
+        if response_streamed:
+            self.wfile.write(b'0\r\n\r\n')
+
+
+def get_fixture_name(influx_query_parameters):
+    fixture_key = json.dumps(
+        [influx_query_parameters.get(parameter_name)
+         for parameter_name in ['db', 'q', 'epoch', 'chunked', 'chunk_size']])
+    return hashlib.sha1(fixture_key.encode()).hexdigest()
+
+
+def load_fixture(fixture_file_path):
+    with open(fixture_file_path, 'rb') as fixture_file:
+        return [fixture_line for fixture_line in fixture_file]
+
+
+def save_fixture(fixture_file_path, response_chunks):
+    fixture_file_tmp_path = '{0}.tmp'.format(fixture_file_path)
+    with open(fixture_file_tmp_path, 'wb') as fixture_file:
+        for response_chunk in response_chunks:
+            fixture_file.write(response_chunk)
+    os.replace(fixture_file_tmp_path, fixture_file_path)
+    return True
+
+
+def get_upstream_response_chunks(upstream_ip_port, influx_query_parameters):
+    influx_query_url = urlparse.urlencode(influx_query_parameters)
+    influx_request = 'http://{0}/query?{1}'.format(upstream_ip_port,
+                                                   influx_query_url)
+    with urlrequest.urlopen(influx_request) as influx_response:
+        return [influx_line for influx_line in influx_response
+                if influx_line.strip()]
+
+
+def record_influx_fixture(influx_ip_port, database_name, influx_query,
+                          fixture_path, influx_query_options=None):
+    """
+    record_influx_fixture saves the response of a live InfluxDB to a
+    query in fixture_path, where an InfluxServer replays it.
+    """
+    influx_query_parameters = {'q': influx_query, 'db': database_name}
+    if influx_query_options:
+        influx_query_parameters.update(
+            {option_name: str(option_value) for option_name, option_value
+             in influx_query_options.items()})
+    os.makedirs(fixture_path, exist_ok=True)
+    fixture_file_path = os.path.join(fixture_path, '{0}.json'.format(
+        get_fixture_name(influx_query_parameters)))
+    response_chunks = get_upstream_response_chunks(influx_ip_port,
+                                                   influx_query_parameters)
+    save_fixture(fixture_file_path, response_chunks)
+    return fixture_file_path
+
+
+def parse_influx_query(influx_query):
+    """
+    parse_influx_query reads back the parts of a query built by
+    data_manager.get_influx_query: units, measurement, time bounds,
+    host and tag rules, grouping, fill, order and time zone.
+    """
+    influx_query_select = re.match(r'SELECT (.*?) FROM ', influx_query)
+    if not influx_query_select:
+        raise ValueError('error parsing query: {0}'.format(influx_query))
+    unit_names = [unit_alias if unit_alias else unit_name
+                  for unit_name, unit_alias in re.findall(
+                      r'"([^"]+)"\)?(?: AS "([^"]+)")?',
+                      influx_query_select.group(1))]
+    measurement_name = re.search(r' FROM "?([^" ]+)"?',
+                                 influx_query).group(1)
+    time_zone_match = re.search(r"tz\('([^']+)'\)", influx_query)
+    time_zone = time_zone_match.group(1) if time_zone_match else 'UTC'
+    time_from_match = re.search(r"time > '([^']+)'", influx_query)
+    time_to_match = re.search(r"time < '([^']+)'", influx_query)
+    if not time_from_match or not time_to_match:
+        raise ValueError('error parsing query: {0}'.format(influx_query))
+    time_from = time_from_match.group(1)
+    time_to = time_to_match.group(1)
+    tag_values = {}
+    for tag_name, tag_value in re.findall(r"\"?(\w+)\"? = '([^']*)'",
+                                          influx_query):
+        tag_values.setdefault(tag_name, [])
+        if tag_value not in tag_values[tag_name]:
+            tag_values[tag_name].append(tag_value)
+    host_names = tag_values.pop('host', [''])
+    group_by_match = re.search(r' GROUP BY (.*?)(?: fill\(| ORDER BY|$)',
+                               influx_query)
+    group_by_period = None
+    group_by_tags = []
+    if group_by_match:
+        group_by_period_match = re.search(r'time\(([^)]+)\)',
+                                          group_by_match.group(1))
+        if group_by_period_match:
+            group_by_period = group_by_period_match.group(1)
+        group_by_tags = re.findall(r'"([^"]+)"', group_by_match.group(1))
+    fill_match = re.search(r' fill\((\w+)\)', influx_query)
+    parsed_query = {'unit_names': unit_names,
+                    'measurement_name': measurement_name,
+                    'host_name': host_names[0],
+                    'time_from': get_query_timestamp(time_from, time_zone),
+                    'time_to': get_query_timestamp(time_to, time_zone),
+                    'time_zone': time_zone,
+                    'tag_values': tag_values,
+                    'group_by_period': group_by_period,
+                    'group_by_tags': group_by_tags,
+                    'fill': fill_match.group(1) if fill_match else 'null',
+                    'descending': 'ORDER BY time DESC' in influx_query}
+    return parsed_query
+
+
+def get_query_timestamp(query_time, time_zone):
+    pd_timestamp = pd.Timestamp(query_time)
+    if pd_timestamp.tzinfo is None:
+        pd_timestamp = pd_timestamp.tz_localize(time_zone)
+    return pd_timestamp.tz_convert('UTC')
+
+
+def get_synthetic_series(influx_query, sampling_period='10s',
+                         tag_value_amount=2, missing_ratio=0., epoch=None):
+    """
+    get_synthetic_series generates the series answering a parsed query,
+    a daily sinusoid plus noise seeded by host, measurement, unit and
+    tags. The noise and the missing points are hashed from the series
+    seed and the timestamp, so that a series gets the same values at the
+    same timestamps whatever the window of the query.
+    """
+    time_from = influx_query['time_from']
+    time_to = influx_query['time_to']
+    if influx_query['group_by_period']:
+        series_period = pd.Timedelta(influx_query['group_by_period'])
+        pd_index = pd.date_range(
+            (time_from + pd.Timedelta(1, 'ns')).floor(series_period),
+            time_to, freq=series_period)
+        pd_index = pd_index[pd_index < time_to]
+    else:
+        series_period = pd.Timedelta(sampling_period)
+        pd_index = pd.date_range(time_from.ceil(series_period), time_to,
+                                 freq=series_period)
+        pd_index = pd_index[(pd_index > time_from) & (pd_index < time_to)]
+    if influx_query['descending']:
+        pd_index = pd_index[::-1]
+    np_seconds = pd_index.asi8 / 1e9
+    group_by_tag_values = []
+    for group_by_tag in influx_query['group_by_tags']:
+        tag_values = influx_query['tag_values'].get(group_by_tag)
+        if not tag_values:
+            tag_values = ['{0}{1}'.format(group_by_tag, tag_value_number)
+                          for tag_value_number in range(tag_value_amount)]
+        group_by_tag_values.append(tag_values)
+    influx_timestamps = get_influx_timestamps(pd_index,
+                                              influx_query['time_zone'],
+                                              epoch)
+    influx_series = []
+    for series_tag_values in itertools.product(*group_by_tag_values):
+        series_tags = dict(zip(influx_query['group_by_tags'],
+                               series_tag_values))
+        series_filter_values = {
+            tag_name: tag_values[0] if len(tag_values) == 1 else tag_values
+            for tag_name, tag_values in influx_query['tag_values'].items()}
+        series_filter_values.update(series_tags)
+        series_values = []
+        for unit_name in influx_query['unit_names']:
+            series_seed = zlib.crc32(json.dumps(
+                [influx_query['host_name'], influx_query['measurement_name'],
+                 unit_name, sorted(series_filter_values.items())]).encode())
+            random_state = np.random.RandomState(series_seed)
+            np_values = 50 + 25 * np.sin(
+                2 * np.pi * (np_seconds / 86400 + random_state.uniform()))
+            np_values += 5 * get_timestamp_normals(series_seed,
+                                                   pd_index.asi8)
+            np_values = np.round(np_values, 3).astype('object')
+            if missing_ratio and influx_query['fill'] in ['null', 'none']:
+                np_values[get_timestamp_uniforms(
+                    series_seed, pd_index.asi8, 2) < missing_ratio] = None
+            series_values.append(np_values)
+        influx_series_item = {'name': influx_query['measurement_name'],
+                              'columns': ['time'] +
+                              influx_query['unit_names'],
+                              'values': [list(influx_row) for influx_row
+                                         in zip(influx_timestamps,
+                                                *series_values)
+                                         if any(influx_value is not None
+                                                for influx_value
+                                                in influx_row[1:])]}
+        if series_tags:
+            influx_series_item['tags'] = series_tags
+        if influx_series_item['values']:
+            influx_series.append(influx_series_item)
+    return influx_series
+
+
+def get_timestamp_uniforms(series_seed, np_timestamps, stream_number=0):
+    """
+    get_timestamp_uniforms hashes each timestamp with the series seed
+    and stream_number by splitmix64 into a uniform number in [0, 1).
+    """
+    with np.errstate(over='ignore'):
+        np_hashes = np_timestamps.astype(np.int64).view(np.uint64) ^ \
+            np.uint64((series_seed << 8) + stream_number)
+        np_hashes = np_hashes * np.uint64(0x9E3779B97F4A7C15)
+        np_hashes ^= np_hashes >> np.uint64(30)
+        np_hashes *= np.uint64(0xBF58476D1CE4E5B9)
+        np_hashes ^= np_hashes >> np.uint64(27)
+        np_hashes *= np.uint64(0x94D049BB133111EB)
+        np_hashes ^= np_hashes >> np.uint64(31)
+    return (np_hashes >> np.uint64(11)) * 2. ** -53
+
+
+def get_timestamp_normals(series_seed, np_timestamps):
+    np_uniforms = get_timestamp_uniforms(series_seed, np_timestamps, 0)
+    np_angles = get_timestamp_uniforms(series_seed, np_timestamps, 1)
+    return np.sqrt(-2 * np.log1p(-np_uniforms)) * \
+        np.cos(2 * np.pi * np_angles)
+
+
+def get_influx_timestamps(pd_index, time_zone='UTC', epoch=None):
+    if epoch:
+        return (pd_index.asi8 // influx_epoch_divisors[epoch]).tolist()
+    if time_zone == 'UTC':
+        return pd_index.strftime('%Y-%m-%dT%H:%M:%SZ').tolist()
+    influx_timestamps = pd_index.tz_convert(time_zone).strftime(
+        '%Y-%m-%dT%H:%M:%S%z').tolist()
+    return ['{0}:{1}'.format(influx_timestamp[:-2], influx_timestamp[-2:])
+            for influx_timestamp in influx_timestamps]
+
+
+def get_influx_response_line(influx_series, partial=False):
+    influx_result = {'statement_id': 0}
+    if influx_series:
+        influx_result['series'] = influx_series
+    if partial:
+        influx_result['partial'] = True
+    return '{0}\n'.format(json.dumps({'results': [influx_result]})).encode()
+
+
+def get_influx_error_line(query_exception):
+    influx_error = 'error parsing query: {0}'.format(query_exception)
+    return '{0}\n'.format(json.dumps({'error': influx_error})).encode()
+
+
+def get_chunked_response(influx_series, chunk_size=10000):
+    """
+    get_chunked_response splits the series in responses of chunk_size
+    rows at most, flagged as partial as InfluxDB does, one per line.
+    """
+    influx_series_chunks = []
+    for influx_series_item in influx_series:
+        influx_values = influx_series_item['values']
+        for chunk_start in range(0, len(influx_values), chunk_size):
+            influx_series_chunk = dict(influx_series_item)
+            influx_series_chunk['values'] = \
+                influx_values[chunk_start:chunk_start + chunk_size]
+            if chunk_start + chunk_size < len(influx_values):
+                influx_series_chunk['partial'] = True
+            influx_series_chunks.append(influx_series_chunk)
+    if not influx_series_chunks:
+        return [get_influx_response_line([])]
+    return [get_influx_response_line(
+        [influx_series_chunk],
+        partial=chunk_number < len(influx_series_chunks) - 1)
+        for chunk_number, influx_series_chunk
+        in enumerate(influx_series_chunks)]
+
+
+def main():
+    cli_args = sys.argv[1:]
+    server_ip_port = '127.0.0.1:8086'
+    if cli_args:
+        parser = argparse.ArgumentParser()
+        parser.add_argument('-i', '--ip_port',
+                            help='set the ip port to listen on')
+        parser.add_argument('-l', '--response_latency',
+                            help='set the seconds each response is delayed')
+        parser.add_argument('-j', '--response_latency_jitter',
+                            help='set the mean seconds of the latency tail')
+        parser.add_argument('-s', '--sampling_period',
+                            help='set the period of the synthetic points')
+        parser.add_argument('-f', '--fixture_path',
+                            help='set the folder of the recorded responses')
+        parser.add_argument('-u', '--upstream_ip_port',
+                            help='record the responses of this influxdb')
+        args = parser.parse_args()
+        server_ip_port = args.ip_port if args.ip_port else server_ip_port
+        influx_server = InfluxServer(
+            server_ip_port,
+            float(args.response_latency) if args.response_latency else 0.,
+            float(args.response_latency_jitter)
+            if args.response_latency_jitter else 0.,
+            args.sampling_period if args.sampling_period else '10s',
+            fixture_path=args.fixture_path if args.fixture_path else '',
+            upstream_ip_port=args.upstream_ip_port
+            if args.upstream_ip_port else '')
+    else:
+        influx_server = InfluxServer(server_ip_port)
+    influx_server.start()
+    print('Data server | influx stand-in on {0}'.format(
+        influx_server.server_ip_port))
+    try:
+        influx_server.server_thread.join()
+    except KeyboardInterrupt:
+        influx_server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,284 @@
+#!/usr/bin/python3
+
+"""
+    System diagnostics: data streamer
+    Copyright (C) 2019 Francesco Melchiori
+    <https://www.francescomelchiori.com/>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see
+    <http://www.gnu.org/licenses/>.
+"""
+
+
+import sys
+import heapq
+import argparse
+import threading
+
+import numpy as np
+import pandas as pd
+
+
+class StreamingPreprocessor:
+    """
+    StreamingPreprocessor aligns and standardizes series point by point
+    as they arrive, instead of over a whole time range. The points of
+    each series wait in a heap until the watermark, the latest
+    timestamp pushed minus watermark_delay, passes the next point of
+    the sampling_period grid. Each grid sample then takes the last value
+    of each series at or before it, as the batch resampling pads, and
+    updates the running mean and variance of the series with Welford's
+    algorithm.
+
+    The emitted samples are standardized by the statistics of the
+    samples emitted so far, the series leading NaN until their first
+    point, so the early samples of a stream are standardized over fewer
+    samples than a batch run would. Points pushed behind an already
+    emitted grid sample are counted as late, still updating the values
+    of the following samples when newer than the last one taken. Those
+    not newer, as the points pushed again by overlapping fetches, are
+    dropped.
+    """
+    def __init__(self, sampling_period='10s', watermark_delay='0s',
+                 standardize=True, series_names=None):
+        self.sampling_period = sampling_period
+        self.sampling_period_ns = pd.to_timedelta(sampling_period).value
+        self.watermark_delay = watermark_delay
+        self.watermark_delay_ns = pd.to_timedelta(watermark_delay).value
+        self.standardize = standardize
+        self.series_names = []
+        self.series_indexes = {}
+        self.series_heaps = []
+        self.series_pending_timestamps = []
+        self.series_values = np.empty(0)
+        self.series_timestamps = np.empty(0, dtype=np.int64)
+        self.series_counts = np.empty(0, dtype=np.int64)
+        self.series_means = np.empty(0)
+        self.series_m2s = np.empty(0)
+        self.timestamp_maximum = None
+        self.grid_timestamp = None
+        self.statistics = {'points': 0,
+                           'late_points': 0,
+                           'dropped_points': 0,
+                           'samples': 0}
+        self.stream_lock = threading.Lock()
+        if series_names:
+            for series_name in series_names:
+                self.add_series(series_name)
+
+    def __repr__(self):
+        print_message = 'Sampling period: {0}\n'.format(self.sampling_period)
+        print_message += 'Watermark delay: {0}\n'.format(
+            self.watermark_delay)
+        print_message += 'Series: {0}\n'.format(len(self.series_names))
+        print_message += 'Watermark: {0}\n'.format(self.get_watermark())
+        print_message += 'Statistics: {0}\n'.format(self.statistics)
+        return print_message
+
+    def add_series(self, series_name):
+        if series_name in self.series_indexes:
+            return self.series_indexes[series_name]
+        series_index = len(self.series_names)
+        self.series_names.append(series_name)
+        self.series_indexes[series_name] = series_index
+        self.series_heaps.append([])
+        self.series_pending_timestamps.append(set())
+        self.series_values = np.append(self.series_values, np.nan)
+        self.series_timestamps = np.append(self.series_timestamps,
+                                           np.iinfo(np.int64).min)
+        self.series_counts = np.append(self.series_counts, 0)
+        self.series_means = np.append(self.series_means, 0.)
+        self.series_m2s = np.append(self.series_m2s, 0.)
+        return series_index
+
+    def get_watermark(self):
+        if self.timestamp_maximum is None:
+            return None
+        return pd.Timestamp(self.timestamp_maximum - self.watermark_delay_ns,
+                            tz='UTC')
+
+    def push(self, series_name, timestamp, value):
+        """
+        push adds the value of series_name at timestamp, a timestamp or
+        nanoseconds since the epoch, to the stream.
+        """
+        with self.stream_lock:
+            self.push_point(self.add_series(series_name),
+                            pd.Timestamp(timestamp).value, value)
+        return True
+
+    def push_point(self, series_index, timestamp_ns, value):
+        if value != value:
+            return False
+        if timestamp_ns <= self.series_timestamps[series_index] or \
+                timestamp_ns in self.series_pending_timestamps[series_index]:
+            self.statistics['dropped_points'] += 1
+            return False
+        self.series_pending_timestamps[series_index].add(timestamp_ns)
+        self.statistics['points'] += 1
+        if self.grid_timestamp is not None and timestamp_ns <= \
+                self.grid_timestamp - self.sampling_period_ns:
+            self.statistics['late_points'] += 1
+        heapq.heappush(self.series_heaps[series_index],
+                       (timestamp_ns, float(value)))
+        if self.timestamp_maximum is None or \
+                timestamp_ns > self.timestamp_maximum:
+            self.timestamp_maximum = timestamp_ns
+        return True
+
+    def push_pd_dataframe(self, pd_dataframe):
+        """
+        push_pd_dataframe adds the points of each series of
+        pd_dataframe, in any time order, to the stream.
+        """
+        with self.stream_lock:
+            np_timestamps = pd_dataframe.index.asi8
+            np_order = np.argsort(np_timestamps, kind='stable')
+            np_timestamps = np_timestamps[np_order].tolist()
+            for series_name in pd_dataframe.columns:
+                series_index = self.add_series(series_name)
+                np_values = pd_dataframe[series_name].to_numpy(
+                    dtype=float)[np_order].tolist()
+                for timestamp_ns, value in zip(np_timestamps, np_values):
+                    self.push_point(series_index, timestamp_ns, value)
+        return True
+
+    def emit(self):
+        """
+        emit returns the dataframe of the grid samples the watermark
+        has passed since the last call, empty when none has.
+        """
+        with self.stream_lock:
+            if self.timestamp_maximum is None:
+                return pd.DataFrame(columns=list(self.series_names))
+            watermark_ns = self.timestamp_maximum - self.watermark_delay_ns
+            if self.grid_timestamp is None:
+                timestamp_minimum = min(series_heap[0][0]
+                                        for series_heap in self.series_heaps
+                                        if series_heap)
+                self.grid_timestamp = timestamp_minimum - \
+                    timestamp_minimum % self.sampling_period_ns
+            sample_amount = 0
+            if watermark_ns >= self.grid_timestamp:
+                sample_amount = (watermark_ns - self.grid_timestamp) // \
+                    self.sampling_period_ns + 1
+            np_samples = np.empty((sample_amount, len(self.series_names)))
+            pd_utc_index = pd.date_range(
+                pd.Timestamp(self.grid_timestamp, tz='UTC'),
+                periods=sample_amount,
+                freq=pd.Timedelta(self.sampling_period_ns))
+            for sample_number in range(sample_amount):
+                self.take_sample(self.grid_timestamp)
+                np_samples[sample_number] = self.get_sample()
+                self.grid_timestamp += self.sampling_period_ns
+            self.statistics['samples'] += sample_amount
+            return pd.DataFrame(np_samples, index=pd_utc_index,
+                                columns=list(self.series_names))
+
+    def take_sample(self, grid_timestamp):
+        for series_index, series_heap in enumerate(self.series_heaps):
+            while series_heap and series_heap[0][0] <= grid_timestamp:
+                timestamp_ns, value = heapq.heappop(series_heap)
+                self.series_pending_timestamps[series_index].discard(
+                    timestamp_ns)
+                if timestamp_ns >= self.series_timestamps[series_index]:
+                    self.series_timestamps[series_index] = timestamp_ns
+                    self.series_values[series_index] = value
+        np_valid_mask = ~np.isnan(self.series_values)
+        self.series_counts += np_valid_mask
+        np_deltas = np.where(np_valid_mask,
+                             self.series_values - self.series_means, 0.)
+        self.series_means += np_deltas / np.maximum(self.series_counts, 1)
+        self.series_m2s += np_deltas * np.where(
+            np_valid_mask, self.series_values - self.series_means, 0.)
+        return True
+
+    def get_sample(self):
+        if not self.standardize:
+            return self.series_values
+        np_stds = np.sqrt(self.series_m2s /
+                          np.maximum(self.series_counts - 1, 1))
+        np_stds[np_stds == 0] = 1.
+        return (self.series_values - self.series_means) / np_stds
+
+    def get_series_statistics(self):
+        """
+        get_series_statistics returns the samples, mean and standard
+        deviation of each series so far.
+        """
+        with self.stream_lock:
+            np_stds = np.sqrt(self.series_m2s /
+                              np.maximum(self.series_counts - 1, 1))
+            return pd.DataFrame({'count': self.series_counts,
+                                 'mean': self.series_means,
+                                 'std': np_stds},
+                                index=list(self.series_names))
+
+
+def main():
+    cli_args = sys.argv[1:]
+    sampling_period = '10s'
+    watermark_delay = '30s'
+    series_amount = 4
+    point_amount = 360
+    chunk_amount = 6
+    if cli_args:
+        parser = argparse.ArgumentParser()
+        parser.add_argument('-s', '--sampling_period',
+                            help='set the period of the emitted grid')
+        parser.add_argument('-d', '--watermark_delay',
+                            help='set the lateness allowed to the points')
+        parser.add_argument('-n', '--series_amount',
+                            help='set the amount of synthetic series')
+        parser.add_argument('-r', '--point_amount',
+                            help='set the points of each synthetic series')
+        parser.add_argument('-c', '--chunk_amount',
+                            help='set the chunks the points arrive in')
+        args = parser.parse_args()
+        sampling_period = args.sampling_period if args.sampling_period \
+            else sampling_period
+        watermark_delay = args.watermark_delay if args.watermark_delay \
+            else watermark_delay
+        series_amount = int(args.series_amount) if args.series_amount \
+            else series_amount
+        point_amount = int(args.point_amount) if args.point_amount \
+            else point_amount
+        chunk_amount = int(args.chunk_amount) if args.chunk_amount \
+            else chunk_amount
+    random_state = np.random.RandomState(0)
+    pd_utc_index = pd.date_range('2019-01-29 08:00:00', periods=point_amount,
+                                 freq=sampling_period, tz='UTC')
+    pd_utc_index += pd.to_timedelta(sampling_period) * random_state.uniform(
+        0.1, 0.9, point_amount)
+    pd_dataframe = pd.DataFrame(
+        np.cumsum(random_state.normal(0, 1, (point_amount, series_amount)),
+                  axis=0),
+        index=pd_utc_index,
+        columns=['stream_series_{0}'.format(series_number)
+                 for series_number in range(series_amount)])
+    streaming_preprocessor = StreamingPreprocessor(sampling_period,
+                                                   watermark_delay)
+    for pd_chunk_dataframe in np.array_split(pd_dataframe, chunk_amount):
+        streaming_preprocessor.push_pd_dataframe(pd_chunk_dataframe[::-1])
+        pd_sample_dataframe = streaming_preprocessor.emit()
+        print('Data streamer | {0} samples up to {1}'.format(
+            pd_sample_dataframe.index.size,
+            streaming_preprocessor.get_watermark()))
+    print(pd_sample_dataframe.tail())
+    print(streaming_preprocessor)
+    print(streaming_preprocessor.get_series_statistics())
+
+
+if __name__ == '__main__':
+    main()
@@ -25,23 +25,75 @@ import numpy as np
 from numpy.random import standard_normal
 from scipy.interpolate import interp1d
 from scipy.optimize import curve_fit
-from scipy.fftpack import fft, fftfreq, fftshift, ifft
+import scipy.fft
+from scipy.fft import fftfreq, fftshift, next_fast_len
 from scipy.signal import spectrogram, welch, cwt, ricker
 import matplotlib.pyplot as plt
 import pandas as pd
 from pandas.plotting import register_matplotlib_converters
+try:
+    import pyfftw
+    import pyfftw.interfaces.scipy_fft
+except ImportError:
+    pyfftw = None
 
 plt.style.use('seaborn-dark')
 register_matplotlib_converters()
 
+fft_backend_options = {'workers': -1,
+                       'fast_length': False,
+                       'use_pyfftw': pyfftw is not None}
+if pyfftw:
+    pyfftw.interfaces.cache.enable()
+    pyfftw.interfaces.cache.set_keepalive_time(60)
+
+
+def set_fft_backend(workers=-1, fast_length=False, use_pyfftw=True):
+    """
+    set_fft_backend sets the workers of the FFTs, all the cores when
+    -1, whether the batched FFTs zero pad the series to a fast length
+    and whether pyFFTW, when installed, computes them instead of
+    scipy.fft. Both backends reuse the plans of same length FFTs.
+    """
+    fft_backend_options['workers'] = workers
+    fft_backend_options['fast_length'] = fast_length
+    fft_backend_options['use_pyfftw'] = use_pyfftw and pyfftw is not None
+    return True
+
+
+def get_fft_backend():
+    if fft_backend_options['use_pyfftw']:
+        return pyfftw.interfaces.scipy_fft
+    return scipy.fft
+
+
+def fft(measures_time, n=None, axis=-1):
+    return get_fft_backend().fft(measures_time, n=n, axis=axis,
+                                 workers=fft_backend_options['workers'])
+
+
+def ifft(measures_freq, n=None, axis=-1):
+    return get_fft_backend().ifft(measures_freq, n=n, axis=axis,
+                                  workers=fft_backend_options['workers'])
+
+
+def rfft(measures_time, n=None, axis=-1):
+    return get_fft_backend().rfft(measures_time, n=n, axis=axis,
+                                  workers=fft_backend_options['workers'])
+
+
+def get_sampling_period_s(pd_index):
+    sampling_period_s = 1
+    pd_index_sampling_unit = pd_index.freq.name
+    if pd_index_sampling_unit == 'S':
+        sampling_period_s = pd_index.freq.n
+    return sampling_period_s
+
 
 def filter_low_pass(pd_series,
                     lpf_harmonic_amount=10,
                     lpf_cutoff_frequency=0.1):
-    sampling_period_s = 1
-    pd_series_sampling_unit = pd_series.index.freq.name
-    if pd_series_sampling_unit == 'S':
-        sampling_period_s = pd_series.index.freq.n
+    sampling_period_s = get_sampling_period_s(pd_series.index)
     measures_time = pd_series.values
     sampling_points = measures_time.size
     measures_freq = fft(measures_time)
@@ -86,6 +138,74 @@ def filter_low_pass_pd_series(pd_series,
     return pd_series_lpf
 
 
+def get_low_pass_half_frequencies_mask(sampling_points,
+                                       sampling_period_s=1,
+                                       lpf_harmonic_amount=10,
+                                       lpf_cutoff_frequency=0.1,
+                                       direct_signal=False,
+                                       fft_points=None):
+    """
+    get_low_pass_half_frequencies_mask returns the frequencies of
+    sampling_points samples and the mask of those kept by
+    filter_low_pass_pd_series: passed by the low pass filter, in the
+    first half of the spectrum and, unless direct_signal, not the
+    direct signal. Given the fft_points of zero padded samples, the
+    frequencies are those of the padded FFT, cut off at the same
+    frequency.
+    """
+    measures_frequencies = fftfreq(sampling_points, d=sampling_period_s)
+    if lpf_harmonic_amount:
+        lpf_cutoff_frequency = measures_frequencies[lpf_harmonic_amount]
+    if fft_points:
+        measures_frequencies = fftfreq(fft_points, d=sampling_period_s)
+    passed_half_frequencies_mask = np.abs(measures_frequencies) <= \
+        lpf_cutoff_frequency
+    if not direct_signal:
+        passed_half_frequencies_mask[0] = False
+    passed_half_frequencies_mask[int(measures_frequencies.size/2):] = False
+    return measures_frequencies, passed_half_frequencies_mask
+
+
+def filter_low_pass_np_values(np_values,
+                              sampling_period_s=1,
+                              lpf_harmonic_amount=10,
+                              direct_signal=False,
+                              axis=1):
+    """
+    filter_low_pass_np_values computes, with a single real FFT along
+    axis, the power of the harmonics filter_low_pass_pd_series keeps
+    for every series of np_values, returning their frequencies and the
+    powers, the harmonics replacing the samples along axis. With the
+    fast_length backend option the series are zero padded to the next
+    fast FFT length, trading a finer and larger set of harmonics for
+    speed on lengths with large prime factors.
+    """
+    sampling_points = np_values.shape[axis]
+    fft_points = sampling_points
+    if fft_backend_options['fast_length']:
+        fft_points = next_fast_len(sampling_points, real=True)
+    measures_frequencies, passed_half_frequencies_mask = \
+        get_low_pass_half_frequencies_mask(
+            sampling_points,
+            sampling_period_s=sampling_period_s,
+            lpf_harmonic_amount=lpf_harmonic_amount,
+            direct_signal=direct_signal,
+            fft_points=fft_points)
+    passed_half_frequency_indexes = np.flatnonzero(
+        passed_half_frequencies_mask)
+    passed_half_frequencies = \
+        measures_frequencies[passed_half_frequency_indexes]
+    if not passed_half_frequency_indexes.size:
+        half_measures_power_shape = list(np_values.shape)
+        half_measures_power_shape[axis] = 0
+        return passed_half_frequencies, np.empty(half_measures_power_shape)
+    measures_freq = rfft(np_values, n=fft_points, axis=axis)
+    measures_freq = np.take(
+        measures_freq, passed_half_frequency_indexes, axis=axis)
+    half_measures_power = np.abs(measures_freq)
+    return passed_half_frequencies, half_measures_power
+
+
 def filter_low_pass_pd_dataframe(pd_dataframe,
                                  lpf_harmonic_amount=10,
                                  direct_signal=False):
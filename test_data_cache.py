@@ -0,0 +1,61 @@
+"""
+    System diagnostics: data cache tests
+    Copyright (C) 2019 Francesco Melchiori
+    <https://www.francescomelchiori.com/>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see
+    <http://www.gnu.org/licenses/>.
+"""
+
+
+import os
+
+import numpy as np
+import pandas as pd
+
+import data_cache
+
+
+def get_test_dataframe(series_name, point_amount=100):
+    pd_utc_index = pd.date_range('2019-01-29 08:00:00',
+                                 periods=point_amount, freq='10s', tz='UTC')
+    return pd.DataFrame({series_name: np.arange(point_amount, dtype=float)},
+                        index=pd_utc_index)
+
+
+def test_evict_entries_removed_meanwhile(tmp_path, monkeypatch):
+    measurement_cache = data_cache.MeasurementCache(str(tmp_path))
+    for entry_name in ['host01', 'host02', 'host03']:
+        measurement_cache.save_entry(entry_name,
+                                     [get_test_dataframe(entry_name)])
+    entry_names = measurement_cache.get_entry_names()
+    measurement_cache.remove_entry('host02')
+    monkeypatch.setattr(measurement_cache, 'get_entry_names',
+                        lambda: entry_names)
+    measurement_cache.byte_budget = measurement_cache.get_entry_size(
+        'host03')
+    measurement_cache.evict_entries('host03')
+    assert measurement_cache.has_entry('host03')
+    assert not measurement_cache.has_entry('host01')
+    assert measurement_cache.statistics['evictions'] == 1
+
+
+def test_save_entry_leaves_no_temporary_files(tmp_path):
+    measurement_cache = data_cache.MeasurementCache(str(tmp_path))
+    measurement_cache.save_entry('host01', [get_test_dataframe('host01')])
+    measurement_cache.save_entry('host01', [get_test_dataframe('host01')])
+    entry_file_names = os.listdir(measurement_cache.get_entry_path('host01'))
+    assert 'index.json' in entry_file_names
+    assert not [entry_file_name for entry_file_name in entry_file_names
+                if entry_file_name.endswith('.tmp')]
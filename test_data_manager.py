@@ -0,0 +1,251 @@
+"""
+    System diagnostics: data manager tests
+    Copyright (C) 2019 Francesco Melchiori
+    <https://www.francescomelchiori.com/>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see
+    <http://www.gnu.org/licenses/>.
+"""
+
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_client
+import data_manager
+
+
+mixed_tag_measurements = [
+    {'measurement_name': 'cpu',
+     'units': ['usage_user', 'usage_system'],
+     'filters': [{'filter_name': 'cpu',
+                  'filter_values': ['cpu0', 'cpu1']},
+                 {'filter_name': 'mode',
+                  'filter_values': ['user']},
+                 {'filter_name': 'cpu',
+                  'filter_values': ['cpu2'],
+                  'filters': [{'filter_name': 'mode',
+                               'filter_values': ['idle', 'user']}]}]},
+    {'measurement_name': 'mem',
+     'units': ['used', 'free']}]
+
+
+def test_empty_missing_series_dataframe():
+    pd_dataframe = data_manager.get_measurement_pd_dataframe(
+        np.empty(0, dtype='int64'), np.empty(0), 'cpu', 'usage_user', [],
+        missing_series=True)
+    assert pd_dataframe.empty
+    assert list(pd_dataframe.columns) == ['cpu_usage_user']
+
+
+def test_datetimes_across_dst_change():
+    influx_data = [['2019-03-31T01:30:00+01:00', 1.],
+                   ['2019-03-31T03:30:00+02:00', 2.]]
+    np_influx_data = data_manager.set_to_numpy_datetimes(influx_data,
+                                                         'Europe/Rome')
+    assert [influx_data_row[0] for influx_data_row in np_influx_data] == [
+        np.datetime64('2019-03-31T01:30:00.000'),
+        np.datetime64('2019-03-31T03:30:00.000')]
+    pd_influx_data = data_manager.set_to_pandas_datetimes(influx_data,
+                                                          'Europe/Rome')
+    assert [influx_data_row[0] for influx_data_row in pd_influx_data] == [
+        pd.Timestamp('2019-03-31 01:30:00', tz='Europe/Rome'),
+        pd.Timestamp('2019-03-31 03:30:00', tz='Europe/Rome')]
+    assert all(isinstance(influx_data_row[0], pd.Timestamp)
+               for influx_data_row in pd_influx_data)
+    assert [influx_data_row[1] for influx_data_row in pd_influx_data] == \
+        [1., 2.]
+    assert influx_data[0][0] == '2019-03-31T01:30:00+01:00'
+
+
+def test_utc_datetimes_keep_their_wall_clock():
+    influx_data = [['2019-01-29T08:00:00Z', 1.],
+                   ['2019-01-29T08:00:10Z', 2.]]
+    np_influx_data = data_manager.set_to_numpy_datetimes(influx_data, 'UTC')
+    assert [influx_data_row[0] for influx_data_row in np_influx_data] == [
+        np.datetime64('2019-01-29T08:00:00.000'),
+        np.datetime64('2019-01-29T08:00:10.000')]
+
+
+def test_incremental_measurements_empty_missing_interval(
+        get_host_diagnostics):
+    get_host_diagnostics(time_to='2019-01-29 10:00:05',
+                         incremental_data=True)
+    host_diagnostics = get_host_diagnostics(time_to='2019-01-29 10:00:15',
+                                            incremental_data=True)
+    full_host_diagnostics = get_host_diagnostics(
+        time_to='2019-01-29 10:00:15', cache_name='full_cache')
+    assert len(host_diagnostics.measure_pd_dataframes) == \
+        len(full_host_diagnostics.measure_pd_dataframes)
+    for pd_dataframe, full_pd_dataframe in zip(
+            host_diagnostics.measure_pd_dataframes,
+            full_host_diagnostics.measure_pd_dataframes):
+        pd.testing.assert_frame_equal(pd_dataframe.sort_index(),
+                                      full_pd_dataframe.sort_index(),
+                                      check_freq=False)
+
+
+def test_incremental_measurements_whole_buckets(get_host_diagnostics,
+                                                monkeypatch):
+    query_time_ranges = []
+    query_bucket_starts = []
+    get_measurements = data_manager.CustomerHostDiagnostics.get_measurements
+
+    def get_bucket_measurements(host_diagnostics, time_range=None,
+                                missing_series=False):
+        measure_pd_dataframes = get_measurements(
+            host_diagnostics, time_range, missing_series)
+        if time_range:
+            query_time_ranges.append(time_range)
+            query_bucket_starts.append(min(
+                measure_pd_dataframe.index.min()
+                for measure_pd_dataframe in measure_pd_dataframes))
+        return measure_pd_dataframes
+
+    monkeypatch.setattr(data_manager.CustomerHostDiagnostics,
+                        'get_measurements', get_bucket_measurements)
+    get_host_diagnostics(time_to='2019-01-29 10:00:05',
+                         sampling_period='1m', incremental_data=True)
+    host_diagnostics = get_host_diagnostics(time_to='2019-01-29 10:02:30',
+                                            sampling_period='1m',
+                                            incremental_data=True)
+    assert len(query_time_ranges) == 2
+    for query_time_range in query_time_ranges:
+        query_time_from, query_time_to = [
+            pd.Timestamp(query_time) for query_time in query_time_range]
+        assert query_time_from + pd.Timedelta(1, 'ns') == \
+            (query_time_from + pd.Timedelta(1, 'ns')).floor('1min')
+        assert query_time_to == query_time_to.floor('1min')
+    assert query_time_ranges[1] == ['2019-01-29T09:00:59.999999999Z',
+                                    '2019-01-29T09:03:00.000000000Z']
+    assert query_bucket_starts[1] == pd.Timestamp('2019-01-29 09:01:00',
+                                                  tz='UTC')
+    full_host_diagnostics = get_host_diagnostics(
+        time_to='2019-01-29 10:02:30', cache_name='full_cache',
+        sampling_period='1m')
+    time_from = pd.Timestamp('2019-01-29 08:00:00', tz='Europe/Rome')
+    for pd_dataframe, full_pd_dataframe in zip(
+            host_diagnostics.measure_pd_dataframes,
+            full_host_diagnostics.measure_pd_dataframes):
+        pd.testing.assert_frame_equal(
+            pd_dataframe.sort_index(),
+            full_pd_dataframe[full_pd_dataframe.index > time_from]
+            .sort_index(),
+            check_freq=False)
+
+
+def test_stream_measurements_empty_poll(get_host_diagnostics):
+    host_diagnostics = get_host_diagnostics(time_to='2019-01-29 09:00:00')
+    pd_sample_dataframe = host_diagnostics.stream_measurements()
+    assert not pd_sample_dataframe.empty
+    pd_sample_dataframe = host_diagnostics.stream_measurements(
+        '2019-01-29 09:00:13')
+    pd_sample_dataframe = host_diagnostics.stream_measurements(
+        '2019-01-29 09:00:15')
+    assert pd_sample_dataframe.empty
+    assert host_diagnostics.stream_time_to == '2019-01-29 09:00:15'
+
+
+def test_stream_measurements_query_watermark_delay_again(
+        get_host_diagnostics):
+    host_diagnostics = get_host_diagnostics(time_to='2019-01-29 09:00:00')
+    stream_time_ranges = []
+    get_measurements = host_diagnostics.get_measurements
+
+    def get_stream_measurements(time_range=None, missing_series=False):
+        stream_time_ranges.append(time_range)
+        return get_measurements(time_range, missing_series)
+
+    host_diagnostics.get_measurements = get_stream_measurements
+    host_diagnostics.stream_measurements('2019-01-29 08:30:00', '2m')
+    host_diagnostics.stream_measurements('2019-01-29 08:40:00')
+    assert stream_time_ranges[1][0] == data_manager.get_time_range(
+        [data_manager.get_time_interval(
+            '2019-01-29 08:28:00', '2019-01-29 08:40:00')[0] - 1000,
+         0])[0]
+    streaming_preprocessor = host_diagnostics.streaming_preprocessor
+    assert streaming_preprocessor.statistics['dropped_points'] > 0
+    assert streaming_preprocessor.statistics['late_points'] == 0
+
+
+def test_stream_measurements_whole_buckets(get_host_diagnostics):
+    host_diagnostics = get_host_diagnostics(time_to='2019-01-29 09:00:00',
+                                            sampling_period='1m')
+    stream_time_ranges = []
+    get_measurements = host_diagnostics.get_measurements
+
+    def get_stream_measurements(time_range=None, missing_series=False):
+        stream_time_ranges.append(time_range)
+        return get_measurements(time_range, missing_series)
+
+    host_diagnostics.get_measurements = get_stream_measurements
+    host_diagnostics.stream_measurements('2019-01-29 08:30:30')
+    host_diagnostics.stream_measurements('2019-01-29 08:40:30')
+    assert stream_time_ranges == [
+        ['2019-01-29T06:59:59.999999999Z',
+         '2019-01-29T07:30:00.000000000Z'],
+        ['2019-01-29T07:29:59.999999999Z',
+         '2019-01-29T07:40:00.000000000Z']]
+    streaming_preprocessor = host_diagnostics.streaming_preprocessor
+    assert streaming_preprocessor.statistics['dropped_points'] == 0
+
+
+@pytest.mark.parametrize('stream_queries', [False, True])
+def test_batch_queries_match_filter_queries(get_host_diagnostics,
+                                            stream_queries):
+    host_diagnostics = get_host_diagnostics(
+        measurements=mixed_tag_measurements, stream_queries=stream_queries)
+    batch_host_diagnostics = get_host_diagnostics(
+        cache_name='batch_cache', measurements=mixed_tag_measurements,
+        batch_queries=True, stream_queries=stream_queries)
+    assert len(host_diagnostics.measure_pd_dataframes) == 12
+    assert len(batch_host_diagnostics.measure_pd_dataframes) == 12
+    for pd_dataframe, batch_pd_dataframe in zip(
+            host_diagnostics.measure_pd_dataframes,
+            batch_host_diagnostics.measure_pd_dataframes):
+        pd.testing.assert_frame_equal(pd_dataframe.sort_index(),
+                                      batch_pd_dataframe.sort_index(),
+                                      check_freq=False)
+
+
+def test_query_arguments_with_given_client(get_host_diagnostics):
+    influx_client = data_client.InfluxClient()
+    with pytest.raises(ValueError):
+        get_host_diagnostics(influx_client=influx_client, query_timeout=5)
+    influx_client.close()
+
+
+def test_concurrent_fetch_matches_serial_fetch(get_host_diagnostics):
+    host_diagnostics = get_host_diagnostics(
+        measurements=mixed_tag_measurements)
+    concurrent_host_diagnostics = get_host_diagnostics(
+        cache_name='concurrent_cache', measurements=mixed_tag_measurements,
+        fetch_workers=4)
+    assert len(concurrent_host_diagnostics.measure_pd_dataframes) == \
+        len(host_diagnostics.measure_pd_dataframes)
+    for pd_dataframe, concurrent_pd_dataframe in zip(
+            host_diagnostics.measure_pd_dataframes,
+            concurrent_host_diagnostics.measure_pd_dataframes):
+        pd.testing.assert_frame_equal(pd_dataframe, concurrent_pd_dataframe)
+
+
+def test_host_closes_only_its_own_client(get_host_diagnostics):
+    host_diagnostics = get_host_diagnostics()
+    assert not host_diagnostics.influx_client.connection_pools
+    influx_client = data_client.InfluxClient()
+    get_host_diagnostics(cache_name='shared_cache',
+                         influx_client=influx_client)
+    assert influx_client.connection_pools
+    influx_client.close()
@@ -0,0 +1,65 @@
+"""
+    System diagnostics: data sampler tests
+    Copyright (C) 2019 Francesco Melchiori
+    <https://www.francescomelchiori.com/>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see
+    <http://www.gnu.org/licenses/>.
+"""
+
+
+import numpy as np
+import pandas as pd
+
+import data_benchmark
+import data_sampler
+import signal_processor
+
+
+def test_dataevent_tensor_low_pass_matches_dataevents(get_test_dataframe):
+    pd_joined_dataframe = get_test_dataframe(point_amount=360)
+    pd_dataevents, _ = data_sampler.sample_dataevents(pd_joined_dataframe,
+                                                      '10m')
+    pd_dataevents_lpf = data_sampler.filter_low_pass_dataevents(
+        pd_dataevents)
+    np_dataevent_tensor, _, _ = data_sampler.sample_dataevent_tensor(
+        pd_joined_dataframe, '10m')
+    np_frequencies, np_dataevent_lpf_tensor = \
+        data_sampler.filter_low_pass_dataevent_tensor(
+            np_dataevent_tensor,
+            signal_processor.get_sampling_period_s(
+                pd_joined_dataframe.index))
+    assert np.allclose(np_frequencies, pd_dataevents_lpf[0].index)
+    assert np.allclose(np_dataevent_lpf_tensor,
+                       np.stack([pd_dataevent_lpf.to_numpy()
+                                 for pd_dataevent_lpf in pd_dataevents_lpf]))
+
+
+def test_align_matches_preprocessing_chain():
+    timestamp_start = '2019-01-29 08:00:00'
+    timestamp_end = '2019-01-29 09:00:00'
+    pd_dataframes = data_benchmark.get_host_test_dataframes(
+        4, '1h', '10s', timestamp_start, 'Europe/Rome')
+    pd_dataframes = data_sampler.pad_pd_dataframes(
+        pd_dataframes, timestamp_start, timestamp_end, 'Europe/Rome')
+    pd_dataframes = data_sampler.resample_pd_dataframes(pd_dataframes)
+    pd_dataframes = data_sampler.fill_pd_dataframes(pd_dataframes)
+    pd_dataframes = data_sampler.standardize_pd_dataframes(pd_dataframes)
+    pd_joined_dataframe = data_sampler.join_pd_dataframes(pd_dataframes)
+    pd_aligned_dataframe = data_sampler.align_pd_dataframes(
+        data_benchmark.get_host_test_dataframes(
+            4, '1h', '10s', timestamp_start, 'Europe/Rome'),
+        timestamp_start, timestamp_end, 'Europe/Rome')
+    pd.testing.assert_frame_equal(pd_aligned_dataframe, pd_joined_dataframe,
+                                  check_freq=False)
@@ -0,0 +1,116 @@
+"""
+    System diagnostics: data server tests
+    Copyright (C) 2019 Francesco Melchiori
+    <https://www.francescomelchiori.com/>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see
+    <http://www.gnu.org/licenses/>.
+"""
+
+
+import socket
+import urllib.error as urlerror
+import urllib.parse as urlparse
+
+import pytest
+
+import data_client
+import data_manager
+import data_server
+
+
+def get_influx_points(influx_server, time_from, time_to):
+    influx_data = data_manager.get_influx_data(
+        influx_server.server_ip_port, 'telegraf', 'host01', 'mem',
+        ['used', 'free'], time_from, time_to, [], epoch='ms')
+    return {influx_row[0]: influx_row[1:] for influx_row in influx_data}
+
+
+def test_synthetic_series_independent_of_query_window(influx_server):
+    influx_points = get_influx_points(influx_server, '2019-01-29 08:00:00',
+                                      '2019-01-29 10:00:00')
+    shifted_influx_points = get_influx_points(
+        influx_server, '2019-01-29 09:00:10', '2019-01-29 11:00:00')
+    shared_timestamps = set(influx_points) & set(shifted_influx_points)
+    assert len(shared_timestamps) > 100
+    for influx_timestamp in shared_timestamps:
+        assert influx_points[influx_timestamp] == \
+            shifted_influx_points[influx_timestamp]
+
+
+def test_keep_alive_queries_without_delayed_ack(influx_server,
+                                                monkeypatch):
+    connection_nodelays = []
+    setup_handler = data_server.InfluxRequestHandler.setup
+
+    def setup_nodelay_handler(request_handler):
+        setup_handler(request_handler)
+        connection_nodelays.append(request_handler.connection.getsockopt(
+            socket.IPPROTO_TCP, socket.TCP_NODELAY))
+
+    monkeypatch.setattr(data_server.InfluxRequestHandler, 'setup',
+                        setup_nodelay_handler)
+    influx_query = data_manager.get_influx_query(
+        'telegraf', 'host01', 'mem', ['used'], '2019-01-29 08:00:00',
+        '2019-01-29 08:10:00', [])
+    influx_request_path = '/query?{0}'.format(urlparse.urlencode(
+        {'db': 'telegraf', 'q': influx_query}))
+    influx_client = data_client.InfluxClient(pool_size=1)
+    for _ in range(20):
+        influx_client.query(influx_server.server_ip_port,
+                            influx_request_path)
+    influx_client.close()
+    assert influx_client.statistics['queries'] == 20
+    assert connection_nodelays and all(connection_nodelays)
+    assert influx_client.latency_histogram.get_percentile(50) < 0.2
+
+
+def test_query_without_time_bounds(influx_server):
+    influx_request_path = '/query?{0}'.format(urlparse.urlencode(
+        {'db': 'telegraf', 'q': 'SELECT "used" FROM "mem"'}))
+    influx_client = data_client.InfluxClient()
+    with pytest.raises(urlerror.HTTPError) as query_error:
+        influx_client.query(influx_server.server_ip_port,
+                            influx_request_path)
+    influx_client.close()
+    assert query_error.value.code == 400
+
+
+def test_stream_queries_record_latency(influx_server):
+    influx_query = data_manager.get_influx_query(
+        'telegraf', 'host01', 'mem', ['used'], '2019-01-29 08:00:00',
+        '2019-01-29 08:10:00', [])
+    influx_request_path = '/query?{0}'.format(urlparse.urlencode(
+        {'db': 'telegraf', 'q': influx_query, 'chunked': 'true'}))
+    influx_client = data_client.InfluxClient(pool_size=1)
+    with influx_client.query_stream(influx_server.server_ip_port,
+                                    influx_request_path) as influx_response:
+        assert influx_response.read()
+    influx_client.close()
+    assert influx_client.statistics['queries'] == 1
+    assert influx_client.latency_histogram.sample_amount == 1
+
+
+def test_stream_queries_retry_before_the_response():
+    closed_socket = socket.socket()
+    closed_socket.bind(('127.0.0.1', 0))
+    closed_ip_port = '127.0.0.1:{0}'.format(closed_socket.getsockname()[1])
+    closed_socket.close()
+    influx_client = data_client.InfluxClient(retry_amount=2,
+                                             retry_backoff=0.)
+    with pytest.raises(ConnectionRefusedError):
+        influx_client.query_stream(closed_ip_port, '/query')
+    influx_client.close()
+    assert influx_client.statistics['retries'] == 2
+    assert influx_client.statistics['failures'] == 1
@@ -0,0 +1,78 @@
+"""
+    System diagnostics: data streamer tests
+    Copyright (C) 2019 Francesco Melchiori
+    <https://www.francescomelchiori.com/>
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see
+    <http://www.gnu.org/licenses/>.
+"""
+
+
+import numpy as np
+import pandas as pd
+
+import data_streamer
+
+
+def stream_test_dataframe(streaming_preprocessor, pd_dataframe,
+                          chunk_amount=17):
+    pd_sample_dataframes = []
+    for pd_chunk_dataframe in np.array_split(pd_dataframe, chunk_amount):
+        streaming_preprocessor.push_pd_dataframe(pd_chunk_dataframe[::-1])
+        pd_sample_dataframes.append(streaming_preprocessor.emit())
+    return pd.concat(pd_sample_dataframes)
+
+
+def test_stream_matches_padded_grid(get_test_dataframe):
+    pd_dataframe = get_test_dataframe(timestamp_jitter=True,
+                                      missing_ratio=0.2)
+    pd_sample_dataframe = stream_test_dataframe(
+        data_streamer.StreamingPreprocessor('10s', standardize=False),
+        pd_dataframe)
+    pd_grid_index = pd_sample_dataframe.index
+    pd_padded_dataframe = pd_dataframe.reindex(
+        pd_dataframe.index.union(pd_grid_index)).ffill().reindex(
+            pd_grid_index)
+    pd.testing.assert_frame_equal(pd_sample_dataframe, pd_padded_dataframe,
+                                  check_freq=False)
+
+
+def test_stream_running_standardization(get_test_dataframe):
+    pd_dataframe = get_test_dataframe(timestamp_jitter=True,
+                                      missing_ratio=0.2)
+    streaming_preprocessor = data_streamer.StreamingPreprocessor('10s')
+    pd_sample_dataframe = stream_test_dataframe(streaming_preprocessor,
+                                                pd_dataframe)
+    pd_padded_dataframe = stream_test_dataframe(
+        data_streamer.StreamingPreprocessor('10s', standardize=False),
+        pd_dataframe)
+    pd_series_statistics = streaming_preprocessor.get_series_statistics()
+    np.testing.assert_allclose(pd_series_statistics['mean'],
+                               pd_padded_dataframe.mean())
+    np.testing.assert_allclose(pd_series_statistics['std'],
+                               pd_padded_dataframe.std())
+    np.testing.assert_allclose(
+        pd_sample_dataframe.iloc[-1],
+        ((pd_padded_dataframe - pd_padded_dataframe.mean()) /
+         pd_padded_dataframe.std()).iloc[-1])
+
+
+def test_stream_minute_grid_index(get_test_dataframe):
+    pd_dataframe = get_test_dataframe('1m', 120, timestamp_jitter=True,
+                                      missing_ratio=0.2)
+    pd_sample_dataframe = stream_test_dataframe(
+        data_streamer.StreamingPreprocessor('1m'), pd_dataframe)
+    np.testing.assert_array_equal(
+        np.diff(pd_sample_dataframe.index.asi8),
+        pd.Timedelta('1m').value)